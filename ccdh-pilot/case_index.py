@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+#
+# case_index.py - Random access to the cases in a large JSON case export.
+#
+# build_index() scans a JSON case export (such as head-and-mouth/gdc-head-and-mouth.json)
+# once, and records the byte span of every case in its top-level array, and the position
+# of the case with each case_id, in a sidecar file next to it (gdc-head-and-mouth.json.index).
+# A CaseIndex memory-maps the export and decodes only the cases that are asked for, by
+# position or by case_id, so that e.g. the case behind `case_17_diagnosis_0` can be looked
+# at without loading the whole export:
+#
+#   python ccdh-pilot/case_index.py head-and-mouth/gdc-head-and-mouth.json 17
+#
+# The sidecar records the size and modification time of the export, and is rebuilt if
+# either has changed. Compressed exports can't be memory-mapped, so they can't be indexed.
+#
+
+import argparse
+import json
+import mmap
+import os
+import sys
+
+import compression
+import sources
+
+# The suffix added to the name of an export to name its index.
+INDEX_SUFFIX = ".index"
+
+# The version of the index format, which is bumped whenever it changes.
+INDEX_VERSION = 2
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_index(path, index_path=None):
+    """
+    Index the cases in the JSON case export at `path`, write the index to `index_path`
+    (by default, the export's name plus INDEX_SUFFIX) and return it.
+    """
+    if compression.compression_for(path) is not None:
+        raise ValueError(f"Can't index compressed case export {path}")
+
+    spans = []
+    case_ids = {}
+    # Latin-1 decodes every byte into exactly one character, so offsets in characters are
+    # offsets in bytes. JSON syntax is all ASCII, so this only garbles non-ASCII strings,
+    # which we re-encode if we need them. Newlines aren't translated, so that the offsets
+    # of exports with CRLF line endings are right too.
+    with open(path, encoding="latin-1", newline="") as f:
+        for (case, start, end) in sources.iter_json_array_spans(f):
+            case_id = case.get("case_id") if isinstance(case, dict) else None
+            if isinstance(case_id, str):
+                case_ids.setdefault(
+                    case_id.encode("latin-1").decode("utf-8"), len(spans)
+                )
+            spans.append([start, end])
+
+    index = {
+        "version": INDEX_VERSION,
+        "source": _stat(path),
+        "spans": spans,
+        "case_ids": case_ids,
+    }
+    with open(index_path or path + INDEX_SUFFIX, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    return index
+
+
+def load_index(path, index_path=None):
+    """
+    Return the index of the JSON case export at `path`, building it if it doesn't exist
+    or is out of date.
+    """
+    index_path = index_path or path + INDEX_SUFFIX
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index["source"] == _stat(path):
+            return index
+    except FileNotFoundError:
+        pass
+    return build_index(path, index_path)
+
+
+class CaseIndex:
+    """
+    The cases in a JSON case export, which can be looked up by position (`index[17]`,
+    `index[10:20]`) or by case_id (`index.get(case_id)`).
+    """
+
+    def __init__(self, path, index_path=None):
+        index = load_index(path, index_path)
+        self.spans = index["spans"]
+        self.case_ids = index["case_ids"]
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._decode(span) for span in self.spans[key]]
+        return self._decode(self.spans[key])
+
+    def _decode(self, span):
+        (start, end) = span
+        return json.loads(self.data[start:end])
+
+    def position(self, case_id):
+        """Return the position of the case with the given case_id."""
+        return self.case_ids[case_id]
+
+    def get(self, case_id):
+        """Return the case with the given case_id."""
+        return self[self.position(case_id)]
+
+    def positions(self, selection):
+        """
+        Return the positions of the cases in a comma-separated selection of positions,
+        `start:stop` ranges and case_ids (e.g. "17,20:30,a203ac35-...").
+        """
+        positions = []
+        for part in selection.split(","):
+            part = part.strip()
+            if ":" in part:
+                bounds = [int(bound) if bound else None for bound in part.split(":")]
+                positions.extend(range(*slice(*bounds).indices(len(self))))
+            elif part.lstrip("-").isdigit():
+                position = int(part)
+                if not -len(self) <= position < len(self):
+                    raise ValueError(f"There is no case at position {position}")
+                positions.append(position % len(self))
+            elif part in self.case_ids:
+                positions.append(self.case_ids[part])
+            else:
+                raise ValueError(f"There is no case with case_id {part!r}")
+        return positions
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Index a JSON case export, and print cases from it."
+    )
+    parser.add_argument("input", help="JSON case export")
+    parser.add_argument(
+        "cases",
+        nargs="?",
+        help="comma-separated positions, start:stop ranges or case_ids of cases to print",
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="rebuild the index even if it is current"
+    )
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        build_index(args.input)
+    with CaseIndex(args.input) as index:
+        if args.cases is None:
+            print(f"{len(index)} cases indexed in {args.input}{INDEX_SUFFIX}")
+            return 0
+        try:
+            positions = index.positions(args.cases)
+        except ValueError as e:
+            parser.error(str(e))
+        for position in positions:
+            json.dump(index[position], sys.stdout, indent=2)
+            print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#
+# cda.py - Fetch records from the Cancer Data Aggregator (CDA) one page at a time.
+#
+# cptac2-subject-09CO022/CDA example for subject 09CO022.ipynb fetches a handful of CDA
+# records with `Q(...).run(limit=...)` and saves them. To convert larger result sets,
+# iter_query_records() runs a query page by page, yielding records as they arrive, so
+# that no more than a page of records is held in memory at a time:
+#
+#   python ccdh-pilot/convert.py cda \
+#       --cda-query 'ResearchSubject.Specimen.derived_from_subject = "09CO022"' \
+#       --out cda.yaml
+#
+# A query is anything with a cdapython-like `run(offset=..., limit=...)` method that
+# returns an iterable of records, such as a cdapython Q, or a SavedQuery, which pages
+# through saved results instead (e.g. cptac2-subject-09CO022/cda_derived_from_09CO022.json).
+#
+# Queries on nested fields return a record for every nested row that matches, so the
+# same subject can be returned many times; unique_subjects() drops the repeats, keeping
+# a small hash of every subject it has seen.
+#
+# Running live queries requires the optional `cdapython` package.
+#
+
+import hashlib
+import itertools
+
+import instrument
+import sources
+
+# How many records to fetch at a time by default.
+PAGE_SIZE = 100
+
+
+def _cdapython():
+    try:
+        import cdapython
+    except ImportError:
+        raise ImportError("Running CDA queries requires the cdapython package")
+    return cdapython
+
+
+def query(text):
+    """Return a cdapython query for a CDA query string."""
+    return _cdapython().Q(text)
+
+
+class SavedQuery:
+    """
+    Stands in for a CDA query by paging through saved results: a list of records, or a
+    JSON file containing an array of records or a single record. A file is read once
+    as its pages are requested in order, and only read again from the start if an
+    earlier page is requested.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        # The records of the file being read, and the offset of the next one.
+        self.reader = None
+        self.position = 0
+
+    def run(self, offset=0, limit=PAGE_SIZE):
+        if isinstance(self.records, list):
+            return self.records[offset : offset + limit]
+        if self.reader is None or offset < self.position:
+            self.reader = sources.read_cases(self.records)
+            self.position = 0
+        skip = offset - self.position
+        page = list(itertools.islice(self.reader, skip, skip + limit))
+        self.position = offset + len(page)
+        return page
+
+
+def iter_query_records(query, page_size=PAGE_SIZE):
+    """Yield every record a CDA query returns, fetching `page_size` records at a time."""
+    offset = 0
+    while True:
+        with instrument.timer("cda_query"):
+            result = query.run(offset=offset, limit=page_size)
+            records = list(result)
+        instrument.count("cda_pages")
+        yield from records
+
+        # cdapython results say whether there are more pages; other queries are done
+        # when they return a short page.
+        if len(records) < page_size or not getattr(result, "has_next_page", True):
+            return
+        offset += len(records)
+
+
+def subject_key(record):
+    """
+    Return the key that identifies the subject of a CDA record: the IDs of its
+    ResearchSubjects. (The `id` of a record returned by a query on Specimen fields is
+    the ID of the matching Specimen, not of the subject.)
+    """
+    research_subjects = record.get("ResearchSubject") or []
+    if not research_subjects:
+        return (record.get("id"),)
+    return tuple(sorted(rs.get("id") for rs in research_subjects))
+
+
+def unique_subjects(records):
+    """
+    Yield the records of an iterable of CDA records, skipping subjects already seen.
+    The records of a subject don't have to be next to each other, so a hash of every
+    subject seen is kept: this takes memory in proportion to the number of subjects
+    (about a hundred bytes each), unlike the rest of a conversion.
+    """
+    seen = set()
+    for record in records:
+        digest = hashlib.blake2b(
+            repr(subject_key(record)).encode("utf-8"), digest_size=16
+        ).digest()
+        if digest in seen:
+            instrument.count("cda_duplicate_records")
+            continue
+        seen.add(digest)
+        yield record
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+#
+# check_references.py - Check that the IDs in converted CRDC-H data are consistent and
+# that every reference to an ID resolves, across any number of files.
+#
+# CRDC-H objects refer to each other by `id`: a Diagnosis to its `subject` and
+# `related_specimen`, a Specimen to its `source_subject`, and so on. An object with an
+# `id` and other fields defines that ID (whether it is the Example of a document or
+# embedded in another object, as the transforms do), and an object with only an `id` (as
+# in normalized output, or demonstrator-2) refers to one. This reports:
+#
+# - dangling references: IDs that are referred to but never defined,
+# - duplicate IDs: IDs defined by the Examples of more than one document, and
+# - conflicting IDs: IDs that are defined more than once with different contents.
+#
+# For example:
+#
+#   python ccdh-pilot/check_references.py ccdh-pilot/demonstrator-2 \
+#       ccdh-pilot/imported-node-data/gdc-head-and-mouth.yaml --workers 4
+#
+# Every file is read once, and summarized by the IDs it defines (with a hash of each
+# definition, in which the objects it contains are reduced to their IDs) and the IDs it
+# refers to. The summaries are then merged with dictionary lookups, so checking takes
+# time linear in the number of objects, however they are spread across files. With
+# --workers, files and the shards of sharded output are summarized in parallel. Inputs
+# can be YAML files (optionally compressed), manifests of sharded output, or directories,
+# which are searched for YAML files. The exit code is 0 if no problems were found, and
+# 1 otherwise.
+#
+
+import argparse
+import collections
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import yaml
+
+import compression
+import instrument
+import sharding
+
+# libyaml's loader is much faster, but PyYAML may have been built without it.
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Where an ID is defined or referred to: the file and the key of the document.
+Location = collections.namedtuple("Location", ["path", "key"])
+
+# A problem with an ID: its kind ("dangling", "duplicate" or "conflicting"), the ID, and
+# the locations involved.
+Problem = collections.namedtuple("Problem", ["kind", "id", "locations"])
+
+# The kinds of problem, in the order they are reported.
+KINDS = ["dangling", "duplicate", "conflicting"]
+
+
+def _digest(canonical):
+    text = json.dumps(canonical, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class FileSummary:
+    """The IDs defined and referred to in a single file."""
+
+    def __init__(self, path):
+        self.path = path
+        # ID -> (digest of its first definition, Location) for every ID defined here.
+        self.definitions = {}
+        # ID -> Location of every document whose Example defines it.
+        self.documents = collections.defaultdict(list)
+        # ID -> Location of the first reference to it.
+        self.references = {}
+        # IDs defined more than once here with different contents, as Problems.
+        self.conflicts = []
+
+    def _canonical(self, value, location):
+        # Return `value` with every object in it reduced to its ID, recording the
+        # definitions of and references to those IDs along the way.
+        if isinstance(value, list):
+            return [self._canonical(item, location) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        canonical = {
+            name: self._canonical(item, location)
+            for (name, item) in value.items()
+            if item not in (None, [], {})
+        }
+        id = value.get("id")
+        if not isinstance(id, str):
+            return canonical
+        if len(canonical) == 1:
+            self.references.setdefault(id, location)
+        else:
+            self.define(id, _digest(canonical), location)
+        return {"id": id}
+
+    def define(self, id, digest, location):
+        defined = self.definitions.get(id)
+        if defined is None:
+            self.definitions[id] = (digest, location)
+        elif defined[0] != digest:
+            self.conflicts.append(Problem("conflicting", id, [defined[1], location]))
+
+    def add_document(self, document):
+        """Summarize a single document (a dictionary of keys to entries with an Example)."""
+        for (key, entry) in document.items():
+            example = entry.get("Example") if isinstance(entry, dict) else None
+            if not isinstance(example, dict):
+                continue
+            location = Location(self.path, key)
+            self._canonical(example, location)
+            if isinstance(example.get("id"), str):
+                self.documents[example["id"]].append(location)
+
+
+def summarize_file(path):
+    """Return a FileSummary of the documents in a (possibly compressed) YAML file."""
+    summary = FileSummary(path)
+    with instrument.timer("summarize_file"), compression.open_file(path) as f:
+        for document in yaml.load_all(f, Loader=Loader):
+            if isinstance(document, dict):
+                summary.add_document(document)
+    return summary
+
+
+def expand_paths(paths):
+    """
+    Return the YAML files to check for a list of files, manifests of sharded output and
+    directories, with every shard and every YAML file in a directory listed separately.
+    """
+    expanded = []
+    for path in paths:
+        path = str(path)
+        if os.path.isdir(path):
+            found = []
+            for extension in ["", *compression.EXTENSIONS]:
+                query = os.path.join(path, "**", "*.yaml" + extension)
+                found.extend(glob.glob(query, recursive=True))
+            expanded.extend(sorted(found))
+        elif path.endswith(sharding.MANIFEST_SUFFIX):
+            manifest = sharding.read_manifest(path)
+            expanded.extend(shard["full_path"] for shard in manifest["shards"])
+        else:
+            expanded.append(path)
+    return expanded
+
+
+class ReferenceChecker:
+    """Merges FileSummaries, and reports the problems with the IDs in all of them."""
+
+    def __init__(self):
+        # ID -> (digest of its first definition, Location) across every file.
+        self.definitions = {}
+        # ID -> Locations of the documents whose Examples define it.
+        self.documents = {}
+        # ID -> Location of the first reference to it that wasn't defined at the time.
+        self.pending = {}
+        self.conflicts = []
+        self.files = 0
+
+    def add(self, summary):
+        self.files += 1
+        self.conflicts.extend(summary.conflicts)
+        for (id, (digest, location)) in summary.definitions.items():
+            defined = self.definitions.get(id)
+            if defined is None:
+                self.definitions[id] = (digest, location)
+                self.pending.pop(id, None)
+            elif defined[0] != digest:
+                self.conflicts.append(
+                    Problem("conflicting", id, [defined[1], location])
+                )
+        for (id, locations) in summary.documents.items():
+            self.documents.setdefault(id, []).extend(locations)
+        for (id, location) in summary.references.items():
+            if id not in self.definitions:
+                self.pending.setdefault(id, location)
+
+    def problems(self):
+        """Return every Problem found, by kind and then in the order they were found."""
+        problems = [
+            Problem("dangling", id, [location])
+            for (id, location) in self.pending.items()
+            if id not in self.definitions
+        ]
+        problems.extend(
+            Problem("duplicate", id, locations)
+            for (id, locations) in self.documents.items()
+            if len(locations) > 1
+        )
+        problems.extend(self.conflicts)
+        return problems
+
+
+def check(paths, workers=1):
+    """Check the IDs in YAML files, manifests and directories, and return a ReferenceChecker."""
+    paths = expand_paths(paths)
+    checker = ReferenceChecker()
+    if workers <= 1:
+        for path in paths:
+            checker.add(summarize_file(path))
+        return checker
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for summary in executor.map(summarize_file, paths):
+            checker.add(summary)
+    return checker
+
+
+def format_problem(problem):
+    """Describe a Problem on a single line."""
+    locations = ", ".join(f"{path} ({key})" for (path, key) in problem.locations)
+    description = {
+        "dangling": "is referred to but never defined",
+        "duplicate": "is defined by more than one document",
+        "conflicting": "is defined with different contents",
+    }[problem.kind]
+    return f"{problem.id} {description}: {locations}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that the IDs in converted CRDC-H data are consistent and resolve."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="YAML files, sharded output manifests or directories of YAML files",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of processes to read files with"
+    )
+    parser.add_argument(
+        "--ignore",
+        choices=KINDS,
+        action="append",
+        default=[],
+        help="don't report problems of this kind (may be given more than once)",
+    )
+    args = parser.parse_args(argv)
+
+    checker = check(args.inputs, args.workers)
+    problems = [p for p in checker.problems() if p.kind not in args.ignore]
+    for problem in problems:
+        print(format_problem(problem))
+
+    counts = collections.Counter(problem.kind for problem in problems)
+    print(
+        f"{len(checker.definitions)} IDs defined in {checker.files} files: "
+        + ", ".join(f"{counts[kind]} {kind}" for kind in KINDS),
+        file=sys.stderr,
+    )
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+#
+# compatibility.py - Validate CRDC-H instance data against several versions of the model
+# at once, and report which files are compatible with which versions.
+#
+# Our data has to be checked against more than one version of the CRDC-H model (such as
+# the v1.1 release that head-and-mouth/test_load.py uses and the `main` branch that
+# test_validate_all.py uses). Validating a corpus once per version would read and parse
+# every file once per version. Instead, a CompatibilityChecker parses each document
+# once, loads it into crdch_model objects once, and then validates it against the JSON
+# Schema of every version, with a validate.Validator (which compiles each class
+# validator once) per version. For example:
+#
+#   python ccdh-pilot/compatibility.py ccdh-pilot/imported-node-data \
+#       --schema v1.1 --schema main --schema next=crdch_model.schema.json
+#
+# prints a compatibility matrix, with the number of documents in each file that are
+# valid under each version. Versions are given as branches or tags of the ccdhmodel
+# repository, or as `label=path-or-URL` for other schemas. Documents that have already
+# been validated against a version are looked up in the validation cache (see
+# validation_cache.py), as in test_validate_all.py. The exit code is 0 if every document
+# is valid under every version, and 1 otherwise.
+#
+
+import argparse
+import collections
+import glob
+import json
+import os
+import sys
+
+import yaml
+
+import compression
+import construct
+import instrument
+import lazy
+import validate
+import validation_cache
+
+crdch_model = lazy.lazy_import("crdch_model")
+
+# The versions we check against by default: the release the tests pin, and the next one.
+DEFAULT_VERSIONS = ["v1.1", "main"]
+
+# How many documents to parse before validating them against every version.
+BATCH_SIZE = validate.PREFILTER_BATCH_SIZE
+
+
+def parse_version(text):
+    """
+    Return the (label, location) of a schema version given as a branch or tag of the
+    ccdhmodel repository (such as "v1.1"), or as "label=path-or-URL".
+    """
+    if "=" in text:
+        (label, location) = text.split("=", 1)
+        return (label, location)
+    return (text, validate.json_schema_url(text))
+
+
+def _describe(error):
+    return f"at {'/'.join(str(p) for p in error.path)}: {error.message}"
+
+
+class FileResult:
+    """The results of validating a single file against every version."""
+
+    def __init__(self, path, labels):
+        self.path = path
+        self.documents = 0
+        # Version label -> document key -> error messages, for invalid documents.
+        self.errors = {label: collections.defaultdict(list) for label in labels}
+
+    def failed(self, label):
+        """Return the number of documents that are invalid under a version."""
+        return len(self.errors[label])
+
+
+class CompatibilityChecker:
+    """
+    Validates documents against the JSON Schemas of several versions of the CRDC-H
+    model, given as a dictionary of version labels to schemas, parsing and loading each
+    document only once.
+    """
+
+    def __init__(self, json_schemas, cache=None):
+        self.validators = {
+            label: validate.Validator(json_schema, cache, prefilter=True, load=False)
+            for (label, json_schema) in json_schemas.items()
+        }
+
+    def _check_batch(self, batch, result):
+        # Load every example into crdch_model objects once. Examples that can't be
+        # loaded are invalid under every version, and aren't validated any further.
+        loaded = []
+        for entry in batch:
+            key = next(iter(entry))
+            class_name = validate.class_name_for_key(key)
+            try:
+                if class_name is None:
+                    raise ValueError(f"Could not load entry: {key}")
+                example = entry[key]["Example"]
+                construct.load(example, getattr(crdch_model, class_name))
+            except (ValueError, TypeError) as e:
+                for errors in result.errors.values():
+                    errors[key].append(str(e))
+                continue
+            loaded.append(entry)
+
+        for (label, validator) in self.validators.items():
+            with instrument.timer(f"validate_{label}"):
+                for (key, error) in validator.iter_entries_errors(loaded):
+                    result.errors[label][key].append(_describe(error))
+
+    def check_file(self, path):
+        """Validate every document in a (possibly compressed) YAML file, and return a FileResult."""
+        result = FileResult(path, list(self.validators))
+        with compression.open_file(path) as f:
+            batch = []
+            for entry in yaml.load_all(f, Loader=yaml.FullLoader):
+                result.documents += 1
+                batch.append(entry)
+                if len(batch) >= BATCH_SIZE:
+                    self._check_batch(batch, result)
+                    batch = []
+            self._check_batch(batch, result)
+        return result
+
+
+def find_files(paths):
+    """Return the YAML files (including compressed ones) given, or in the directories given."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        found = []
+        for extension in ["", *compression.EXTENSIONS]:
+            query = os.path.join(path, "**", "*.yaml" + extension)
+            found.extend(glob.glob(query, recursive=True))
+        files.extend(sorted(found))
+    return files
+
+
+def format_matrix(results, labels):
+    """Format a compatibility matrix of files and versions as text."""
+    rows = [["file", *labels]]
+    for result in results:
+        rows.append(
+            [result.path]
+            + [
+                f"{result.documents - result.failed(label)}/{result.documents}"
+                for label in labels
+            ]
+        )
+    documents = sum(result.documents for result in results)
+    rows.append(
+        ["total"]
+        + [
+            f"{documents - sum(r.failed(label) for r in results)}/{documents}"
+            for label in labels
+        ]
+    )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for (cell, width) in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+
+def matrix_json(results, labels):
+    """Return a compatibility matrix, with the errors of every invalid document, as a dictionary that can be dumped as JSON."""
+    return {
+        "versions": labels,
+        "files": {
+            result.path: {
+                "documents": result.documents,
+                "valid": {
+                    label: result.documents - result.failed(label) for label in labels
+                },
+                "errors": {
+                    label: dict(result.errors[label])
+                    for label in labels
+                    if result.errors[label]
+                },
+            }
+            for result in results
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Validate CRDC-H instance data against several versions of the "
+        "model at once."
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="YAML files, or directories of YAML files"
+    )
+    parser.add_argument(
+        "--schema",
+        dest="versions",
+        action="append",
+        help="a ccdhmodel branch or tag, or label=path-or-URL of a JSON Schema, to "
+        "validate against (may be given more than once; by default, "
+        + " and ".join(DEFAULT_VERSIONS)
+        + ")",
+    )
+    parser.add_argument(
+        "--out",
+        help="also write the matrix, and every validation error, to this JSON file",
+    )
+    parser.add_argument(
+        "--errors", action="store_true", help="print every validation error"
+    )
+    args = parser.parse_args(argv)
+
+    versions = [parse_version(v) for v in args.versions or DEFAULT_VERSIONS]
+    labels = [label for (label, _) in versions]
+    if len(set(labels)) != len(labels):
+        parser.error("every schema needs a different label")
+
+    json_schemas = {}
+    for (label, location) in versions:
+        with instrument.timer("load_schema"):
+            json_schemas[label] = validate.load_json_schema(location)
+
+    cache = validation_cache.from_environment()
+    checker = CompatibilityChecker(json_schemas, cache)
+    results = []
+    try:
+        for path in find_files(args.inputs):
+            result = checker.check_file(path)
+            results.append(result)
+            if args.errors:
+                for label in labels:
+                    for (key, messages) in result.errors[label].items():
+                        for message in messages:
+                            print(f"{path} ({key}) [{label}] {message}")
+            if cache is not None:
+                cache.flush()
+    finally:
+        if cache is not None:
+            cache.close()
+
+    print(format_matrix(results, labels))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(matrix_json(results, labels), f, indent=2)
+
+    compatible = all(
+        result.failed(label) == 0 for result in results for label in labels
+    )
+    return 0 if compatible else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
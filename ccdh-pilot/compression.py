@@ -0,0 +1,109 @@
+#
+# compression.py - Read and write gzip- or zstd-compressed files transparently.
+#
+# open_file() works like open(), but compresses or decompresses files whose names end
+# in .gz (gzip) or .zst (zstd) as they are read or written, without decompressing them
+# to a temporary file. Every reader and writer in the pipeline opens files through it,
+# so source exports and converted data can be compressed simply by renaming them.
+#
+# The demonstrators write uncompressed files unless the CRDCH_COMPRESSION environment
+# variable is set to "gzip" or "zstd", in which case the matching extension is added
+# to the files they write. CRDCH_COMPRESSION_LEVEL sets the compression level.
+#
+# zstd support requires the optional `zstandard` package.
+#
+
+import gzip
+import os
+
+# File extensions -> compression formats.
+EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+# Compression formats -> the extension we give files in that format.
+FORMAT_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+# The compression levels we use by default, which favour speed over size.
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def compression_for(path):
+    """Return the compression format of a file from its name ("gzip", "zstd" or None)."""
+    return EXTENSIONS.get(os.path.splitext(str(path))[1].lower())
+
+
+def strip_extension(path):
+    """Return the file name without any compression extension (e.g. "cases.tsv" for "cases.tsv.gz")."""
+    (root, extension) = os.path.splitext(str(path))
+    return root if extension.lower() in EXTENSIONS else str(path)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "Reading or writing zstd-compressed files requires the zstandard package"
+        )
+    return zstandard
+
+
+def open_file(path, mode="r", level=None, **kwargs):
+    """
+    Open a file like open(), compressing or decompressing it if its name ends in a
+    compression extension. `level` sets the compression level when writing. Any other
+    keyword arguments (such as `newline`) are passed on for text files.
+    """
+    compression = compression_for(path)
+    if compression is None:
+        return open(path, mode, **kwargs)
+
+    binary = "b" in mode
+    if not binary:
+        mode = mode.replace("t", "") + "t"
+        kwargs.setdefault("encoding", "utf-8")
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=level, **kwargs)
+
+    zstandard = _zstandard()
+    return zstandard.open(
+        path, mode, cctx=zstandard.ZstdCompressor(level=level), **kwargs
+    )
+
+
+def from_environment():
+    """
+    Return the (compression format, level) configured by the CRDCH_COMPRESSION and
+    CRDCH_COMPRESSION_LEVEL environment variables. The format is None if files should
+    not be compressed.
+    """
+    compression = os.environ.get("CRDCH_COMPRESSION") or None
+    if compression is not None and compression not in FORMAT_EXTENSIONS:
+        raise ValueError(
+            f"CRDCH_COMPRESSION must be one of {sorted(FORMAT_EXTENSIONS)}, not {compression!r}"
+        )
+    level = os.environ.get("CRDCH_COMPRESSION_LEVEL")
+    return (compression, int(level) if level else None)
+
+
+def output_path(path):
+    """
+    Return the (file name, compression level) that a demonstrator should write `path` as,
+    given the compression configured by the environment (see from_environment()).
+    """
+    (compression, level) = from_environment()
+    if compression is not None:
+        path = str(path) + FORMAT_EXTENSIONS[compression]
+    return (str(path), level)
+
+
+def open_output(path):
+    """
+    Open a file that a demonstrator writes, compressed as configured by the environment
+    (see from_environment()). Returns the file, which is named `path` plus the extension
+    for the configured compression format.
+    """
+    (path, level) = output_path(path)
+    return open_file(path, "w", level)
@@ -0,0 +1,32 @@
+#
+# conftest.py - Fixtures shared by the tests in this directory.
+#
+
+import copy
+
+import pytest
+
+import snapshot
+
+
+# The head and mouth exports are parsed (or loaded from their snapshots, see
+# snapshot.py) once per test session, and every test gets its own copy, so that a test
+# that changes the cases it is given can't affect any other test.
+@pytest.fixture(scope="session")
+def _gdc_head_and_mouth():
+    return snapshot.load(snapshot.GDC_HEAD_AND_MOUTH)
+
+
+@pytest.fixture(scope="session")
+def _pdc_head_and_mouth():
+    return snapshot.load(snapshot.PDC_HEAD_AND_MOUTH)
+
+
+@pytest.fixture
+def gdc_head_and_mouth(_gdc_head_and_mouth):
+    return copy.deepcopy(_gdc_head_and_mouth)
+
+
+@pytest.fixture
+def pdc_head_and_mouth(_pdc_head_and_mouth):
+    return copy.deepcopy(_pdc_head_and_mouth)
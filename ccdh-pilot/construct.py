@@ -0,0 +1,221 @@
+#
+# construct.py - Build crdch_model objects, optionally without LinkML's per-object checks.
+#
+# Every crdch_model class runs a LinkML __post_init__ that checks required fields and
+# coerces every field to its declared type, which is most of the CPU time spent in the
+# transforms. The transforms already build objects of the right types, so when their
+# output is going to be validated anyway, these checks are redundant: the validator
+# checks the same required fields and types for each document as a whole, when it
+# loads it back into crdch_model objects and validates it against the JSON Schema. A
+# missing required field is then reported as a JSON Schema error instead of raised
+# while the transform is running.
+#
+# The transforms build objects through `model` (e.g. `model.Specimen(id=...)`), which
+# normally just calls the crdch_model class. Inside `with construct.trusted():`, objects
+# are built directly from their dataclass defaults and the given values instead.
+# Trusted construction doesn't wrap single values into lists or convert dictionaries
+# into objects, so callers need to pass values of the declared types.
+#
+# load() builds an object and everything in it from a plain dictionary, such as a
+# document read by yaml.load_all(), as LinkML's YAMLLoader does. Rather than running
+# every __post_init__, it follows a plan compiled once per class from the declared type
+# of every field: which fields are required, which hold lists, and which class or type
+# each value is converted to. If a dictionary has unknown or missing required fields, or
+# a field that holds objects has a value that isn't a dictionary (such as `subject: 5`,
+# which LinkML rejects for most fields but turns into an object for some, such as
+# `identifier`), the object is built by its class instead, which raises LinkML's error
+# for it (or converts it as LinkML does); values that can't be converted raise the same
+# errors as in LinkML.
+#
+
+import contextlib
+import dataclasses
+import sys
+import typing
+
+import lazy
+
+crdch_model = lazy.lazy_import("crdch_model")
+
+# Whether objects are currently built without LinkML's checks.
+_trusted = False
+
+
+def is_trusted():
+    return _trusted
+
+
+@contextlib.contextmanager
+def trusted(enabled=True):
+    """Build objects without LinkML's checks within this context (if enabled)."""
+    global _trusted
+    previous = _trusted
+    _trusted = enabled
+    try:
+        yield
+    finally:
+        _trusted = previous
+
+
+class _Factory:
+    """Builds objects of a single crdch_model class."""
+
+    __slots__ = ("cls", "names", "defaults", "factories")
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.names = []
+        # The default for every field, in the order the fields are declared in (which
+        # is the order they are serialized in), and the fields whose defaults need to
+        # be created for each object.
+        self.defaults = {}
+        self.factories = []
+        for field in dataclasses.fields(cls):
+            self.names.append(field.name)
+            self.defaults[field.name] = None
+            if field.default_factory is not dataclasses.MISSING:
+                self.factories.append((field.name, field.default_factory))
+            elif field.default is not dataclasses.MISSING:
+                self.defaults[field.name] = field.default
+
+    def __call__(self, *args, **kwargs):
+        if not _trusted:
+            return self.cls(*args, **kwargs)
+        kwargs.update(zip(self.names, args))
+        return self.build(kwargs)
+
+    def build(self, given):
+        """Build an object from a dictionary of field values, without any checks."""
+        obj = self.cls.__new__(self.cls)
+        values = obj.__dict__
+        values.update(self.defaults)
+        for (name, factory) in self.factories:
+            values[name] = factory()
+        values.update(given)
+        return obj
+
+
+class _Model:
+    """A factory for every crdch_model class, created when first used."""
+
+    def __getattr__(self, name):
+        factory = _Factory(getattr(crdch_model, name))
+        setattr(self, name, factory)
+        return factory
+
+
+model = _Model()
+
+
+def _flatten(hint):
+    """Return the types in a (possibly nested) Union or Optional type hint."""
+    if getattr(hint, "__origin__", None) is typing.Union:
+        return [t for arg in hint.__args__ for t in _flatten(arg)]
+    return [hint]
+
+
+class _Plan:
+    """How to build objects of a single crdch_model class from plain dictionaries."""
+
+    __slots__ = ("cls", "factory", "fields", "required")
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.factory = _Factory(cls)
+        hints = typing.get_type_hints(cls, vars(sys.modules[cls.__module__]))
+        # Field name -> (whether it holds a list, the class or type of its values), in
+        # the order the fields are declared in, which is the order LinkML converts them.
+        self.fields = {}
+        self.required = []
+        for field in dataclasses.fields(cls):
+            hinted = _flatten(hints[field.name])
+            if type(None) not in hinted:
+                self.required.append(field.name)
+            multivalued = False
+            for hint in hinted:
+                if getattr(hint, "__origin__", None) is list:
+                    multivalued = True
+                    hinted = _flatten(hint.__args__[0])
+                    break
+            # LinkML converts values to the last (most specific) type given, such as
+            # `SpecimenId` in `Union[str, SpecimenId]` or `Identifier` in
+            # `Union[dict, Identifier]`.
+            ranges = [t for t in hinted if t not in (dict, type(None))]
+            value_range = None
+            if ranges and isinstance(ranges[-1], type):
+                value_range = ranges[-1]
+            self.fields[field.name] = (multivalued, value_range)
+
+    def load(self, data):
+        if (
+            not isinstance(data, dict)
+            or any(name not in self.fields for name in data)
+            or any(data.get(name) in (None, [], {}) for name in self.required)
+        ):
+            return self.cls(**data)
+
+        try:
+            return self.factory.build(self._values(data))
+        except _Unplanned:
+            return self.cls(**data)
+
+    def _values(self, data):
+        values = {}
+        for (name, (multivalued, value_range)) in self.fields.items():
+            if name not in data:
+                continue
+            value = data[name]
+            if multivalued:
+                if value is None:
+                    value = []
+                elif not isinstance(value, list):
+                    value = [value]
+                values[name] = [_convert(v, value_range) for v in value]
+            elif value is not None:
+                values[name] = _convert(value, value_range)
+        return values
+
+
+class _Unplanned(Exception):
+    """Raised for a value that only the class it belongs to knows how to handle."""
+
+
+# crdch_model class -> _Plan
+_plans = {}
+
+
+def _convert(value, value_range):
+    """Convert a single value to the class or type of a field."""
+    if value_range is None or isinstance(value, value_range):
+        return value
+    if dataclasses.is_dataclass(value_range):
+        if not isinstance(value, dict):
+            raise _Unplanned()
+        return load(value, value_range)
+    return value_range(value)
+
+
+def plan(cls):
+    """Return the plan for building objects of a crdch_model class, compiling it once."""
+    compiled = _plans.get(cls)
+    if compiled is None:
+        compiled = _plans[cls] = _Plan(cls)
+    return compiled
+
+
+def compile_plans(cls):
+    """
+    Compile the plans for a crdch_model class and every class its fields refer to, so
+    that a long-running process doesn't compile them while loading its first documents.
+    """
+    pending = [cls]
+    while pending:
+        compiled = plan(pending.pop())
+        for (_, value_range) in compiled.fields.values():
+            if dataclasses.is_dataclass(value_range) and value_range not in _plans:
+                pending.append(value_range)
+
+
+def load(data, cls):
+    """Build an object of a crdch_model class (and the objects in it) from a dictionary."""
+    return plan(cls).load(data)
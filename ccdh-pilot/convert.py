@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+
+#
+# convert.py - Convert a GDC or PDC case export into CRDC-H instance data.
+#
+# This runs the same transforms as the demonstrators in test_transform_gdc.py and
+# test_transform_pdc.py, and like them reads the input one case at a time and writes
+# each document as soon as it has been converted. It also validates each document, and
+# can spread the work over several processes, while the next cases are read and the
+# previous ones are written (see pipeline.py). For example:
+#
+#   python ccdh-pilot/convert.py gdc --in head-and-mouth/gdc-head-and-mouth.json \
+#       --out gdc-head-and-mouth.yaml --workers 4
+#
+# The exit code is 0 if every document was converted and validated successfully, 1 if
+# any document failed validation, and 2 if the command line was invalid.
+#
+
+import argparse
+import concurrent.futures
+import importlib
+import logging
+import sys
+
+import yaml
+
+import case_index
+import cda
+import compression
+import construct
+import instrument
+import normalize
+import pipeline
+import serialize
+import sharding
+import sources
+import spill
+import transform
+import validate
+
+# The sources we can convert, and the modules that transform them.
+TRANSFORMS = {
+    "cda": "transform_cda",
+    "gdc": "transform_gdc",
+    "pdc": "transform_pdc",
+}
+
+# The conversion job run by this process (see _start_job()).
+_job = None
+
+
+class Job:
+    """Converts, validates and serializes cases from a single source."""
+
+    def __init__(
+        self,
+        source,
+        output_format,
+        json_schema=None,
+        context=None,
+        normalized=False,
+        ids="positional",
+    ):
+        self.transform = importlib.import_module(TRANSFORMS[source])
+        self.output_format = output_format
+        self.validator = (
+            validate.Validator(json_schema, prefilter=True) if json_schema else None
+        )
+        self.context = context
+        self.normalizer = normalize.Normalizer() if normalized else None
+        self.ids = ids
+
+    def warm_up(self):
+        """
+        Import crdch_model and compile the validators up front, so that a long-running
+        process (see service.py) converts its first case as quickly as the rest.
+        """
+        for (_, class_name) in validate.CLASS_NAMES_BY_SUFFIX:
+            getattr(construct.model, class_name)
+        if self.validator is not None:
+            self.validator.warm_up()
+
+    def convert_case(self, case_index, case):
+        """
+        Convert a single case. Returns a list of serialized chunks to write out, and a
+        list of validation error messages.
+        """
+        chunks = []
+        errors = []
+        # When the output is validated, LinkML's checks are run when validating each
+        # document, so there is no need to run them while building every object too.
+        trusted = self.validator is not None
+        with instrument.timer("transform"), construct.trusted(trusted):
+            with transform.id_scheme(self.ids):
+                documents = self.transform.transform_case(case, case_index)
+            if self.normalizer is not None:
+                documents = self.normalizer.normalize(documents)
+
+        for document in documents:
+            text = None
+            if self.validator is not None:
+                with instrument.timer("validate"):
+                    text = serialize.yaml_document(document)
+                    errors.extend(self.validate(yaml.safe_load(text)))
+
+            with instrument.timer("serialize"):
+                if self.output_format == "yaml":
+                    chunks.append(text or serialize.yaml_document(document))
+                elif self.output_format == "jsonld":
+                    (entry,) = document.values()
+                    chunks.append(serialize.jsonld_element(entry["Example"]))
+
+        if self.output_format == "ttl" and documents:
+            with instrument.timer("serialize"):
+                examples = [entry["Example"] for d in documents for entry in d.values()]
+                chunks.append(serialize.turtle(examples, self.context))
+
+        return (chunks, errors)
+
+    def validate(self, entry):
+        """Return a list of error messages for a single document."""
+        try:
+            return [
+                f"{key} at {'/'.join(str(p) for p in error.path)}: {error.message}"
+                for (key, error) in self.validator.iter_errors(entry)
+            ]
+        except (ValueError, TypeError) as e:
+            return [f"{list(entry)[0]}: {e}"]
+
+
+def _start_job(*args):
+    """Set up the conversion job in a worker process."""
+    global _job
+    _job = Job(*args)
+
+
+def _convert_case(case_index, case):
+    """Convert a single case in a worker process."""
+    return _job.convert_case(case_index, case)
+
+
+def convert(
+    cases,
+    writer,
+    job_args,
+    workers=1,
+    case_indexes=None,
+    queue_size=None,
+    job=None,
+):
+    """
+    Convert an iterable of cases and write them to `writer`, in order. Returns the
+    number of validation errors. `case_indexes` gives the position of each case in its
+    export, which is used in the IDs of the converted documents, if the cases aren't the
+    whole export. Cases are read, converted and written at the same time (see
+    pipeline.py), with at most `queue_size` (by default, a few per worker) cases waiting
+    between each stage.
+
+    If an existing `job` is given, the cases are converted by it in this process (and
+    `job_args` and `workers` are ignored), so that a long-running process (see
+    service.py) only sets up its jobs once.
+    """
+    error_count = 0
+    indexed_cases = (
+        enumerate(cases) if case_indexes is None else zip(case_indexes, cases)
+    )
+    if queue_size is None:
+        queue_size = max(workers, 1) * 4
+
+    def write(result):
+        nonlocal error_count
+        (chunks, errors) = result
+        for error in errors:
+            logging.error(f"Validation error in {error}")
+        error_count += len(errors)
+        for chunk in chunks:
+            writer.write(chunk)
+
+    if job is not None or workers <= 1:
+        if job is None:
+            job = Job(*job_args)
+        pipeline.run(indexed_cases, job.convert_case, write, queue_size=queue_size)
+        return error_count
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_start_job, initargs=job_args
+    ) as executor:
+        pipeline.run(indexed_cases, _convert_case, write, executor, queue_size)
+
+    return error_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert a GDC or PDC case export into CRDC-H instance data."
+    )
+    parser.add_argument("source", choices=sorted(TRANSFORMS), help="source format")
+    parser.add_argument(
+        "--in",
+        dest="input",
+        help="JSON, TSV or XML case export to convert, optionally compressed ('-' for standard input)",
+    )
+    parser.add_argument(
+        "--in-format",
+        choices=sources.FORMATS,
+        help="format of the case export (by default, guessed from its file name)",
+    )
+    parser.add_argument(
+        "--cda-query",
+        help="convert the records returned by this CDA query (with the cda source) instead of an export",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=cda.PAGE_SIZE,
+        help="number of records to fetch from CDA at a time",
+    )
+    parser.add_argument(
+        "--cases",
+        help="only convert these comma-separated positions, start:stop ranges or case_ids "
+        "of cases in a JSON export (see case_index.py)",
+    )
+    parser.add_argument(
+        "--out",
+        dest="output",
+        required=True,
+        help="file to write the converted data to ('-' for standard output); compressed if it ends in .gz or .zst",
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        help="compression level for compressed output files",
+    )
+    parser.add_argument(
+        "--format", choices=serialize.FORMATS, default="yaml", help="output format"
+    )
+    parser.add_argument(
+        "--shard-documents",
+        type=int,
+        help="write YAML output in shards of at most this many documents, listed in a manifest",
+    )
+    parser.add_argument(
+        "--shard-bytes",
+        type=int,
+        help="write YAML output in shards of at most this many bytes, listed in a manifest",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of processes to convert with"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        help="number of cases to hold between reading, converting and writing (by default, 4 per worker)",
+    )
+    parser.add_argument(
+        "--schema",
+        default=validate.JSON_SCHEMA_URL,
+        help="URL or path of the CRDC-H JSON Schema to validate against",
+    )
+    parser.add_argument(
+        "--no-validate", action="store_true", help="don't validate converted data"
+    )
+    parser.add_argument(
+        "--context",
+        default=serialize.CRDCH_YAML_URI,
+        help="URL or path of the CRDC-H LinkML schema to generate the JSON-LD context from",
+    )
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="write each Subject and Specimen once, and refer to it by ID elsewhere "
+        "(with a single worker)",
+    )
+    parser.add_argument(
+        "--ids",
+        choices=transform.ID_SCHEMES,
+        default=transform.id_scheme_from_environment(),
+        help="identify objects by their position in the input (positional) or by their "
+        "source identifiers (stable)",
+    )
+    parser.add_argument("--metrics", help="write per-stage timings to this JSON file")
+    parser.add_argument(
+        "--flamegraph", help="write per-stage timings to this collapsed-stack file"
+    )
+    parser.add_argument("--profile", help="write a cProfile dump to this file")
+    args = parser.parse_args(argv)
+    if args.cda_query is not None and args.source != "cda":
+        parser.error("--cda-query can only be used with the cda source")
+    if (args.input is None) == (args.cda_query is None):
+        parser.error("one of --in or --cda-query is required")
+    if args.cases and (
+        args.input == "-"
+        or (args.in_format or sources.guess_format(args.input)) != "json"
+    ):
+        parser.error("--cases can only be used with a JSON export file")
+    if args.normalize and args.workers > 1:
+        # Every worker would write the entities it has seen itself, so the same entity
+        # would be written once per worker.
+        parser.error("--normalize can't be used with more than one worker")
+    sharded = args.shard_documents is not None or args.shard_bytes is not None
+    if sharded and (args.format != "yaml" or args.output == "-"):
+        parser.error("only YAML output to a file can be sharded")
+
+    if args.metrics or args.flamegraph:
+        instrument.enable()
+
+    with instrument.profile(args.profile):
+        json_schema = None
+        if not args.no_validate:
+            with instrument.timer("load_schema"):
+                json_schema = validate.load_json_schema(args.schema)
+
+        context = None
+        if args.format != "yaml":
+            with instrument.timer("jsonld_context"):
+                context = serialize.jsonld_context(args.context)
+
+        job_args = (
+            args.source,
+            args.format,
+            json_schema,
+            context,
+            args.normalize,
+            args.ids,
+        )
+        index = None
+        case_indexes = None
+        if args.cda_query is not None:
+            cases = cda.iter_query_records(cda.query(args.cda_query), args.page_size)
+        elif args.cases:
+            # Only decode the selected cases, keeping their positions in the export so
+            # that they are converted into the same IDs as when converting all of it.
+            index = case_index.CaseIndex(args.input)
+            try:
+                case_indexes = index.positions(args.cases)
+            except ValueError as e:
+                parser.error(str(e))
+            cases = (index[position] for position in case_indexes)
+        else:
+            cases = sources.read_cases(args.input, args.in_format)
+        if args.source == "cda":
+            # This remembers a small hash of every subject, so it is the one part of a
+            # conversion whose memory use grows with the input.
+            cases = cda.unique_subjects(cases)
+        # Only keep the fields the transforms use, so that cases take up less memory and
+        # are quicker to send to worker processes.
+        stage_case = importlib.import_module(TRANSFORMS[args.source]).stage_case
+        cases = (stage_case(case) for case in cases)
+        output = None
+        if args.output == "-":
+            output = sys.stdout
+        elif not sharded:
+            if args.format == "yaml":
+                # Remove any shards a previous sharded run left behind.
+                sharding.remove_shards(sharding.manifest_path(args.output))
+            output = compression.open_file(args.output, "w", args.compression_level)
+        try:
+            if sharded:
+                writer = sharding.ShardedWriter(
+                    args.output,
+                    args.shard_documents,
+                    args.shard_bytes,
+                    args.compression_level,
+                )
+            else:
+                writer = serialize.stream_writer(args.format, output, context)
+            error_count = convert(
+                cases,
+                writer,
+                job_args,
+                args.workers,
+                case_indexes,
+                args.queue_size,
+            )
+            writer.close()
+        finally:
+            if output is not None and output is not sys.stdout:
+                output.close()
+            if index is not None:
+                index.close()
+
+    if args.metrics:
+        recorded = instrument.metrics()
+        recorded["stages"] = pipeline.throughput(recorded)
+        recorded["peak_rss_bytes"] = spill.peak_rss_bytes()
+        instrument.write_metrics(args.metrics, recorded)
+    if args.flamegraph:
+        instrument.write_folded(args.flamegraph)
+
+    if error_count > 0:
+        logging.error(
+            f"{error_count} validation errors in {args.input or args.cda_query}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
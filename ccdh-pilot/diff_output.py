@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+#
+# diff_output.py - Report which documents changed between two versions of converted data.
+#
+# Compares two YAML outputs (such as an old and a new imported-node-data/gdc-head-and-mouth.yaml,
+# optionally compressed, or the manifests of sharded outputs), matching documents by key
+# (e.g. `gdc_head_and_mouth_case_3_diagnosis_0_diagnosis`), and reports which documents
+# were added, removed or changed, and the paths of the fields that changed:
+#
+#   python ccdh-pilot/diff_output.py old/gdc-head-and-mouth.yaml gdc-head-and-mouth.yaml
+#
+# Both outputs are streamed rather than loaded. Documents are first compared by a hash of
+# their text, and only documents whose text differs are parsed and compared field by
+# field, so unchanged documents are never parsed. Documents whose text differs but whose
+# content is the same (e.g. with keys in another order) aren't reported. The exit code is
+# 0 if the outputs contain the same documents, and 1 if they don't.
+#
+
+import argparse
+import collections
+import hashlib
+import sys
+
+import yaml
+
+import compression
+import sharding
+
+# libyaml's loader is much faster, but PyYAML may have been built without it.
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Stands in for the value at a path that only exists in one of the documents.
+MISSING = object()
+
+# A difference at a path (a tuple of keys and list indexes) between two documents. `old`
+# is MISSING for fields that were added, and `new` for fields that were removed.
+Difference = collections.namedtuple("Difference", ["path", "old", "new"])
+
+
+def iter_document_texts(path):
+    """
+    Yield (key, text) for every document in a YAML output written by the converters, or
+    in the shards listed in a manifest (see sharding.py).
+    """
+    path = str(path)
+    if path.endswith(sharding.MANIFEST_SUFFIX):
+        paths = [shard["full_path"] for shard in sharding.read_manifest(path)["shards"]]
+    else:
+        paths = [path]
+
+    for path in paths:
+        with compression.open_file(path) as f:
+            lines = []
+            for line in f:
+                if line == sharding.SEPARATOR:
+                    if lines:
+                        text = "".join(lines)
+                        yield (sharding.document_key(text), text)
+                    lines = []
+                else:
+                    lines.append(line)
+            if lines:
+                text = "".join(lines)
+                yield (sharding.document_key(text), text)
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def diff_values(old, new, path=()):
+    """Yield a Difference for every path at which two parsed documents differ."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key in new:
+                yield from diff_values(old[key], new[key], path + (key,))
+            else:
+                yield Difference(path + (key,), old[key], MISSING)
+        for key in new:
+            if key not in old:
+                yield Difference(path + (key,), MISSING, new[key])
+    elif isinstance(old, list) and isinstance(new, list):
+        for index in range(max(len(old), len(new))):
+            yield from diff_values(
+                old[index] if index < len(old) else MISSING,
+                new[index] if index < len(new) else MISSING,
+                path + (index,),
+            )
+    elif old is MISSING or new is MISSING or old != new:
+        yield Difference(path, old, new)
+
+
+def diff_outputs(old_path, new_path):
+    """
+    Compare two outputs. Returns (added keys, removed keys, changed documents), where
+    the keys are in the order of the output they appear in, and changed documents is a
+    list of (key, list of Differences) in the order of the new output.
+    """
+    old_hashes = {key: _hash(text) for (key, text) in iter_document_texts(old_path)}
+
+    added = []
+    changed_texts = {}
+    new_keys = set()
+    for (key, text) in iter_document_texts(new_path):
+        new_keys.add(key)
+        old_hash = old_hashes.get(key)
+        if old_hash is None:
+            added.append(key)
+        elif old_hash != _hash(text):
+            changed_texts[key] = text
+    removed = [key for key in old_hashes if key not in new_keys]
+
+    # Only parse the documents whose text has changed.
+    old_documents = {}
+    if changed_texts:
+        for (key, text) in iter_document_texts(old_path):
+            if key in changed_texts:
+                old_documents[key] = yaml.load(text, Loader=Loader)
+
+    # Paths are relative to the document's key, which is the same in both documents.
+    changed = []
+    for (key, text) in changed_texts.items():
+        differences = list(
+            diff_values(old_documents[key][key], yaml.load(text, Loader=Loader)[key])
+        )
+        if differences:
+            changed.append((key, differences))
+    return (added, removed, changed)
+
+
+def format_path(path):
+    return "/".join(str(item) for item in path)
+
+
+def format_difference(difference):
+    (path, old, new) = difference
+    if old is MISSING:
+        return f"  + {format_path(path)}: {new!r}"
+    if new is MISSING:
+        return f"  - {format_path(path)}: {old!r}"
+    return f"  ~ {format_path(path)}: {old!r} -> {new!r}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report the documents that differ between two converted outputs."
+    )
+    parser.add_argument("old", help="old YAML output or sharded output manifest")
+    parser.add_argument("new", help="new YAML output or sharded output manifest")
+    parser.add_argument(
+        "--summary",
+        action="store_true",
+        help="only list the keys of added, removed and changed documents",
+    )
+    args = parser.parse_args(argv)
+
+    (added, removed, changed) = diff_outputs(args.old, args.new)
+    for key in added:
+        print(f"added {key}")
+    for key in removed:
+        print(f"removed {key}")
+    for (key, differences) in changed:
+        print(f"changed {key}")
+        if not args.summary:
+            for difference in differences:
+                print(format_difference(difference))
+    print(
+        f"{len(added)} added, {len(removed)} removed, {len(changed)} changed",
+        file=sys.stderr,
+    )
+    return 1 if added or removed or changed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
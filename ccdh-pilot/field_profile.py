@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+#
+# field_profile.py - Profile every field of a case export in a single pass, in constant
+# memory.
+#
+# Deciding which GDC and PDC fields to map means knowing which fields are filled in, what
+# types they have, and which values they take. Loading an export into pandas with
+# json_normalize() (as the head and mouth notebook does) holds all of it in memory at
+# once. Instead, this reads the export one case at a time (see sources.py) and keeps a
+# fixed-size summary for every field, identified by its path (such as
+# `diagnoses[].tissue_or_organ_of_origin`, where `[]` stands for every item of a list):
+#
+# - how many times it occurs and how many of those are null,
+# - how many of its values are of each JSON type, and the range of its numbers,
+# - the most frequent values, counted with the Misra-Gries algorithm, which is exact as
+#   long as a field has no more than TOP_CAPACITY distinct values, and
+# - its approximate number of distinct values, counted with a HyperLogLog sketch, which
+#   is usually within a few percent.
+#
+# For example:
+#
+#   python ccdh-pilot/field_profile.py head-and-mouth/gdc-head-and-mouth.json --top 5
+#
+# prints one line per field, and --out writes the whole report as JSON.
+#
+
+import argparse
+import collections
+import hashlib
+import json
+import math
+import sys
+
+import instrument
+import sources
+
+# Stands for every item of a list in a field path.
+ITEMS = "[]"
+
+# How many distinct values of each field the most frequent values are counted among.
+TOP_CAPACITY = 64
+
+# The number of bits of each hash that choose a HyperLogLog register. There are
+# 2 ** HLL_PRECISION registers, of one byte each, per field; 12 gives estimates with a
+# standard error of about 1.6%.
+HLL_PRECISION = 12
+
+
+def type_name(value):
+    """Return the name of the JSON type of a value."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    return "object"
+
+
+class HyperLogLog:
+    """Estimates the number of distinct values added to it in a fixed amount of memory."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        digest = hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest()
+        h = int.from_bytes(digest, "big")
+        rest_bits = 64 - self.precision
+        index = h >> rest_bits
+        rest = h & ((1 << rest_bits) - 1)
+        # The position of the first 1 bit in the rest of the hash.
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Add the values counted by another HyperLogLog with the same precision."""
+        for (i, rank) in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # For small numbers of values, counting empty registers is more accurate.
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class FrequentValues:
+    """
+    Counts the most frequent values added to it with the Misra-Gries algorithm, keeping
+    at most `capacity` counters. Counts are exact while there have been no more than
+    `capacity` distinct values, and otherwise lower bounds.
+    """
+
+    def __init__(self, capacity=TOP_CAPACITY):
+        self.capacity = capacity
+        # (Type name, value) -> count. Python considers True equal to 1 (and 1.0), so
+        # values are only counted together if they also have the same type.
+        self.counts = {}
+        self.exact = True
+
+    def add(self, value):
+        counts = self.counts
+        key = (type(value).__name__, value)
+        if key in counts:
+            counts[key] += 1
+        elif len(counts) < self.capacity:
+            counts[key] = 1
+        else:
+            # Every decrement is paid for by an earlier increment, so this takes
+            # constant time per value on average.
+            self.exact = False
+            for key in list(counts):
+                counts[key] -= 1
+                if counts[key] == 0:
+                    del counts[key]
+
+    def most_common(self, k):
+        """Return the (value, count) pairs of the `k` most frequent values."""
+        counts = sorted(self.counts.items(), key=lambda item: -item[1])[:k]
+        return [(value, count) for ((_, value), count) in counts]
+
+
+class FieldProfile:
+    """A fixed-size summary of the values of a single field."""
+
+    __slots__ = ("count", "types", "minimum", "maximum", "frequent", "distinct")
+
+    def __init__(self):
+        self.count = 0
+        self.types = collections.Counter()
+        self.minimum = None
+        self.maximum = None
+        # Only created once the field has a scalar value.
+        self.frequent = None
+        self.distinct = None
+
+    def add(self, value, kind):
+        self.count += 1
+        self.types[kind] += 1
+        if kind in ("array", "object", "null"):
+            return
+        if kind == "number":
+            if self.minimum is None or value < self.minimum:
+                self.minimum = value
+            if self.maximum is None or value > self.maximum:
+                self.maximum = value
+        if self.frequent is None:
+            self.frequent = FrequentValues()
+            self.distinct = HyperLogLog()
+        self.frequent.add(value)
+        self.distinct.add(value)
+
+    def report(self, top=5):
+        """Return a summary of this field as a dictionary that can be dumped as JSON."""
+        report = {
+            "count": self.count,
+            "nulls": self.types["null"],
+            "types": dict(self.types.most_common()),
+        }
+        if self.minimum is not None:
+            report["min"] = self.minimum
+            report["max"] = self.maximum
+        if self.frequent is not None:
+            report["distinct"] = self.distinct.estimate()
+            report["top"] = [list(pair) for pair in self.frequent.most_common(top)]
+            report["top_exact"] = self.frequent.exact
+        return report
+
+
+class Profiler:
+    """Profiles the fields of a stream of cases, one case at a time."""
+
+    def __init__(self):
+        self.records = 0
+        # Field path -> FieldProfile, in the order the fields were first seen.
+        self.fields = {}
+
+    def _field(self, path):
+        field = self.fields.get(path)
+        if field is None:
+            field = self.fields[path] = FieldProfile()
+        return field
+
+    def _add(self, path, value):
+        kind = type_name(value)
+        self._field(path).add(value, kind)
+        if kind == "object":
+            for (name, item) in value.items():
+                self._add(f"{path}.{name}" if path else name, item)
+        elif kind == "array":
+            for item in value:
+                self._add(path + ITEMS, item)
+
+    def add(self, case):
+        """Profile the fields of a single case."""
+        self.records += 1
+        for (name, value) in case.items():
+            self._add(name, value)
+
+    @instrument.timed("profile_fields")
+    def add_all(self, cases):
+        for case in cases:
+            self.add(case)
+        return self
+
+    def report(self, top=5):
+        """Return a report on every field as a dictionary that can be dumped as JSON."""
+        return {
+            "records": self.records,
+            "fields": {
+                path: field.report(top) for (path, field) in self.fields.items()
+            },
+        }
+
+
+def format_report(report):
+    """Format a report as text, with one line per field."""
+    lines = [f"{report['records']} records"]
+    for (path, field) in report["fields"].items():
+        types = ", ".join(f"{kind} {count}" for (kind, count) in field["types"].items())
+        line = f"{path}: {field['count']} ({types})"
+        if "distinct" in field:
+            top = ", ".join(f"{value!r} {count}" for (value, count) in field["top"])
+            label = "top" if field["top_exact"] else "top (at least)"
+            line += f"; ~{field['distinct']} distinct; {label}: {top}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Profile every field of a case export in a single pass."
+    )
+    parser.add_argument(
+        "input",
+        help="JSON, TSV or XML case export, optionally compressed ('-' for standard input)",
+    )
+    parser.add_argument(
+        "--in-format",
+        choices=sources.FORMATS,
+        help="format of the case export (by default, guessed from its file name)",
+    )
+    parser.add_argument(
+        "--top", type=int, default=5, help="number of most frequent values to report"
+    )
+    parser.add_argument(
+        "--out", help="write the report to this JSON file instead of printing it"
+    )
+    args = parser.parse_args(argv)
+    if args.top > TOP_CAPACITY:
+        parser.error(f"--top can be at most {TOP_CAPACITY}")
+
+    profiler = Profiler().add_all(sources.read_cases(args.input, args.in_format))
+    report = profiler.report(args.top)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#
+# instrument.py - Lightweight timers and counters for the transform pipeline.
+#
+# Instrumentation is disabled by default: a disabled timer is a shared no-op context
+# manager, and a disabled @timed function costs a single flag check per call. To turn
+# it on, call instrument.enable(), or set one of these environment variables before
+# the pipeline is imported:
+#   - CRDCH_METRICS: path of the per-run metrics JSON file written at exit.
+#   - CRDCH_FLAMEGRAPH: path of a collapsed-stack file (as used by flamegraph.pl and
+#     speedscope) built from the nested timers, written at exit.
+#   - CRDCH_PROFILE: path of a cProfile dump (readable with pstats or snakeviz) of the
+#     entire run, written at exit.
+#
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+# Is instrumentation currently enabled?
+_enabled = False
+
+# Timer name -> [number of calls, total seconds].
+_timings = {}
+
+# Counter name -> count.
+_counters = {}
+
+# Collapsed stack ("parse_json;transform;create_specimen") -> self time in seconds.
+_folded = {}
+
+# The timers that are currently running in each thread, innermost last.
+_local = threading.local()
+
+# Guards the shared records above, which timers in several threads may update at once.
+_lock = threading.Lock()
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class _NullTimer:
+    """A timer that does nothing, returned by timer() when instrumentation is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    """A timer that records its duration under its name and its position in the stack."""
+
+    __slots__ = ("name", "path", "start", "child_seconds", "stack")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = self.stack = _stack()
+        self.path = f"{stack[-1].path};{self.name}" if stack else self.name
+        self.child_seconds = 0.0
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        stack = self.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_seconds += elapsed
+
+        with _lock:
+            timing = _timings.get(self.name)
+            if timing is None:
+                _timings[self.name] = [1, elapsed]
+            else:
+                timing[0] += 1
+                timing[1] += elapsed
+
+            _folded[self.path] = (
+                _folded.get(self.path, 0.0) + elapsed - self.child_seconds
+            )
+        return False
+
+
+def enable():
+    """Start recording timers and counters."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop recording timers and counters. Anything already recorded is kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Return True if timers and counters are currently being recorded."""
+    return _enabled
+
+
+def reset():
+    """Discard everything recorded so far."""
+    _timings.clear()
+    _counters.clear()
+    _folded.clear()
+
+
+def timer(name):
+    """Return a context manager that records how long its body takes under `name`."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def timed(name=None):
+    """Decorator that times every call to the decorated function as `name` (by default, the function name)."""
+
+    def decorator(func):
+        timer_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(timer_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    """Add `n` to the counter `name`."""
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def metrics():
+    """Return everything recorded so far as a JSON-serializable dictionary."""
+    return {
+        "timers": {
+            name: {
+                "calls": calls,
+                "total_seconds": total,
+                "mean_seconds": total / calls,
+            }
+            for (name, (calls, total)) in sorted(
+                _timings.items(), key=lambda item: item[1][1], reverse=True
+            )
+        },
+        "counters": dict(sorted(_counters.items())),
+    }
+
+
+def write_metrics(path, recorded=None):
+    """Write `recorded` metrics (by default, those recorded so far) to `path` as JSON."""
+    with open(path, "w") as f:
+        json.dump(recorded or metrics(), f, indent=2)
+
+
+def write_folded(path):
+    """
+    Write the nested timers to `path` in the collapsed-stack format used by
+    flamegraph.pl and speedscope: one "outer;inner;innermost <microseconds>" line
+    per distinct stack, counting only the time spent in the innermost timer itself.
+    """
+    with open(path, "w") as f:
+        for (stack, seconds) in sorted(_folded.items()):
+            f.write(f"{stack} {round(seconds * 1_000_000)}\n")
+
+
+class profile:
+    """
+    Context manager that runs its body under cProfile and dumps the statistics to
+    `path`. If `path` is None, the body is run without profiling.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.profiler = None
+
+    def __enter__(self):
+        if self.path is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path)
+        return False
+
+
+def _configure_from_environment():
+    """Enable instrumentation and register output files from the CRDCH_* environment variables."""
+    metrics_path = os.environ.get("CRDCH_METRICS")
+    folded_path = os.environ.get("CRDCH_FLAMEGRAPH")
+    profile_path = os.environ.get("CRDCH_PROFILE")
+
+    if metrics_path or folded_path:
+        enable()
+    if metrics_path:
+        atexit.register(write_metrics, metrics_path)
+    if folded_path:
+        atexit.register(write_folded, folded_path)
+    if profile_path:
+        run_profile = profile(profile_path).__enter__()
+        atexit.register(run_profile.__exit__, None, None, None)
+
+
+_configure_from_environment()
@@ -0,0 +1,32 @@
+#
+# lazy.py - Import heavy dependencies on first use.
+#
+# Importing crdch_model, linkml_runtime, linkml, jsonschema, requests or rdflib takes
+# most of a second or more, which is longer than many short conversion and validation
+# runs need for the actual work. Modules in this directory therefore refer to these
+# dependencies through lazy_import(), and only pay for the ones they actually use.
+#
+
+import importlib
+
+
+class LazyModule:
+    """A stand-in for a module that imports the module the first time one of its attributes is used."""
+
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attr):
+        # This is only called for attributes that haven't been copied over from the
+        # module yet; once the module is imported, lookups never get here.
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(vars(module))
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazily imported module '{self._lazy_name}'>"
+
+
+def lazy_import(name):
+    """Return a stand-in for the module `name`, which will be imported when it is first used."""
+    return LazyModule(name)
@@ -0,0 +1,160 @@
+#
+# normalize.py - Write each Subject and Specimen once, and refer to it by ID elsewhere.
+#
+# The transforms embed a complete Subject in every Diagnosis, and a complete Specimen in
+# every Diagnosis that refers to it, so an entity that several documents share is
+# serialized in every one of them. A Normalizer writes each Subject and Specimen in full
+# where its `id` first appears, and replaces every later copy of it with a reference: an
+# object containing only the entity's `id`. A reference is never larger than the copy
+# it replaces, so normalized output is never larger than nested output.
+#
+# Entities are only matched by their `id`: entities with different IDs are kept apart,
+# even if they share an identifier (as the per-sample source_subject of a Specimen
+# shares the GDC case_id of its case's Subject). A later copy with the same `id` but
+# different contents is not replaced, so that no data is lost, and is reported as a
+# conflict instead.
+#
+# read_denormalized() reverses this for consumers that want the nested form.
+#
+
+import hashlib
+import logging
+
+import yaml
+
+import compression
+import lazy
+import serialize
+
+crdch_model = lazy.lazy_import("crdch_model")
+
+# The CRDC-H classes that are only written once.
+NORMALIZED_CLASSES = ["Subject", "Specimen"]
+
+
+def _digest(entity):
+    # A hash of the complete contents of an entity, including the entities it contains.
+    text = serialize.yaml_document(entity)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class Normalizer:
+    """
+    Replaces the Subjects and Specimens in a stream of documents that have already been
+    written with references. Only a hash of the contents of each entity written is
+    remembered, to tell later copies that differ from it, whose IDs are listed in
+    `conflicts`.
+    """
+
+    def __init__(self, class_names=NORMALIZED_CLASSES):
+        self.classes = tuple(getattr(crdch_model, name) for name in class_names)
+
+        # The ID of every entity written so far -> the digest of its contents.
+        self.written = {}
+        # The IDs of entities written with different contents, in the order found.
+        self.conflicts = []
+
+    def normalize(self, documents):
+        """Return the documents, with every entity that has already been written replaced by a reference."""
+        # The same object can appear more than once, so every entity is hashed before
+        # any of them has its own entities replaced.
+        digests = {}
+        for document in documents:
+            (entry,) = document.values()
+            self._digest_entities(entry["Example"], digests)
+
+        for document in documents:
+            (entry,) = document.values()
+            self._replace(entry["Example"], digests)
+        return documents
+
+    def _digest_entities(self, obj, digests):
+        # Add the digest of every entity referenced (directly or indirectly) from `obj`
+        # to `digests`, by the id() of the entity.
+        for value in vars(obj).values():
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, crdch_model.YAMLRoot):
+                    if isinstance(item, self.classes) and item.id is not None:
+                        if id(item) in digests:
+                            continue
+                        digests[id(item)] = _digest(item)
+                    self._digest_entities(item, digests)
+
+    def _replace(self, obj, digests):
+        # Replace every entity referenced from `obj` that has already been written with
+        # a reference.
+        for (name, value) in vars(obj).items():
+            if isinstance(value, list):
+                for (index, item) in enumerate(value):
+                    value[index] = self._reference(item, digests)
+            else:
+                setattr(obj, name, self._reference(value, digests))
+
+    def _reference(self, value, digests):
+        # Return the value to store in place of `value`.
+        if not isinstance(value, crdch_model.YAMLRoot):
+            return value
+
+        digest = digests.get(id(value))
+        if digest is not None:
+            written = self.written.get(value.id)
+            if written is None:
+                self.written[value.id] = digest
+            elif written == digest:
+                return type(value)(id=value.id)
+            elif value.id not in self.conflicts:
+                self.conflicts.append(value.id)
+                logging.warning(
+                    f"{type(value).__name__} {value.id} is defined more than once "
+                    "with different contents; writing every definition in full"
+                )
+        self._replace(value, digests)
+        return value
+
+
+def _definitions(value, entities):
+    # Add the first definition of every entity in `value` (an object with an `id` and
+    # other fields) to `entities`, by ID.
+    if isinstance(value, dict):
+        if isinstance(value.get("id"), str) and len(value) > 1:
+            entities.setdefault(value["id"], value)
+        for item in value.values():
+            _definitions(item, entities)
+    elif isinstance(value, list):
+        for item in value:
+            _definitions(item, entities)
+
+
+def _resolve(value, entities):
+    # Return a copy of `value` with references replaced by copies of the entities they
+    # refer to.
+    if isinstance(value, dict):
+        if len(value) == 1 and value.get("id") in entities:
+            return _resolve(entities[value["id"]], entities)
+        return {k: _resolve(v, entities) for (k, v) in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, entities) for item in value]
+    return value
+
+
+def denormalize(entries):
+    """
+    Yield the entries (as loaded from YAML) in a normalized stream with every reference
+    (an object containing only an `id`) to an entity defined earlier in the stream, or
+    in the same entry, replaced by a copy of its first definition.
+    """
+    entities = {}
+    for entry in entries:
+        (document,) = entry.values()
+        # Examples themselves are never referred to, so only the objects in them are
+        # remembered.
+        for value in document["Example"].values():
+            _definitions(value, entities)
+        document["Example"] = _resolve(document["Example"], entities)
+        yield entry
+
+
+def read_denormalized(path):
+    """Yield the entries in a normalized YAML file in their nested form."""
+    with compression.open_file(path) as f:
+        yield from denormalize(yaml.load_all(f, Loader=yaml.SafeLoader))
@@ -0,0 +1,197 @@
+#
+# pipeline.py - Run the stages of a conversion at the same time, connected by bounded queues.
+#
+# Converting an export has three stages: reading (or, for CDA, fetching) cases and
+# staging them, converting them (transforming, validating and serializing, possibly in
+# worker processes), and writing the results out. run() overlaps them:
+#
+#   read thread --[queue]--> calling thread (or worker processes) --[queue]--> write thread
+#
+# so that parsing the input, waiting for CDA pages, converting cases and compressing and
+# writing output all happen at once. Every queue holds at most `queue_size` items: a
+# stage that gets ahead of the next one waits until there is room, so no more than a few
+# queues' worth of cases are ever held in memory, however large the input is. Results
+# are written in the order of the input.
+#
+# When instrumentation is enabled (see instrument.py), each stage records the items it
+# handled (`read_items`, `convert_items`, `write_items`), the time it spent working
+# (`read`, `convert`, `write`) and the time it spent waiting for the stages around it
+# (`read_waiting`, ...); throughput() summarizes these per stage. The stage with the
+# lowest throughput and the least waiting is the one holding the others up.
+#
+
+import collections
+import queue
+import threading
+
+import instrument
+
+# The stages of a pipeline, in order.
+STAGES = ["read", "convert", "write"]
+
+# How many items each queue holds by default.
+QUEUE_SIZE = 16
+
+# Marks the end of a queue.
+_DONE = object()
+
+# How often (in seconds) a stage waiting on a queue checks whether the pipeline has
+# been stopped.
+_POLL_SECONDS = 0.1
+
+
+class _Failure:
+    """Carries an exception raised by the read thread to the calling thread."""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _put(items, item, stage, stop):
+    """Put `item` on a queue, waiting for room. Returns False if the pipeline stopped."""
+    with instrument.timer(f"{stage}_waiting"):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+    return False
+
+
+def _get(items, stage, stop):
+    """Take the next item from a queue, or _DONE if the pipeline stopped."""
+    with instrument.timer(f"{stage}_waiting"):
+        while not stop.is_set():
+            try:
+                return items.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+    return _DONE
+
+
+def _read(items, inputs, stop):
+    try:
+        iterator = iter(items)
+        while True:
+            with instrument.timer("read"):
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                break
+            instrument.count("read_items")
+            if not _put(inputs, item, "read", stop):
+                return
+    except BaseException as e:
+        _put(inputs, _Failure(e), "read", stop)
+        return
+    _put(inputs, _DONE, "read", stop)
+
+
+def _write(write_result, results, stop, failures):
+    try:
+        while True:
+            result = _get(results, "write", stop)
+            if result is _DONE:
+                return
+            with instrument.timer("write"):
+                write_result(result)
+            instrument.count("write_items")
+    except BaseException as e:
+        failures.append(e)
+        stop.set()
+
+
+def run(items, convert_item, write_result, executor=None, queue_size=QUEUE_SIZE):
+    """
+    Call `convert_item(*item)` for every tuple of arguments in `items`, and
+    `write_result()` with each result, in order. Items are read in one thread and results
+    are written in another. If `executor` is given (such as a ProcessPoolExecutor),
+    items are converted by submitting them to it, with at most `queue_size` in flight;
+    otherwise they are converted in the calling thread. Exceptions raised while reading,
+    converting or writing stop the pipeline and are raised again here.
+    """
+    inputs = queue.Queue(queue_size)
+    results = queue.Queue(queue_size)
+    stop = threading.Event()
+    write_failures = []
+    threads = [
+        threading.Thread(
+            target=_read, args=(items, inputs, stop), name="read", daemon=True
+        ),
+        threading.Thread(
+            target=_write,
+            args=(write_result, results, stop, write_failures),
+            name="write",
+            daemon=True,
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+
+    pending = collections.deque()
+
+    def converted():
+        """Yield each converted result, in order."""
+        while True:
+            item = _get(inputs, "convert", stop)
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.exception
+
+            if executor is None:
+                with instrument.timer("convert"):
+                    result = convert_item(*item)
+                yield result
+                continue
+
+            pending.append(executor.submit(convert_item, *item))
+            if len(pending) >= queue_size:
+                with instrument.timer("convert"):
+                    result = pending.popleft().result()
+                yield result
+        while pending:
+            with instrument.timer("convert"):
+                result = pending.popleft().result()
+            yield result
+
+    try:
+        for result in converted():
+            instrument.count("convert_items")
+            # This only fails if the write thread has failed; its exception is raised
+            # below.
+            if not _put(results, result, "convert", stop):
+                break
+        else:
+            _put(results, _DONE, "convert", stop)
+    except BaseException:
+        stop.set()
+        for future in pending:
+            future.cancel()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if write_failures:
+        raise write_failures[0]
+
+
+def throughput(recorded):
+    """
+    Summarize the metrics recorded by instrument.metrics() for each stage of a
+    pipeline: the items it handled, the seconds it spent working and waiting, and the
+    items it handled per second of work.
+    """
+    stages = {}
+    for stage in STAGES:
+        items = recorded["counters"].get(f"{stage}_items", 0)
+        seconds = recorded["timers"].get(stage, {}).get("total_seconds", 0.0)
+        waiting = recorded["timers"].get(f"{stage}_waiting", {})
+        stages[stage] = {
+            "items": items,
+            "seconds": seconds,
+            "waiting_seconds": waiting.get("total_seconds", 0.0),
+            "items_per_second": items / seconds if seconds else None,
+        }
+    return stages
@@ -0,0 +1,165 @@
+#
+# prefilter.py - Check the enumerated values in CRDC-H documents before full validation.
+#
+# Most documents that fail validation do so because a transform produced a code that
+# isn't in a value set (such as "Larynx, NOS" instead of "Larynx"). Checking that with
+# the full JSON Schema validator means walking the whole document. Instead, Prefilter
+# compiles, for each CRDC-H class, the paths in a document that are constrained by an
+# `enum` (or `const`) in the JSON Schema, such as `body_site/*/coding/*/code`, along
+# with the set of values allowed there. partition() then collects the values at each
+# path across a whole batch of documents, and looks up each distinct value in the
+# allowed set only once.
+#
+# Only constraints that always apply are compiled: enums under `anyOf` or `oneOf` are
+# skipped, since a value may be allowed by another branch. So a document that passes the
+# prefilter may still fail full validation, but one that fails it is certainly invalid.
+#
+
+import collections
+
+import instrument
+import validate
+
+# Stands for every item of an array in a compiled path.
+ITEMS = "*"
+
+# An out-of-enum value found by the prefilter. It has the same `path` and `message`
+# attributes as a jsonschema.ValidationError.
+EnumError = collections.namedtuple("EnumError", ["path", "message"])
+
+# A path constrained by an enum, the values allowed there (as a set), and the enum
+# itself (in the order given in the schema, for error messages).
+EnumPath = collections.namedtuple("EnumPath", ["path", "allowed", "enum"])
+
+
+def _resolve(json_schema, ref):
+    """Return the subschema a local `$ref` (such as `#/$defs/Subject`) points to, or None."""
+    if not ref.startswith("#"):
+        return None
+    schema = json_schema
+    for part in ref[1:].split("/")[1:]:
+        part = part.replace("~1", "/").replace("~0", "~")
+        if not isinstance(schema, dict) or part not in schema:
+            return None
+        schema = schema[part]
+    return schema
+
+
+def _enum_paths(json_schema, schema, path, refs):
+    """Yield an EnumPath for every enum that always applies within `schema`."""
+    if not isinstance(schema, dict):
+        return
+
+    ref = schema.get("$ref")
+    if ref is not None:
+        # In Draft 7, the other keywords next to a $ref are ignored. We stop at
+        # references we are already following, since the schema may be recursive.
+        if ref not in refs:
+            target = _resolve(json_schema, ref)
+            yield from _enum_paths(json_schema, target, path, refs | {ref})
+        return
+
+    enum = schema.get("enum")
+    if enum is None and "const" in schema:
+        enum = [schema["const"]]
+    if enum is not None:
+        try:
+            yield EnumPath(path, frozenset(enum), list(enum))
+        except TypeError:
+            # The enum has objects or arrays in it, which only the validator compares.
+            pass
+
+    for (name, subschema) in schema.get("properties", {}).items():
+        yield from _enum_paths(json_schema, subschema, path + (name,), refs)
+    if isinstance(schema.get("items"), dict):
+        yield from _enum_paths(json_schema, schema["items"], path + (ITEMS,), refs)
+    for subschema in schema.get("allOf", []):
+        yield from _enum_paths(json_schema, subschema, path, refs)
+
+
+def compile_enum_paths(json_schema, class_name):
+    """Return an EnumPath for every enum that applies to instances of a CRDC-H class."""
+    schema = json_schema["$defs"][class_name]
+    refs = frozenset([f"#/$defs/{class_name}"])
+    return list(_enum_paths(json_schema, schema, (), refs))
+
+
+def _values_at(instance, path, location=()):
+    """Yield a (location, value) pair for every value in `instance` at a compiled path."""
+    if not path:
+        yield (location, instance)
+        return
+    (head, rest) = (path[0], path[1:])
+    if head == ITEMS:
+        if isinstance(instance, list):
+            for (i, item) in enumerate(instance):
+                yield from _values_at(item, rest, location + (i,))
+    elif isinstance(instance, dict) and head in instance:
+        yield from _values_at(instance[head], rest, location + (head,))
+
+
+class Prefilter:
+    """Checks the enumerated values in documents against a CRDC-H JSON Schema."""
+
+    def __init__(self, json_schema):
+        self.json_schema = json_schema
+        self.enum_paths_by_class = {}
+
+    def enum_paths(self, class_name):
+        """Return the compiled EnumPaths for a CRDC-H class."""
+        enum_paths = self.enum_paths_by_class.get(class_name)
+        if enum_paths is None:
+            enum_paths = compile_enum_paths(self.json_schema, class_name)
+            self.enum_paths_by_class[class_name] = enum_paths
+        return enum_paths
+
+    def iter_errors(self, entry):
+        """Yield a (key, EnumError) pair for every out-of-enum value in a single document."""
+        (_, failed) = self.partition([entry])
+        for (_, errors) in failed:
+            yield from errors
+
+    def partition(self, entries):
+        """
+        Check a batch of documents. Returns a list of the documents that passed, and a
+        list of (document, errors) pairs for those that failed, where errors is a list
+        of (key, EnumError) pairs. Documents whose keys don't indicate a CRDC-H class are
+        passed on for the validator to report.
+        """
+        # (class name, path index) -> value -> [(entry index, location)]
+        occurrences = collections.defaultdict(lambda: collections.defaultdict(list))
+        for (i, entry) in enumerate(entries):
+            class_name = validate.class_name_for_key(next(iter(entry)))
+            if class_name is None:
+                continue
+            example = next(iter(entry.values()))["Example"]
+            for (j, enum_path) in enumerate(self.enum_paths(class_name)):
+                values = occurrences[(class_name, j)]
+                for (location, value) in _values_at(example, enum_path.path):
+                    try:
+                        values[value].append((i, location))
+                    except TypeError:
+                        # Objects and arrays are left for the validator to report.
+                        pass
+
+        errors_by_entry = collections.defaultdict(list)
+        for ((class_name, j), values) in occurrences.items():
+            enum_path = self.enum_paths(class_name)[j]
+            for value in values:
+                if value in enum_path.allowed:
+                    continue
+                message = f"{value!r} is not one of {enum_path.enum!r}"
+                for (i, location) in values[value]:
+                    key = next(iter(entries[i]))
+                    errors_by_entry[i].append((key, EnumError(list(location), message)))
+
+        passed = []
+        failed = []
+        for (i, entry) in enumerate(entries):
+            if i in errors_by_entry:
+                failed.append((entry, errors_by_entry[i]))
+            else:
+                passed.append(entry)
+        instrument.count("prefiltered_documents", len(entries))
+        instrument.count("prefilter_failures", len(failed))
+        return (passed, failed)
@@ -0,0 +1,127 @@
+#
+# serialize.py - Write CRDC-H instance data as YAML, JSON-LD or Turtle one document
+# at a time, so that conversions don't need to hold their entire output in memory.
+#
+
+import json
+
+import yaml
+
+import lazy
+
+jsonldcontextgen = lazy.lazy_import("linkml.generators.jsonldcontextgen")
+dumpers = lazy.lazy_import("linkml_runtime.dumpers")
+rdflib = lazy.lazy_import("rdflib")
+
+# The URI where the CRDCH YAML file used to generate the JSON-LD context is located.
+CRDCH_YAML_URI = "https://raw.githubusercontent.com/cancerDHC/ccdhmodel/v1.1/model/schema/crdch_model.yaml"
+
+# The output formats we support.
+FORMATS = ["yaml", "jsonld", "ttl"]
+
+
+def jsonld_context(schema_uri=CRDCH_YAML_URI):
+    """Generate the JSON-LD context for a CRDC-H LinkML schema as a dictionary."""
+    return json.loads(jsonldcontextgen.ContextGenerator(schema_uri).serialize())
+
+
+def yaml_document(document):
+    """Serialize a single document in the format used by our instance data YAML files."""
+    return yaml.dump(document, Dumper=yaml.SafeDumper, sort_keys=False)
+
+
+def jsonld_element(example):
+    """Serialize a single CRDC-H object as an element of a JSON-LD @graph."""
+    return dumpers.json_dumper.dumps(example)
+
+
+def turtle(examples, context):
+    """Serialize a list of CRDC-H objects as a self-contained Turtle document."""
+    elements = [jsonld_element(example) for example in examples]
+    return turtle_from_elements(elements, context)
+
+
+def turtle_from_elements(elements, context):
+    """Serialize a list of JSON-LD @graph elements (as produced by jsonld_element()) as a self-contained Turtle document."""
+    as_json_str = json.dumps(
+        {"@context": context, "@graph": [json.loads(element) for element in elements]}
+    )
+    g = rdflib.Graph()
+    g.parse(data=as_json_str, format="json-ld")
+    return g.serialize(format="turtle").decode()
+
+
+class YAMLStreamWriter:
+    """
+    Writes YAML documents (as produced by yaml_document()) to a file as a single YAML
+    stream, producing the same output as yaml.dump_all().
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+
+    def write(self, text):
+        if not self.first:
+            self.f.write("---\n")
+        self.f.write(text)
+        self.first = False
+
+    def close(self):
+        pass
+
+
+class JSONLDStreamWriter:
+    """Writes JSON-LD @graph elements (as produced by jsonld_element()) to a file as a single JSON-LD document."""
+
+    def __init__(self, f, context):
+        self.f = f
+        self.first = True
+        self.f.write('{\n"@context": ')
+        json.dump(context, self.f)
+        self.f.write(',\n"@graph": [\n')
+
+    def write(self, text):
+        if not self.first:
+            self.f.write(",\n")
+        self.f.write(text)
+        self.first = False
+
+    def close(self):
+        self.f.write("\n]\n}\n")
+
+
+class TurtleStreamWriter:
+    """
+    Writes Turtle documents (as produced by turtle()) to a file as a single Turtle
+    document. Each document starts with the prefixes it uses, and each prefix is only
+    written out the first time it is declared.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.prefixes = set()
+
+    def write(self, text):
+        lines = text.splitlines(keepends=True)
+        i = 0
+        while i < len(lines) and lines[i].startswith("@prefix "):
+            if lines[i] not in self.prefixes:
+                self.prefixes.add(lines[i])
+                self.f.write(lines[i])
+            i += 1
+        self.f.write("".join(lines[i:]))
+
+    def close(self):
+        pass
+
+
+def stream_writer(output_format, f, context=None):
+    """Return a stream writer for one of FORMATS."""
+    if output_format == "yaml":
+        return YAMLStreamWriter(f)
+    if output_format == "jsonld":
+        return JSONLDStreamWriter(f, context)
+    if output_format == "ttl":
+        return TurtleStreamWriter(f)
+    raise ValueError(f"Unknown output format: {output_format}")
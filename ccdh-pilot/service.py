@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+#
+# service.py - Convert and validate case exports as they land in a directory.
+#
+# Every convert.py run imports crdch_model, loads the JSON Schema, generates the JSON-LD
+# context and compiles the validators before converting a single case, which takes far
+# longer than converting a small export. This keeps all of that in memory instead: a
+# ConversionService sets up one convert.Job per source once, and a DirectoryWatcher
+# polls an input directory for new exports, which are converted and validated as soon
+# as they have finished being written. For example:
+#
+#   python ccdh-pilot/service.py --watch incoming/ --out converted/ --format yaml
+#
+# The source of each export is taken from the start of its file name (such as
+# `gdc-delta-0001.json.gz` or `pdc_cases.tsv`), or is --source otherwise. Each export is
+# written to a file in the output directory named after the whole name of the export,
+# with the extension of the output format added (`gdc-delta-0001.json.gz.yaml`), so that
+# exports that only differ in their extensions (`gdc-1.json` and `gdc-1.tsv.gz`) are
+# never written to the same file. The output only appears once it is complete. An
+# export that can't be read or converted is logged and skipped, without stopping the
+# service. With --once, the exports already in the directory are converted and the
+# service exits, with the same exit codes as convert.py.
+#
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import cda
+import convert
+import instrument
+import normalize
+import serialize
+import sources
+import transform
+import validate
+
+# The extension of the files written for each output format.
+EXTENSIONS = {"yaml": ".yaml", "jsonld": ".jsonld", "ttl": ".ttl"}
+
+# How often to look for new exports, in seconds.
+POLL_INTERVAL = 1.0
+
+
+def source_for(path, default=None):
+    """Return the source named at the start of an export's file name (such as "gdc"), or `default`."""
+    name = os.path.basename(str(path)).lower()
+    for source in sorted(convert.TRANSFORMS):
+        rest = name[len(source) :]
+        if name.startswith(source) and not rest[:1].isalnum():
+            return source
+    return default
+
+
+def output_name(path, output_format):
+    """Return the name of the file an export is converted into (e.g. "gdc-1.json.gz.yaml" for "gdc-1.json.gz")."""
+    return os.path.basename(str(path)) + EXTENSIONS[output_format]
+
+
+class ConversionService:
+    """
+    Converts and validates case exports into `output_dir`, reusing the same conversion
+    job (with its compiled validators and JSON-LD context) for every export of a source.
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        output_format="yaml",
+        json_schema=None,
+        context=None,
+        normalized=False,
+        ids="positional",
+        queue_size=None,
+    ):
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.json_schema = json_schema
+        self.context = context
+        self.normalized = normalized
+        self.ids = ids
+        self.queue_size = queue_size
+        self.jobs = {}
+
+    def job(self, source):
+        """Return the conversion job for a source, setting it up the first time."""
+        job = self.jobs.get(source)
+        if job is None:
+            with instrument.timer("start_job"):
+                job = convert.Job(
+                    source,
+                    self.output_format,
+                    self.json_schema,
+                    self.context,
+                    False,
+                    self.ids,
+                )
+                job.warm_up()
+            self.jobs[source] = job
+        return job
+
+    def warm_up(self, source_names=None):
+        """Set up the conversion jobs for some (by default, all) sources before any export arrives."""
+        for source in source_names or sorted(convert.TRANSFORMS):
+            self.job(source)
+
+    def convert_file(self, path, source):
+        """
+        Convert and validate a single export from `source`, and write it to the output
+        directory. Returns the path written to and the number of validation errors.
+        """
+        started = time.perf_counter()
+        job = self.job(source)
+        # Normalized output only refers to entities written in the same file, so the
+        # entities written for previous exports are forgotten.
+        job.normalizer = normalize.Normalizer() if self.normalized else None
+
+        cases = sources.read_cases(str(path))
+        if source == "cda":
+            cases = cda.unique_subjects(cases)
+        cases = (job.transform.stage_case(case) for case in cases)
+
+        output_path = os.path.join(
+            self.output_dir, output_name(path, self.output_format)
+        )
+        # Write to a temporary file first, so the output never appears half-written.
+        (fd, temporary_path) = tempfile.mkstemp(
+            prefix=".", suffix=".tmp", dir=self.output_dir
+        )
+        try:
+            with os.fdopen(fd, "w") as output:
+                writer = serialize.stream_writer(
+                    self.output_format, output, self.context
+                )
+                error_count = convert.convert(
+                    cases, writer, None, queue_size=self.queue_size, job=job
+                )
+                writer.close()
+            os.replace(temporary_path, output_path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logging.info(
+            f"Converted {path} to {output_path} in {elapsed_ms:.0f} ms "
+            f"with {error_count} validation errors"
+        )
+        return (output_path, error_count)
+
+
+class DirectoryWatcher:
+    """
+    Finds new files in a directory by polling it. A file is only reported once its size
+    and modification time are the same in two polls in a row, so that exports are not
+    read while they are still being written, and each file is only reported once.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # File name -> (size, modification time) when it was last polled.
+        self.pending = {}
+        self.seen = set()
+
+    def poll(self):
+        """Return the paths of the files that have been completely written since the last poll, by name."""
+        ready = []
+        pending = {}
+        for entry in sorted(os.scandir(self.directory), key=lambda e: e.name):
+            if entry.name in self.seen or entry.name.startswith("."):
+                continue
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self.pending.get(entry.name) == signature:
+                ready.append(entry.path)
+                self.seen.add(entry.name)
+            else:
+                pending[entry.name] = signature
+        self.pending = pending
+        return ready
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert and validate case exports as they land in a directory."
+    )
+    parser.add_argument(
+        "--watch", required=True, help="directory to look for new case exports in"
+    )
+    parser.add_argument(
+        "--out",
+        dest="output",
+        required=True,
+        help="directory to write converted data to",
+    )
+    parser.add_argument(
+        "--source",
+        choices=sorted(convert.TRANSFORMS),
+        help="source of exports whose file names don't start with gdc, pdc or cda",
+    )
+    parser.add_argument(
+        "--format", choices=serialize.FORMATS, default="yaml", help="output format"
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=POLL_INTERVAL,
+        help="number of seconds between looking for new exports",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="convert the exports already in the directory, then exit",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        help="number of cases to hold between reading, converting and writing",
+    )
+    parser.add_argument(
+        "--schema",
+        default=validate.JSON_SCHEMA_URL,
+        help="URL or path of the CRDC-H JSON Schema to validate against",
+    )
+    parser.add_argument(
+        "--no-validate", action="store_true", help="don't validate converted data"
+    )
+    parser.add_argument(
+        "--context",
+        default=serialize.CRDCH_YAML_URI,
+        help="URL or path of the CRDC-H LinkML schema to generate the JSON-LD context from",
+    )
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="write each Subject and Specimen once, and refer to it by ID elsewhere",
+    )
+    parser.add_argument(
+        "--ids",
+        choices=transform.ID_SCHEMES,
+        default=transform.id_scheme_from_environment(),
+        help="identify objects by their position in the input (positional) or by their "
+        "source identifiers (stable)",
+    )
+    parser.add_argument("--metrics", help="write timings to this JSON file on exit")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.metrics:
+        instrument.enable()
+
+    os.makedirs(args.output, exist_ok=True)
+    json_schema = None
+    if not args.no_validate:
+        with instrument.timer("load_schema"):
+            json_schema = validate.load_json_schema(args.schema)
+    context = None
+    if args.format != "yaml":
+        with instrument.timer("jsonld_context"):
+            context = serialize.jsonld_context(args.context)
+    service = ConversionService(
+        args.output,
+        args.format,
+        json_schema,
+        context,
+        args.normalize,
+        args.ids,
+        args.queue_size,
+    )
+    service.warm_up([args.source] if args.source else None)
+    logging.info(f"Watching {args.watch} for case exports")
+
+    watcher = DirectoryWatcher(args.watch)
+    error_count = 0
+    failed = False
+    try:
+        # A first poll records the files already there, which the next reports.
+        watcher.poll()
+        while True:
+            if not args.once:
+                time.sleep(args.poll)
+            for path in watcher.poll():
+                source = source_for(path, args.source)
+                if source is None:
+                    logging.warning(
+                        f"Skipping {path}: can't tell which source it is from"
+                    )
+                    continue
+                try:
+                    error_count += service.convert_file(path, source)[1]
+                except Exception:
+                    logging.exception(f"Could not convert {path}")
+                    failed = True
+            if args.once:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.metrics:
+            instrument.write_metrics(args.metrics)
+
+    return 1 if error_count > 0 or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#
+# sharding.py - Write converted YAML documents into size-bounded shards.
+#
+# A ShardedWriter writes documents (as produced by serialize.yaml_document()) to a series
+# of YAML files, moving on to a new one once the current one holds a given number of
+# documents or bytes. For `imported-node-data/gdc-head-and-mouth.yaml`, the shards are
+# `gdc-head-and-mouth-00000.yaml`, `gdc-head-and-mouth-00001.yaml` and so on, and they
+# are listed, with their document counts, sizes and first and last document keys, in
+# `gdc-head-and-mouth.manifest.json`:
+#
+#   {"format": "yaml", "complete": true, "documents": 560, "shards": [
+#     {"path": "gdc-head-and-mouth-00000.yaml", "documents": 100, "bytes": ...,
+#      "first_key": "..._case_0_diagnosis_0_diagnosis", "last_key": "..."}, ...]}
+#
+# The manifest is rewritten whenever a shard is finished, so shards can be validated or
+# loaded while the rest are still being written, and `complete` is only true once every
+# shard has been written. Each shard is a YAML stream of its own, so shards can be
+# processed in parallel and retried one at a time; normalized output (see normalize.py)
+# must be read in manifest order, since entities are only written in full in the first
+# shard that refers to them.
+#
+# The demonstrators write a single file unless the CRDCH_SHARD_DOCUMENTS or
+# CRDCH_SHARD_BYTES environment variables are set. Writing either layout removes the
+# files of the other (the single file, or the shards and their manifest), so that
+# switching between them doesn't leave stale output behind for test_validate_all.py.
+#
+
+import json
+import os
+
+import yaml
+
+import compression
+import serialize
+
+# The suffix of manifest files.
+MANIFEST_SUFFIX = ".manifest.json"
+
+# The separator between documents in a YAML stream.
+SEPARATOR = "---\n"
+
+
+def _split_path(path):
+    """Split an output path into its stem and extensions (e.g. "a/b", ".yaml.gz")."""
+    path = str(path)
+    stripped = compression.strip_extension(path)
+    (stem, extension) = os.path.splitext(stripped)
+    return (stem, extension + path[len(stripped) :])
+
+
+def manifest_path(path):
+    """Return the path of the manifest for sharded output written to `path`."""
+    return _split_path(path)[0] + MANIFEST_SUFFIX
+
+
+def document_key(text):
+    # Every document is a dictionary with a single key, which is on the first line.
+    return text.split(":", 1)[0]
+
+
+class ShardedWriter:
+    """
+    Writes YAML documents to shards of at most `max_documents` documents and (unless a
+    single document is larger) `max_bytes` bytes each, and lists them in a manifest. Shards
+    are compressed if `path` ends in a compression extension.
+    """
+
+    def __init__(self, path, max_documents=None, max_bytes=None, level=None):
+        (self.stem, self.extension) = _split_path(path)
+        self.manifest_path = self.stem + MANIFEST_SUFFIX
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.level = level
+        self.shards = []
+        self.f = None
+        # Remove the output of any previous run, sharded or not.
+        remove_shards(self.manifest_path)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, text, key=None):
+        size = len(text.encode("utf-8"))
+        shard = self.shards[-1] if self.f is not None else None
+        if shard is not None and (
+            (self.max_documents and shard["documents"] >= self.max_documents)
+            or (
+                self.max_bytes
+                and shard["bytes"] + len(SEPARATOR) + size > self.max_bytes
+            )
+        ):
+            self._finish_shard()
+            shard = None
+
+        if shard is None:
+            shard = self._start_shard()
+        else:
+            self.f.write(SEPARATOR)
+            shard["bytes"] += len(SEPARATOR)
+
+        self.f.write(text)
+        key = key or document_key(text)
+        if shard["first_key"] is None:
+            shard["first_key"] = key
+        shard["last_key"] = key
+        shard["documents"] += 1
+        shard["bytes"] += size
+
+    def _start_shard(self):
+        path = f"{self.stem}-{len(self.shards):05d}{self.extension}"
+        self.f = compression.open_file(path, "w", self.level)
+        shard = {
+            "path": os.path.basename(path),
+            "documents": 0,
+            "bytes": 0,
+            "first_key": None,
+            "last_key": None,
+        }
+        self.shards.append(shard)
+        return shard
+
+    def _finish_shard(self, complete=False):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        self._write_manifest(complete)
+
+    def _write_manifest(self, complete):
+        manifest = {
+            "format": "yaml",
+            "complete": complete,
+            "documents": sum(shard["documents"] for shard in self.shards),
+            "shards": self.shards,
+        }
+        # Replace the manifest in one go, so that readers never see half of it.
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+        os.replace(temporary_path, self.manifest_path)
+
+    def close(self):
+        self._finish_shard(complete=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.f is not None:
+            self.f.close()
+
+
+def read_manifest(path):
+    """Read a manifest, adding the full path of each shard as `full_path`."""
+    with open(path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(path)
+    for shard in manifest["shards"]:
+        shard["full_path"] = os.path.join(directory, shard["path"])
+    return manifest
+
+
+def remove_shards(path):
+    """Remove the shards listed in a manifest, and the manifest, if it exists."""
+    if not os.path.exists(path):
+        return
+    for shard in read_manifest(path)["shards"]:
+        if os.path.exists(shard["full_path"]):
+            os.remove(shard["full_path"])
+    os.remove(path)
+
+
+def iter_documents(path):
+    """Yield every document in the shards listed in a manifest, in order."""
+    manifest = read_manifest(path)
+    if not manifest["complete"]:
+        raise ValueError(f"{path} lists the shards of incomplete output")
+    for shard in manifest["shards"]:
+        with compression.open_file(shard["full_path"]) as f:
+            yield from yaml.load_all(f, Loader=yaml.SafeLoader)
+
+
+def from_environment():
+    """
+    Return the (maximum documents, maximum bytes) per shard configured by the
+    CRDCH_SHARD_DOCUMENTS and CRDCH_SHARD_BYTES environment variables. Both are None if
+    output should not be sharded.
+    """
+    limits = []
+    for name in ["CRDCH_SHARD_DOCUMENTS", "CRDCH_SHARD_BYTES"]:
+        value = os.environ.get(name)
+        limits.append(int(value) if value else None)
+    return tuple(limits)
+
+
+def dump_all(documents, path):
+    """
+    Write the documents a demonstrator produces to `path` like yaml.dump_all(), or to
+    shards of it if sharding is configured by the environment (see from_environment()).
+    Output is compressed as configured by the environment too (see compression.py).
+    """
+    write_all((serialize.yaml_document(document) for document in documents), path)
+
+
+def write_all(texts, path):
+    """Like dump_all(), but for documents that have already been serialized by serialize.yaml_document()."""
+    (max_documents, max_bytes) = from_environment()
+    (path, level) = compression.output_path(path)
+    if max_documents is None and max_bytes is None:
+        remove_shards(manifest_path(path))
+        with compression.open_file(path, "w", level) as f:
+            writer = serialize.YAMLStreamWriter(f)
+            for text in texts:
+                writer.write(text)
+            writer.close()
+        return
+
+    with ShardedWriter(path, max_documents, max_bytes, level) as writer:
+        for text in texts:
+            writer.write(text)
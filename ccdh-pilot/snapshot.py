@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+#
+# snapshot.py - Parse JSON case exports once, and reuse the parsed cases until they change.
+#
+# The tests and the notebooks all read head-and-mouth/gdc-head-and-mouth.json and
+# pdc-head-and-mouth.json, and parsing their JSON again on every run takes much longer
+# than the transforms themselves. load() parses an export once and pickles the result
+# into a snapshot next to it (gdc-head-and-mouth.json.snapshot), which is much faster
+# to read back.
+#
+# The snapshot records the size, modification time and SHA-256 hash of the export. If
+# the size or modification time has changed, the export is hashed again, and it is only
+# parsed again if its contents have changed too. Set the CRDCH_SNAPSHOTS environment
+# variable to "off" to always parse exports.
+#
+# Within pytest, the gdc_head_and_mouth and pdc_head_and_mouth fixtures (see
+# conftest.py) load each export once per session. To snapshot an export ahead of time:
+#
+#   python ccdh-pilot/snapshot.py head-and-mouth/gdc-head-and-mouth.json
+#
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+import compression
+import instrument
+
+# The suffix added to the name of an export to name its snapshot.
+SNAPSHOT_SUFFIX = ".snapshot"
+
+# The version of the snapshot format, which is bumped whenever it changes.
+SNAPSHOT_VERSION = 1
+
+# The exports in this repository, relative to its root directory.
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+GDC_HEAD_AND_MOUTH = os.path.join(_ROOT, "head-and-mouth", "gdc-head-and-mouth.json")
+PDC_HEAD_AND_MOUTH = os.path.join(_ROOT, "head-and-mouth", "pdc-head-and-mouth.json")
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def enabled():
+    """Return whether snapshots are enabled (by the CRDCH_SNAPSHOTS environment variable)."""
+    return os.environ.get("CRDCH_SNAPSHOTS", "on") != "off"
+
+
+def _read_snapshot(path, snapshot_path):
+    """Return the data in the snapshot of `path`, or None if it is missing or out of date."""
+    try:
+        f = open(snapshot_path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        try:
+            header = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError):
+            return None
+        if header.get("version") != SNAPSHOT_VERSION:
+            return None
+
+        stat = _stat(path)
+        if header["stat"] != stat:
+            # The export has been touched, but may not have changed.
+            if header["sha256"] != _hash(path):
+                return None
+            header["stat"] = stat
+            data = pickle.load(f)
+            _write_snapshot(snapshot_path, header, data)
+            return data
+
+        return pickle.load(f)
+
+
+def _write_snapshot(snapshot_path, header, data):
+    # Write the snapshot to a temporary file first, so that it is never seen half-written.
+    temporary_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, snapshot_path)
+    except OSError:
+        # We can't write next to the export, so we'll just parse it again next time.
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def build_snapshot(path, snapshot_path=None):
+    """
+    Parse the (possibly compressed) JSON export at `path`, write it to `snapshot_path`
+    (by default, the export's name plus SNAPSHOT_SUFFIX) and return the parsed data.
+    """
+    if snapshot_path is None:
+        snapshot_path = str(path) + SNAPSHOT_SUFFIX
+
+    # Hash the export before parsing it, so that a change made while we are parsing it
+    # makes the snapshot out of date rather than wrong.
+    header = {"version": SNAPSHOT_VERSION, "stat": _stat(path), "sha256": _hash(path)}
+    with instrument.timer("parse_json"):
+        with compression.open_file(path) as f:
+            data = json.load(f)
+    _write_snapshot(snapshot_path, header, data)
+    return data
+
+
+def load(path):
+    """
+    Return the parsed contents of the (possibly compressed) JSON export at `path`, from
+    its snapshot if it is up to date, or by parsing it and snapshotting it otherwise.
+    """
+    path = str(path)
+    if not enabled():
+        with instrument.timer("parse_json"), compression.open_file(path) as f:
+            return json.load(f)
+
+    with instrument.timer("load_snapshot"):
+        data = _read_snapshot(path, path + SNAPSHOT_SUFFIX)
+    if data is not None:
+        instrument.count("snapshot_hits")
+        return data
+    instrument.count("snapshot_misses")
+    return build_snapshot(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot parsed JSON case exports.")
+    parser.add_argument("exports", nargs="+", help="JSON case exports to snapshot")
+    args = parser.parse_args(argv)
+    for path in args.exports:
+        data = load(path)
+        print(f"{path}{SNAPSHOT_SUFFIX}: {len(data)} cases")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
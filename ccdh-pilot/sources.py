@@ -0,0 +1,408 @@
+#
+# sources.py - Read source data exports (such as the GDC and PDC case exports in
+# head-and-mouth/) one case at a time.
+#
+# Cases can be read from JSON exports, from GDC's flattened TSV exports (such as
+# cptac2-subject-09CO022/gdc_subject_09CO022.tsv), which have one row per case and a
+# column for every field, named by its path (e.g. `diagnoses.0.age_at_diagnosis`), or
+# from GDC's XML exports (such as cptac2-subject-09CO022/gdc_subject_09CO022.xml). Cases
+# read from TSV or XML are rebuilt into the same nested form as cases read from JSON.
+#
+
+import csv
+import itertools
+import json
+import sys
+import xml.etree.ElementTree as ElementTree
+
+import compression
+
+# How many characters to read from a file at a time.
+CHUNK_SIZE = 1 << 16
+
+# The formats we can read cases from.
+FORMATS = ["json", "tsv", "xml"]
+
+# GDC fields that are numbers or booleans in JSON exports. Everything in a TSV or XML
+# export is a string, so we convert these back when reading them.
+NUMERIC_FIELDS = frozenset(
+    [
+        "age_at_diagnosis",
+        "age_at_index",
+        "current_weight",
+        "days_to_best_overall_response",
+        "days_to_birth",
+        "days_to_collection",
+        "days_to_death",
+        "days_to_diagnosis",
+        "days_to_last_follow_up",
+        "days_to_last_known_disease_status",
+        "days_to_lost_to_followup",
+        "days_to_recurrence",
+        "days_to_sample_procurement",
+        "initial_weight",
+        "intermediate_dimension",
+        "longest_dimension",
+        "shortest_dimension",
+        "time_between_clamping_and_freezing",
+        "time_between_excision_and_freezing",
+        "year_of_birth",
+        "year_of_death",
+        "year_of_diagnosis",
+    ]
+)
+BOOLEAN_FIELDS = frozenset(["is_ffpe"])
+
+
+def iter_json_array_spans(f, chunk_size=CHUNK_SIZE):
+    """
+    Yield (element, start, end) for each element of the top-level JSON array in the text
+    file `f`, where `start` and `end` are the offsets (in characters) of the element in
+    the file, without reading the entire file into memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size)
+    # The offset in the file of the start of the buffer.
+    offset = 0
+    pos = 0
+    eof = buffer == ""
+
+    def skip(pos, characters):
+        # Skip over any of `characters`, reading more of the file if we run out.
+        nonlocal buffer, offset, eof
+        while True:
+            while pos < len(buffer) and buffer[pos] in characters:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return pos
+            offset += len(buffer)
+            buffer = f.read(chunk_size)
+            pos = 0
+            eof = buffer == ""
+
+    pos = skip(pos, " \t\r\n")
+    if pos >= len(buffer) or buffer[pos] != "[":
+        raise ValueError("Expected a JSON array at the start of the file")
+    pos += 1
+
+    while True:
+        pos = skip(pos, " \t\r\n,")
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of file inside a JSON array")
+        if buffer[pos] == "]":
+            return
+
+        # Try to decode the next element. If it runs past the end of the buffer, read
+        # at least as much again as we already have, so that a single large element
+        # is only re-parsed a logarithmic number of times.
+        while True:
+            try:
+                (element, end) = decoder.raw_decode(buffer, pos)
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            more = f.read(max(chunk_size, len(buffer) - pos))
+            eof = more == ""
+            buffer = buffer[pos:] + more
+            offset += pos
+            pos = 0
+
+        yield (element, offset + pos, offset + end)
+        pos = end
+
+        # Drop the part of the buffer we've already consumed.
+        if pos > chunk_size:
+            buffer = buffer[pos:]
+            offset += pos
+            pos = 0
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of the top-level JSON array in the text file `f` one at a time,
+    without reading the entire file into memory.
+    """
+    for (element, _, _) in iter_json_array_spans(f, chunk_size):
+        yield element
+
+
+class _Unread:
+    """A text file with some text that has already been read from it put back in front."""
+
+    def __init__(self, text, f):
+        self.text = text
+        self.f = f
+
+    def read(self, size=-1):
+        (text, self.text) = (self.text, "")
+        if size < 0:
+            return text + self.f.read()
+        return text + self.f.read(max(size - len(text), 0))
+
+
+def iter_json_cases(f, chunk_size=CHUNK_SIZE):
+    """
+    Yield the cases in a JSON export: the elements of its top-level array or, if it
+    contains a single object (such as a single saved CDA record), that object.
+    """
+    start = f.read(1)
+    while start.isspace():
+        start = f.read(1)
+    if start == "{":
+        yield json.loads(start + f.read())
+        return
+    yield from iter_json_array(_Unread(start, f), chunk_size)
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+def _boolean(text):
+    return {"true": True, "false": False}.get(text.lower(), text)
+
+
+def _converter(name):
+    # Return the function that converts a string value of the field `name` back to the
+    # type it has in JSON exports, or None if it is a string.
+    if name in NUMERIC_FIELDS:
+        return _number
+    if name in BOOLEAN_FIELDS:
+        return _boolean
+    return None
+
+
+def _is_empty(value):
+    # Whether a value rebuilt from a row is entirely empty, i.e. the row has no entry
+    # at this index of a list.
+    if isinstance(value, dict):
+        return all(_is_empty(v) for v in value.values())
+    return value is None or value == []
+
+
+def _compile(node, name):
+    # Compile a node of the header tree into a function that builds its value from a
+    # row. A node is either a column index, or a dictionary from keys (or list indexes)
+    # to nodes.
+    if isinstance(node, int):
+        column = node
+        convert = _converter(name)
+
+        def build_value(row):
+            text = row[column]
+            if text == "":
+                return None
+            return convert(text) if convert else text
+
+        return build_value
+
+    if all(isinstance(key, int) for key in node):
+        items = [_compile(node[index], name) for index in sorted(node)]
+
+        def build_list(row):
+            values = (item(row) for item in items)
+            return [value for value in values if not _is_empty(value)]
+
+        return build_list
+
+    fields = [(key, _compile(child, key)) for (key, child) in node.items()]
+
+    def build_dict(row):
+        return {key: build(row) for (key, build) in fields}
+
+    return build_dict
+
+
+def compile_tsv_header(header):
+    """
+    Compile the header row of a flattened TSV export into a function that rebuilds a
+    nested case from a row.
+    """
+    tree = {}
+    for (column, name) in enumerate(header):
+        node = tree
+        path = [int(part) if part.isdigit() else part for part in name.split(".")]
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+            if not isinstance(node, dict):
+                raise ValueError(f"Column {name} conflicts with an earlier column")
+        if path[-1] in node:
+            raise ValueError(f"Column {name} conflicts with an earlier column")
+        node[path[-1]] = column
+
+    build = _compile(tree, None)
+    width = len(header)
+
+    def build_case(row):
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        return build(row)
+
+    return build_case
+
+
+def iter_tsv_cases(f):
+    """Yield the cases in the flattened TSV text file `f` one at a time."""
+    rows = csv.reader(f, delimiter="\t")
+    header = next(rows, None)
+    if header is None:
+        return
+    build_case = compile_tsv_header(header)
+    for row in rows:
+        if row:
+            yield build_case(row)
+
+
+def _xml_value(element, name):
+    # Convert an element of a GDC XML export into the value it has in JSON exports. Lists
+    # are elements whose children are all <item>s, and empty elements are None.
+    children = list(element)
+    if not children:
+        if element.text is None:
+            return None
+        convert = _converter(name)
+        return convert(element.text) if convert else element.text
+    if all(child.tag == "item" for child in children):
+        return [_xml_value(child, name) for child in children]
+    return {child.tag: _xml_value(child, child.tag) for child in children}
+
+
+def _iter_xml_events(f, chunk_size):
+    # Yield (event, element) pairs from incrementally parsing the text file `f`.
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        parser.feed(data)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+# The path to the elements for cases in a GDC XML export.
+XML_CASE_PATH = ("response", "data", "hits", "item")
+
+
+def iter_xml_cases(f, chunk_size=CHUNK_SIZE):
+    """
+    Yield the cases in the GDC XML export in the text file `f` one at a time. Each case
+    is discarded once it has been converted, so only one case is held in memory.
+    """
+    depth = len(XML_CASE_PATH)
+    stack = []
+    for (event, element) in _iter_xml_events(f, chunk_size):
+        if event == "start":
+            stack.append(element)
+            continue
+
+        stack.pop()
+        if len(stack) == depth - 1 and (
+            tuple(e.tag for e in stack) + (element.tag,) == XML_CASE_PATH
+        ):
+            yield _xml_value(element, None)
+
+        # Discard cases and anything outside them as soon as they end. Elements inside
+        # a case are discarded along with the case.
+        if len(stack) < depth:
+            element.clear()
+            if stack:
+                stack[-1].remove(element)
+
+
+def _escape_xml(text):
+    # Escape text the same way as xml.dom.minidom does.
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+def write_pretty_xml(f, out, indent="\t", chunk_size=CHUNK_SIZE):
+    """
+    Pretty-print the XML document in the text file `f` to `out` in the same format as
+    xml.dom.minidom's toprettyxml(), but without reading the entire document into
+    memory. Whitespace between elements is not preserved, and neither is text in
+    elements that also contain other elements (GDC exports have neither).
+    """
+    out.write('<?xml version="1.0" ?>\n')
+
+    # Start tags are only written once we know whether the element is empty.
+    pending = None
+    stack = []
+    for (event, element) in _iter_xml_events(f, chunk_size):
+        if event == "start":
+            if pending is not None:
+                out.write(indent * (len(stack) - 1) + _start_tag(pending) + ">\n")
+            pending = element
+            stack.append(element)
+            continue
+
+        stack.pop()
+        prefix = indent * len(stack)
+        if pending is not element:
+            out.write(f"{prefix}</{element.tag}>\n")
+        elif element.text:
+            out.write(
+                f"{prefix}{_start_tag(element)}>{_escape_xml(element.text)}</{element.tag}>\n"
+            )
+        else:
+            out.write(f"{prefix}{_start_tag(element)}/>\n")
+        pending = None
+
+        element.clear()
+        if stack:
+            stack[-1].remove(element)
+
+
+def _start_tag(element):
+    # The start tag for an element, without its closing ">".
+    attributes = "".join(
+        f' {name}="{_escape_xml(value)}"' for (name, value) in element.attrib.items()
+    )
+    return f"<{element.tag}{attributes}"
+
+
+def chunked(cases, size):
+    """Yield lists of up to `size` cases at a time from an iterable of cases."""
+    cases = iter(cases)
+    while True:
+        chunk = list(itertools.islice(cases, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def guess_format(path):
+    """Guess the format of a case export from its file name, ignoring any compression extension."""
+    extension = compression.strip_extension(path).lower().rsplit(".", 1)[-1]
+    return extension if extension in FORMATS else "json"
+
+
+def read_cases(path, input_format=None):
+    """
+    Yield the cases in the JSON, TSV or XML export at `path` (or standard input, if `path` is
+    '-') one at a time. The format is guessed from the file name if it isn't given, and
+    files compressed with gzip or zstd are decompressed as they are read.
+    """
+    iter_cases = {
+        "json": iter_json_cases,
+        "tsv": iter_tsv_cases,
+        "xml": iter_xml_cases,
+    }[input_format or guess_format(path)]
+    if path == "-":
+        yield from iter_cases(sys.stdin)
+        return
+
+    with compression.open_file(path, newline="") as f:
+        yield from iter_cases(f)
@@ -0,0 +1,69 @@
+#
+# spill.py - Keep the peak memory use of a conversion within a budget.
+#
+# The demonstrators and head-and-mouth/test_load.py read their export one case at a
+# time (see sources.py), and write each document to its output file as soon as it has
+# been converted. Output is spilled straight to its destination rather than collected
+# in memory, so their memory use doesn't grow with the size of the export.
+#
+# If the CRDCH_MEMORY_BUDGET environment variable is set to a number of bytes (such as
+# "256M"), the demonstrators check that the peak resident set size (RSS) of the process
+# stayed within it once they are done, and fail if it didn't. The peak RSS covers the
+# whole process, so the budget is best checked by running a demonstrator on its own.
+#
+
+import logging
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+# Suffixes for budgets given as strings.
+_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(size):
+    """Return a number of bytes given as an integer with an optional K, M or G suffix."""
+    size = size.strip().upper()
+    if size[-1:] in _UNITS:
+        return int(size[:-1]) * _UNITS[size[-1]]
+    return int(size)
+
+
+def budget_from_environment():
+    """Return the memory budget configured by CRDCH_MEMORY_BUDGET, or None if there isn't one."""
+    budget = os.environ.get("CRDCH_MEMORY_BUDGET")
+    return parse_size(budget) if budget else None
+
+
+def peak_rss_bytes():
+    """Return the peak resident set size of this process so far, or None if it's not known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def check_peak_rss(name, budget=None):
+    """
+    Log the peak RSS of this process after `name` has been converted, and raise a
+    MemoryError if it is over `budget` bytes (by default, the budget configured by
+    CRDCH_MEMORY_BUDGET, if any). Returns the peak RSS, or None if it's not known.
+    """
+    if budget is None:
+        budget = budget_from_environment()
+    peak_rss = peak_rss_bytes()
+    logging.info(
+        f"{name}: peak RSS "
+        + (f"{peak_rss} bytes" if peak_rss is not None else "unknown")
+        + (f" (budget {budget} bytes)" if budget is not None else "")
+    )
+    if budget is not None and peak_rss is not None and peak_rss > budget:
+        raise MemoryError(
+            f"{name}: peak RSS of {peak_rss} bytes is over the budget of {budget} bytes"
+        )
+    return peak_rss
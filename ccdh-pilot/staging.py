@@ -0,0 +1,184 @@
+#
+# staging.py - Compact records for the parts of GDC and PDC cases that we transform.
+#
+# GDC and PDC exports contain every field the source knows about: a GDC diagnosis has
+# over eighty keys, most of which are None, but transform_gdc.py and transform_pdc.py
+# only read a handful of them. These record classes keep just the fields the transforms
+# use, in __slots__ rather than a dictionary, and discard everything else as soon as a
+# case has been read. Fields missing from the source are None, just as dict.get() would
+# return.
+#
+# Both sources use the same field names for everything we read, so GDC and PDC cases
+# are staged into the same classes. CDA records (read by transform_cda.py) have a
+# different shape, and are staged into the CDA* classes, which also drop the long lists
+# of Files attached to every CDA Specimen.
+#
+
+
+class Record:
+    """A record with a fixed set of fields, listed in __slots__."""
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_json(cls, values):
+        """Stage a record from a dictionary read from JSON, discarding any other fields."""
+        return cls(**{name: values.get(name) for name in cls.__slots__})
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}"
+            for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class Sample(Record):
+    """The fields of a sample read by create_specimen()."""
+
+    __slots__ = (
+        "sample_id",
+        "submitter_id",
+        "sample_type",
+        "tissue_type",
+        "tumor_code",
+        "tumor_descriptor",
+        "current_weight",
+        "days_to_collection",
+        "initial_weight",
+        "biospecimen_anatomic_site",
+        "preservation_method",
+        "freezing_method",
+    )
+
+
+class Diagnosis(Record):
+    """The fields of a diagnosis read by transform_diagnosis()."""
+
+    __slots__ = (
+        "diagnosis_id",
+        "age_at_diagnosis",
+        "morphology",
+        "primary_diagnosis",
+        "icd_10_code",
+        "ajcc_staging_system_edition",
+        "year_of_diagnosis",
+    )
+
+
+class Case(Record):
+    """The fields of a case read by the transforms, with its samples and diagnoses."""
+
+    __slots__ = ("case_id", "submitter_id", "samples", "diagnoses")
+
+    @classmethod
+    def from_json(cls, values):
+        return cls(
+            case_id=values.get("case_id"),
+            submitter_id=values.get("submitter_id"),
+            samples=[Sample.from_json(s) for s in values.get("samples") or []],
+            diagnoses=[Diagnosis.from_json(d) for d in values.get("diagnoses") or []],
+        )
+
+
+class CDADiagnosis(Record):
+    """The fields of a CDA Diagnosis read by transform_cda.py."""
+
+    __slots__ = (
+        "id",
+        "age_at_diagnosis",
+        "morphology",
+        "primary_diagnosis",
+    )
+
+
+class CDASpecimen(Record):
+    """The fields of a CDA Specimen read by transform_cda.py."""
+
+    __slots__ = (
+        "id",
+        "identifier",
+        "specimen_type",
+        "source_material_type",
+        "anatomical_site",
+        "derived_from_specimen",
+    )
+
+    @classmethod
+    def from_json(cls, values):
+        specimen = super().from_json(values)
+        specimen.identifier = _identifiers(values)
+        return specimen
+
+
+class CDAResearchSubject(Record):
+    """The fields of a CDA ResearchSubject, with its Diagnoses and Specimens."""
+
+    __slots__ = ("id", "identifier", "diagnoses", "specimens")
+
+    @classmethod
+    def from_json(cls, values):
+        return cls(
+            id=values.get("id"),
+            identifier=_identifiers(values),
+            diagnoses=[
+                CDADiagnosis.from_json(d) for d in values.get("Diagnosis") or []
+            ],
+            specimens=[CDASpecimen.from_json(s) for s in values.get("Specimen") or []],
+        )
+
+
+class CDASubject(Record):
+    """
+    The fields of a CDA Subject read by transform_cda.py, with its ResearchSubjects (one
+    for each node the subject is found in).
+    """
+
+    __slots__ = ("id", "sex", "race", "ethnicity", "research_subjects")
+
+    @classmethod
+    def from_json(cls, values):
+        return cls(
+            id=values.get("id"),
+            sex=values.get("sex"),
+            race=values.get("race"),
+            ethnicity=values.get("ethnicity"),
+            research_subjects=[
+                CDAResearchSubject.from_json(r)
+                for r in values.get("ResearchSubject") or []
+            ],
+        )
+
+
+def _identifiers(values):
+    # CDA identifiers are lists of {"system": ..., "value": ...} dictionaries.
+    return [
+        (identifier.get("system"), identifier.get("value"))
+        for identifier in values.get("identifier") or []
+    ]
+
+
+def stage_case(case):
+    """Return a Case for a case read from JSON, or the case itself if it has already been staged."""
+    return case if isinstance(case, Case) else Case.from_json(case)
+
+
+def stage_cases(cases):
+    """Stage every case in an iterable of cases read from JSON."""
+    for case in cases:
+        yield stage_case(case)
+
+
+def stage_cda_subject(subject):
+    """Return a CDASubject for a CDA record read from JSON, or the record itself if it has already been staged."""
+    return subject if isinstance(subject, CDASubject) else CDASubject.from_json(subject)
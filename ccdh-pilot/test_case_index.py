@@ -0,0 +1,80 @@
+#
+# test_case_index.py - Tests for random access to the cases in JSON case exports.
+#
+
+import json
+import os
+import shutil
+
+import pytest
+
+import case_index
+import convert
+
+
+@pytest.fixture
+def gdc_export(tmp_path):
+    path = str(tmp_path / "gdc-head-and-mouth.json")
+    shutil.copy("head-and-mouth/gdc-head-and-mouth.json", path)
+    return path
+
+
+def test_case_index(gdc_export, gdc_head_and_mouth):
+    gdc_cases = gdc_head_and_mouth
+    with case_index.CaseIndex(gdc_export) as index:
+        assert os.path.exists(gdc_export + case_index.INDEX_SUFFIX)
+        assert len(index) == len(gdc_cases)
+        assert index[17] == gdc_cases[17]
+        assert index[-1] == gdc_cases[-1]
+        assert index[10:13] == gdc_cases[10:13]
+        assert index.get(gdc_cases[42]["case_id"]) == gdc_cases[42]
+
+        case_id = gdc_cases[3]["case_id"]
+        assert index.positions(f"1, 5:7,{case_id},-1") == [1, 5, 6, 3, len(index) - 1]
+        with pytest.raises(ValueError):
+            index.positions("no-such-case")
+        with pytest.raises(ValueError):
+            index.positions(str(len(index)))
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / "cases.json")
+    with open(path, "w") as f:
+        json.dump([{"case_id": "a"}, {"case_id": "b"}], f)
+    assert case_index.load_index(path)["case_ids"] == {"a": 0, "b": 1}
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([{"case_id": "é"}], f, ensure_ascii=False)
+    with case_index.CaseIndex(path) as index:
+        assert index.case_ids == {"é": 0}
+        assert index.get("é") == {"case_id": "é"}
+
+
+def test_crlf_export(tmp_path):
+    cases = [{"case_id": "a", "n": 1}, {"case_id": "b", "n": 2}]
+    path = str(tmp_path / "cases.json")
+    with open(path, "w", newline="\r\n") as f:
+        json.dump(cases, f, indent=2)
+
+    with case_index.CaseIndex(path) as index:
+        assert index[1] == cases[1]
+        assert index.get("a") == cases[0]
+
+
+def test_convert_selected_cases(gdc_export, tmp_path):
+    def run(*args):
+        output = str(tmp_path / "output.yaml")
+        convert.main(
+            ["gdc", "--in", gdc_export, "--out", output, "--no-validate", *args]
+        )
+        with open(output) as f:
+            return f.read()
+
+    # Converting a selection of cases gives the same documents, with the same IDs, as
+    # converting the whole export.
+    documents = run().split("---\n")
+    assert run("--cases", "17,3:5").split("---\n") == [
+        documents[17],
+        documents[3],
+        documents[4],
+    ]
@@ -0,0 +1,119 @@
+#
+# test_cda.py - Tests for fetching and transforming CDA records.
+#
+
+import json
+
+import yaml
+
+import cda
+import convert
+import instrument
+import sources
+import transform_cda
+
+CDA_DERIVED_FROM = "cptac2-subject-09CO022/cda_derived_from_09CO022.json"
+CDA_CASE = "cptac2-subject-09CO022/cda_case_459e3b69-63d6-11e8-bcf1-0a2705229b82.json"
+
+
+class PagedResult(list):
+    """A page of records, like a cdapython Result."""
+
+    def __init__(self, records, has_next_page):
+        super().__init__(records)
+        self.has_next_page = has_next_page
+
+
+def test_iter_query_records():
+    with open(CDA_DERIVED_FROM) as f:
+        records = json.load(f)
+
+    for query in [cda.SavedQuery(records), cda.SavedQuery(CDA_DERIVED_FROM)]:
+        instrument.reset()
+        instrument.enable()
+        try:
+            assert list(cda.iter_query_records(query, page_size=4)) == records
+            assert instrument.metrics()["counters"]["cda_pages"] == 3
+        finally:
+            instrument.disable()
+
+    # cdapython results say when there are no more pages.
+    class Query:
+        def run(self, offset, limit):
+            return PagedResult(records[offset : offset + limit], offset + limit < 8)
+
+    assert list(cda.iter_query_records(Query(), page_size=4)) == records[:8]
+
+    # Every record returned by a query on Specimen fields is the same subject.
+    assert list(cda.unique_subjects(records)) == records[:1]
+
+
+def test_saved_query_reads_file_once(monkeypatch):
+    with open(CDA_DERIVED_FROM) as f:
+        records = json.load(f)
+    opened = []
+    read_cases = sources.read_cases
+
+    def counting_read_cases(path, input_format=None):
+        opened.append(path)
+        return read_cases(path, input_format)
+
+    monkeypatch.setattr(sources, "read_cases", counting_read_cases)
+    query = cda.SavedQuery(CDA_DERIVED_FROM)
+    assert list(cda.iter_query_records(query, page_size=4)) == records
+    assert len(opened) == 1
+
+    # Only an earlier page means reading the file again.
+    assert query.run(offset=4, limit=2) == records[4:6]
+    assert query.run(offset=8, limit=2) == records[8:10]
+    assert len(opened) == 2
+
+
+def test_unique_subjects():
+    def record(id, *research_subject_ids):
+        return {"id": id, "ResearchSubject": [{"id": i} for i in research_subject_ids]}
+
+    records = [
+        record("specimen-1", "rs-1", "rs-2"),
+        record("specimen-2", "rs-3"),
+        record("specimen-3", "rs-2", "rs-1"),
+        record("subject-1"),
+        record("subject-1"),
+    ]
+    assert list(cda.unique_subjects(records)) == [records[0], records[1], records[3]]
+
+
+def test_read_single_record():
+    with open(CDA_CASE) as f:
+        record = json.load(f)
+    assert list(sources.read_cases(CDA_CASE)) == [record]
+
+
+def test_convert_cda(tmp_path):
+    output_file = tmp_path / "cda.yaml"
+    assert (
+        convert.main(["cda", "--in", CDA_DERIVED_FROM, "--out", str(output_file)]) == 0
+    )
+
+    documents = list(yaml.safe_load_all(output_file.read_text()))
+    assert [list(document)[0] for document in documents] == [
+        "cda_subject_0_research_subject_0_diagnosis_0_diagnosis",
+        "cda_subject_0_research_subject_1_diagnosis_0_diagnosis",
+    ]
+    (gdc_diagnosis, pdc_diagnosis) = [
+        list(document.values())[0]["Example"] for document in documents
+    ]
+    assert gdc_diagnosis["subject"] == pdc_diagnosis["subject"]
+    assert [i["system"] for i in gdc_diagnosis["subject"]["identifier"]] == [
+        f"{transform_cda.GDC_URL}#case_id",
+        f"{transform_cda.PDC_URL}#case_id",
+    ]
+    assert pdc_diagnosis["identifier"] == [
+        {
+            "value": "ff301535-70ca-11e8-bcf1-0a2705229b82",
+            "system": f"{transform_cda.PDC_URL}#diagnosis_id",
+        }
+    ]
+    specimens = gdc_diagnosis["related_specimen"]
+    assert len(specimens) == 11
+    assert specimens[1]["parent_specimen"] == [{"id": specimens[0]["id"]}]
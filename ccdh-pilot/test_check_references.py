@@ -0,0 +1,83 @@
+#
+# test_check_references.py - Tests for checking the IDs in converted CRDC-H data.
+#
+
+import os
+
+import yaml
+
+import check_references
+import sharding
+
+IMPORTED_NODE_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "imported-node-data"
+)
+
+
+def write_documents(path, documents):
+    with open(path, "w") as f:
+        yaml.dump_all(documents, f, Dumper=yaml.SafeDumper, sort_keys=False)
+    return str(path)
+
+
+def diagnosis(id, subject):
+    return {f"{id}_diagnosis": {"Example": {"id": id, "subject": subject}}}
+
+
+def test_check(tmp_path):
+    subject = {"id": "example:subject", "sex": "female"}
+    first = write_documents(
+        tmp_path / "first.yaml",
+        [
+            # Embedded copies of an object define its ID...
+            diagnosis("example:diagnosis_0", subject),
+            diagnosis("example:diagnosis_1", dict(subject)),
+            # ... and references to it resolve, even when defined in a later file.
+            diagnosis("example:diagnosis_2", {"id": "example:specimen"}),
+            diagnosis("example:diagnosis_3", {"id": "example:missing"}),
+            diagnosis("example:diagnosis_4", {"id": "example:subject", "sex": "male"}),
+        ],
+    )
+    second = write_documents(
+        tmp_path / "second.yaml",
+        [
+            {"specimen": {"Example": {"id": "example:specimen", "volume": 1}}},
+            diagnosis("example:diagnosis_0", subject),
+        ],
+    )
+
+    for workers in [1, 2]:
+        checker = check_references.check([first, second], workers)
+        problems = {(p.kind, p.id): p.locations for p in checker.problems()}
+        assert problems == {
+            ("dangling", "example:missing"): [(first, "example:diagnosis_3_diagnosis")],
+            ("duplicate", "example:diagnosis_0"): [
+                (first, "example:diagnosis_0_diagnosis"),
+                (second, "example:diagnosis_0_diagnosis"),
+            ],
+            ("conflicting", "example:subject"): [
+                (first, "example:diagnosis_0_diagnosis"),
+                (first, "example:diagnosis_4_diagnosis"),
+            ],
+        }
+
+
+def test_check_shards(tmp_path):
+    path = tmp_path / "output.yaml"
+    with sharding.ShardedWriter(str(path), max_documents=1) as writer:
+        for document in [
+            diagnosis("example:diagnosis_0", {"id": "example:subject"}),
+            {"subject": {"Example": {"id": "example:subject", "sex": "female"}}},
+        ]:
+            writer.write(yaml.dump(document, Dumper=yaml.SafeDumper, sort_keys=False))
+
+    manifest = sharding.manifest_path(str(path))
+    assert len(check_references.expand_paths([manifest])) == 2
+    assert check_references.check([manifest]).problems() == []
+
+
+def test_imported_node_data():
+    checker = check_references.check([IMPORTED_NODE_DATA])
+    assert checker.files == 2
+    assert checker.problems() == []
+    assert check_references.main([IMPORTED_NODE_DATA]) == 0
@@ -0,0 +1,78 @@
+#
+# test_compatibility.py - Tests for validating against several schema versions at once.
+#
+
+import itertools
+import json
+import os
+
+import yaml
+
+import compatibility
+import validate
+
+PDC_HEAD_AND_MOUTH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "imported-node-data",
+    "pdc-head-and-mouth.yaml",
+)
+
+
+def test_parse_version():
+    assert compatibility.parse_version("v1.1") == (
+        "v1.1",
+        validate.json_schema_url("v1.1"),
+    )
+    assert compatibility.parse_version("next=schemas/a=b.json") == (
+        "next",
+        "schemas/a=b.json",
+    )
+
+
+def test_format_matrix():
+    result = compatibility.FileResult("a.yaml", ["old", "new"])
+    result.documents = 3
+    result.errors["new"]["key"].append("at : 'x' is a required property")
+    assert compatibility.format_matrix([result], ["old", "new"]).splitlines() == [
+        "file    old  new",
+        "a.yaml  3/3  2/3",
+        "total   3/3  2/3",
+    ]
+
+
+def test_main(tmp_path, monkeypatch):
+    monkeypatch.setenv("CRDCH_VALIDATION_CACHE", "off")
+    with open(PDC_HEAD_AND_MOUTH) as f:
+        documents = list(itertools.islice(yaml.safe_load_all(f), 3))
+    input_file = tmp_path / "pdc.yaml"
+    with open(input_file, "w") as f:
+        yaml.dump_all(documents, f, Dumper=yaml.SafeDumper, sort_keys=False)
+
+    # Two versions of a schema, only the first of which every diagnosis passes.
+    old_schema = tmp_path / "old.json"
+    old_schema.write_text(json.dumps({"$defs": {"Diagnosis": {}}}))
+    new_schema = tmp_path / "new.json"
+    new_schema.write_text(
+        json.dumps({"$defs": {"Diagnosis": {"required": ["no_such_slot"]}}})
+    )
+
+    output_file = tmp_path / "matrix.json"
+    exit_code = compatibility.main(
+        [
+            str(tmp_path),
+            "--schema",
+            f"old={old_schema}",
+            "--schema",
+            f"new={new_schema}",
+            "--out",
+            str(output_file),
+        ]
+    )
+    assert exit_code == 1
+
+    matrix = json.loads(output_file.read_text())
+    assert matrix["versions"] == ["old", "new"]
+    assert matrix["files"][str(input_file)]["valid"] == {"old": 3, "new": 0}
+    errors = matrix["files"][str(input_file)]["errors"]
+    assert list(errors) == ["new"]
+    assert len(errors["new"]) == 3
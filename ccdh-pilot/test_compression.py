@@ -0,0 +1,81 @@
+#
+# test_compression.py - Tests for reading and writing compressed files.
+#
+
+import gzip
+import json
+
+import pytest
+
+import compression
+import convert
+import sources
+
+
+def test_open_file(tmp_path):
+    text = "é\n" * 1000
+    for name in ["plain.txt", "gzipped.txt.gz"]:
+        with compression.open_file(tmp_path / name, "w") as f:
+            f.write(text)
+        with compression.open_file(tmp_path / name) as f:
+            assert f.read() == text
+
+    # Compressed files are really compressed, and readable by other tools.
+    assert compression.compression_for(tmp_path / "gzipped.txt.gz") == "gzip"
+    assert (tmp_path / "gzipped.txt.gz").stat().st_size < len(text)
+    with gzip.open(tmp_path / "gzipped.txt.gz", "rt", encoding="utf-8") as f:
+        assert f.read() == text
+
+
+def test_open_file_zstd(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "cases.json.zst"
+    with compression.open_file(path, "w", level=10) as f:
+        f.write('{"cases": []}')
+    with open(path, "rb") as f:
+        assert zstandard.ZstdDecompressor().stream_reader(f).read() == b'{"cases": []}'
+    with compression.open_file(path) as f:
+        assert json.load(f) == {"cases": []}
+
+
+def test_open_output(tmp_path, monkeypatch):
+    monkeypatch.setenv("CRDCH_COMPRESSION", "gzip")
+    monkeypatch.setenv("CRDCH_COMPRESSION_LEVEL", "1")
+    assert compression.from_environment() == ("gzip", 1)
+    with compression.open_output(tmp_path / "diagnoses.yaml") as f:
+        f.write("example: 1\n")
+    assert [path.name for path in tmp_path.iterdir()] == ["diagnoses.yaml.gz"]
+
+    monkeypatch.setenv("CRDCH_COMPRESSION", "bzip2")
+    with pytest.raises(ValueError):
+        compression.from_environment()
+
+
+def test_read_compressed_cases(tmp_path, gdc_head_and_mouth):
+    gdc_cases = gdc_head_and_mouth[:5]
+    with gzip.open(tmp_path / "cases.json.gz", "wt") as f:
+        json.dump(gdc_cases, f)
+
+    assert sources.guess_format("cases.tsv.gz") == "tsv"
+    assert list(sources.read_cases(str(tmp_path / "cases.json.gz"))) == gdc_cases
+
+
+def test_convert_compressed(tmp_path, pdc_head_and_mouth):
+    pdc_cases = pdc_head_and_mouth[:5]
+    with gzip.open(tmp_path / "cases.json.gz", "wt") as f:
+        json.dump(pdc_cases, f)
+
+    for output in ["diagnoses.yaml", "diagnoses.yaml.gz"]:
+        convert.main(
+            [
+                "pdc",
+                "--in",
+                str(tmp_path / "cases.json.gz"),
+                "--out",
+                str(tmp_path / output),
+                "--no-validate",
+            ]
+        )
+    with open(tmp_path / "diagnoses.yaml") as f:
+        with gzip.open(tmp_path / "diagnoses.yaml.gz", "rt") as compressed:
+            assert compressed.read() == f.read()
@@ -0,0 +1,186 @@
+#
+# test_construct.py - Tests for building crdch_model objects without LinkML's checks.
+#
+
+import dataclasses
+import decimal
+from typing import List, Optional, Union
+
+import pytest
+import yaml
+
+import construct
+import convert
+import serialize
+import transform_pdc
+import validate
+
+
+def test_trusted_output_is_unchanged(pdc_head_and_mouth):
+    pdc_cases = pdc_head_and_mouth[:10]
+
+    def dump():
+        return "---\n".join(
+            serialize.yaml_document(document)
+            for (case_index, case) in enumerate(pdc_cases)
+            for document in transform_pdc.transform_case(case, case_index)
+        )
+
+    eager = dump()
+    with construct.trusted():
+        assert construct.is_trusted()
+        trusted = dump()
+    assert not construct.is_trusted()
+    assert trusted == eager
+
+
+def test_trusted_errors_are_reported_by_validation():
+    # A Coding without a code is rejected as soon as it is built...
+    with pytest.raises(ValueError) as eager_error:
+        construct.model.Coding(system="http://example.org")
+
+    # ... but with trusted construction, it is reported when the document is validated
+    # against the JSON Schema instead.
+    with construct.trusted():
+        diagnosis = construct.model.Diagnosis(
+            id="example:diagnosis",
+            condition=construct.model.CodeableConcept(
+                coding=[construct.model.Coding(system="http://example.org")]
+            ),
+        )
+
+    assert str(eager_error.value) == "code must be supplied"
+    job = convert.Job(
+        "pdc", "yaml", validate.load_json_schema(validate.JSON_SCHEMA_URL)
+    )
+    document = {"example_diagnosis": {"Example": diagnosis}}
+    errors = job.validate(yaml.safe_load(serialize.yaml_document(document)))
+    assert errors == [
+        "example_diagnosis at condition/coding/0: 'code' is a required property"
+    ]
+
+
+@dataclasses.dataclass
+class Quantity:
+    value: Optional[decimal.Decimal] = None
+    unit: Optional[str] = None
+
+
+@dataclasses.dataclass
+class Sample:
+    id: Union[str, "SampleId"] = None
+    quantity: Optional[Union[dict, Quantity]] = None
+    aliases: Optional[Union[str, List[str]]] = dataclasses.field(default_factory=list)
+    parts: Optional[
+        Union[Union[dict, Quantity], List[Union[dict, Quantity]]]
+    ] = dataclasses.field(default_factory=list)
+
+    def __post_init__(self):
+        # Like a LinkML __post_init__, but only for some fields.
+        if self.id is None:
+            raise ValueError("id must be supplied")
+        if self.quantity is not None and not isinstance(self.quantity, Quantity):
+            self.quantity = Quantity(**self.quantity)
+
+
+class SampleId(str):
+    pass
+
+
+def test_load():
+    sample = construct.load(
+        {
+            "id": "example:sample",
+            "quantity": {"value": "1.5", "unit": "mL"},
+            "aliases": "first",
+            "parts": [{"value": 1}, Quantity(unit="g")],
+        },
+        Sample,
+    )
+    assert sample == Sample(
+        id=SampleId("example:sample"),
+        quantity=Quantity(decimal.Decimal("1.5"), "mL"),
+        aliases=["first"],
+        parts=[Quantity(decimal.Decimal(1)), Quantity(unit="g")],
+    )
+    assert type(sample.id) is SampleId
+    assert construct.load({"id": "example:sample"}, Sample).parts == []
+
+
+def test_load_errors():
+    # Dictionaries with unknown or missing fields are passed to the class, which raises
+    # its own error...
+    with pytest.raises(TypeError, match="unexpected keyword argument 'size'"):
+        construct.load({"id": "example:sample", "size": 1}, Sample)
+    with pytest.raises(ValueError, match="id must be supplied"):
+        construct.load({"quantity": {"value": 1}}, Sample)
+
+    # ... as are dictionaries with objects that aren't dictionaries...
+    with pytest.raises(TypeError, match="must be a mapping"):
+        construct.load({"id": "example:sample", "quantity": 5}, Sample)
+    with pytest.raises(TypeError, match="must be a mapping"):
+        construct.load({"id": "example:sample", "quantity": [{"value": 1}]}, Sample)
+
+    # ... and values are converted by their types, which raise theirs.
+    with pytest.raises(decimal.InvalidOperation):
+        construct.load({"id": "example:sample", "quantity": {"value": "a"}}, Sample)
+
+
+def test_compile_plans():
+    construct._plans.pop(Sample, None)
+    construct._plans.pop(Quantity, None)
+    construct.compile_plans(Sample)
+    # The plans for the classes of its fields are compiled too.
+    assert construct.plan(Sample) is construct._plans[Sample]
+    assert Quantity in construct._plans
+
+
+def test_load_matches_yaml_loader(pdc_head_and_mouth):
+    import crdch_model
+    from linkml_runtime.loaders.yaml_loader import YAMLLoader
+
+    pdc_cases = pdc_head_and_mouth[:10]
+
+    for (case_index, case) in enumerate(pdc_cases):
+        for document in transform_pdc.transform_case(case, case_index):
+            ((key, entry),) = yaml.safe_load(serialize.yaml_document(document)).items()
+            cls = getattr(crdch_model, validate.class_name_for_key(key))
+            expected = YAMLLoader().load(entry["Example"], cls)
+            assert construct.load(entry["Example"], cls) == expected
+
+    with pytest.raises(ValueError, match="code must be supplied"):
+        construct.load({"system": "http://example.org"}, crdch_model.Coding)
+
+
+# Malformed diagnoses, and values that LinkML converts into objects.
+MALFORMED_DIAGNOSES = [
+    {"subject": 5},
+    {"subject": "example:subject"},
+    {"subject": [{"id": "example:subject"}]},
+    {"age_at_diagnosis": [1]},
+    {"age_at_diagnosis": "1 day"},
+    {"age_at_diagnosis": {"value_decimal": "a"}},
+    {"age_at_diagnosis": {"no_such_slot": 1}},
+    {"condition": "Squamous cell carcinoma"},
+    {"stage": "I"},
+    {"related_specimen": "example:specimen"},
+    {"related_specimen": [5]},
+    {"identifier": "example:identifier"},
+    {"primary_site": ["Larynx"]},
+    {"no_such_slot": 1},
+]
+
+
+@pytest.mark.parametrize("fields", MALFORMED_DIAGNOSES)
+def test_load_errors_match_yaml_loader(fields):
+    import crdch_model
+    from linkml_runtime.loaders.yaml_loader import YAMLLoader
+
+    def outcome(load):
+        data = {"id": "example:diagnosis", **fields}
+        try:
+            return load(data, crdch_model.Diagnosis)
+        except Exception as e:
+            return type(e)
+
+    assert outcome(construct.load) == outcome(YAMLLoader().load)
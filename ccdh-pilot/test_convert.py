@@ -0,0 +1,75 @@
+#
+# test_convert.py - Tests for the conversion command line tool.
+#
+
+import json
+import pytest
+import yaml
+
+import convert
+import transform_pdc
+
+
+def test_convert_pdc(tmp_path, pdc_head_and_mouth):
+    pdc_cases = pdc_head_and_mouth[:5]
+
+    input_file = tmp_path / "pdc.json"
+    with open(input_file, "w") as f:
+        json.dump(pdc_cases, f)
+
+    # The converted output should be identical to the demonstrator's output.
+    output_file = tmp_path / "pdc.yaml"
+    exit_code = convert.main(
+        ["pdc", "--in", str(input_file), "--out", str(output_file), "--workers", "2"]
+    )
+    assert exit_code == 0
+
+    expected = yaml.dump_all(
+        list(transform_pdc.transform_cases(pdc_cases)),
+        Dumper=yaml.SafeDumper,
+        sort_keys=False,
+    )
+    assert output_file.read_text() == expected
+
+
+def test_convert_reports_validation_errors(tmp_path, pdc_head_and_mouth):
+    pdc_cases = pdc_head_and_mouth[:1]
+
+    input_file = tmp_path / "pdc.json"
+    with open(input_file, "w") as f:
+        json.dump(pdc_cases, f)
+
+    # A schema that no diagnosis can pass.
+    schema_file = tmp_path / "schema.json"
+    with open(schema_file, "w") as f:
+        json.dump({"$defs": {"Diagnosis": {"required": ["no_such_slot"]}}}, f)
+
+    exit_code = convert.main(
+        [
+            "pdc",
+            "--in",
+            str(input_file),
+            "--out",
+            str(tmp_path / "pdc.yaml"),
+            "--schema",
+            str(schema_file),
+        ]
+    )
+    assert exit_code == 1
+
+
+def test_normalize_needs_a_single_worker(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        convert.main(
+            [
+                "pdc",
+                "--in",
+                str(tmp_path / "pdc.json"),
+                "--out",
+                str(tmp_path / "pdc.yaml"),
+                "--normalize",
+                "--workers",
+                "2",
+            ]
+        )
+    assert "--normalize" in capsys.readouterr().err
@@ -0,0 +1,65 @@
+#
+# test_diff_output.py - Tests for the structural diff between converted outputs.
+#
+
+import json
+
+import convert
+import diff_output
+from diff_output import MISSING, Difference
+
+
+def test_diff_values():
+    old = {"a": 1, "b": [1, {"c": "x"}], "d": {"e": 2}}
+    new = {"a": 1, "b": [1, {"c": "y"}, 3], "f": None}
+    assert list(diff_output.diff_values(old, new)) == [
+        Difference(("b", 1, "c"), "x", "y"),
+        Difference(("b", 2), MISSING, 3),
+        Difference(("d",), {"e": 2}, MISSING),
+        Difference(("f",), MISSING, None),
+    ]
+    assert list(diff_output.diff_values(old, dict(reversed(list(old.items()))))) == []
+
+
+def test_diff_outputs(tmp_path, capsys, pdc_head_and_mouth):
+    pdc_cases = pdc_head_and_mouth[:5]
+
+    def run(name, cases):
+        input_file = tmp_path / f"{name}.json"
+        with open(input_file, "w") as f:
+            json.dump(cases, f)
+        output_file = str(tmp_path / f"{name}.yaml")
+        convert.main(
+            ["pdc", "--in", str(input_file), "--out", output_file, "--no-validate"]
+        )
+        return output_file
+
+    old = run("old", pdc_cases[:4])
+    pdc_cases[1]["diagnoses"][0]["morphology"] = "8071/3"
+    new = run("new", pdc_cases[:3])
+    assert diff_output.main([old, old]) == 0
+
+    (added, removed, changed) = diff_output.diff_outputs(old, new)
+    assert added == []
+    assert removed == ["pdc_head_and_mouth_example_3_diagnosis_0_diagnosis"]
+    assert changed == [
+        (
+            "pdc_head_and_mouth_example_1_diagnosis_0_diagnosis",
+            [
+                Difference(
+                    ("Example", "morphology", "coding", 0, "code"),
+                    "Not Reported",
+                    "8071/3",
+                )
+            ],
+        )
+    ]
+    (added, removed, changed) = diff_output.diff_outputs(new, old)
+    assert added == ["pdc_head_and_mouth_example_3_diagnosis_0_diagnosis"]
+
+    assert diff_output.main([old, new]) == 1
+    assert capsys.readouterr().out.splitlines() == [
+        "removed pdc_head_and_mouth_example_3_diagnosis_0_diagnosis",
+        "changed pdc_head_and_mouth_example_1_diagnosis_0_diagnosis",
+        "  ~ Example/morphology/coding/0/code: 'Not Reported' -> '8071/3'",
+    ]
@@ -0,0 +1,89 @@
+#
+# test_field_profile.py - Tests for profiling the fields of case exports.
+#
+
+import json
+
+import field_profile
+
+
+def test_hyperloglog():
+    sketch = field_profile.HyperLogLog()
+    for i in range(20000):
+        sketch.add(f"case_{i % 10000}")
+    assert abs(sketch.estimate() - 10000) < 500
+
+    small = field_profile.HyperLogLog()
+    for value in ["a", "b", "c", "a"]:
+        small.add(value)
+    assert small.estimate() == 3
+
+    # Merging sketches counts the union of their values.
+    other = field_profile.HyperLogLog()
+    for i in range(5000, 15000):
+        other.add(f"case_{i}")
+    sketch.merge(other)
+    assert abs(sketch.estimate() - 15000) < 750
+
+
+def test_frequent_values():
+    frequent = field_profile.FrequentValues(capacity=3)
+    for value in ["x"] * 5 + ["y"] * 3 + ["z"]:
+        frequent.add(value)
+    assert frequent.most_common(2) == [("x", 5), ("y", 3)]
+    assert frequent.exact
+
+    # Once there are more distinct values than counters, counts are lower bounds, but
+    # the most frequent values are still found.
+    for value in ["a", "b", "c", "d"]:
+        frequent.add(value)
+    assert not frequent.exact
+    assert [value for (value, _) in frequent.most_common(1)] == ["x"]
+
+    # Values that are equal in Python but have different types are counted apart.
+    frequent = field_profile.FrequentValues()
+    for value in [True, 1, 1, False, 0, 0, 0, 1.0]:
+        frequent.add(value)
+    top = frequent.most_common(5)
+    assert top == [(0, 3), (1, 2), (True, 1), (False, 1), (1.0, 1)]
+    assert [type(value) for (value, _) in top] == [int, int, bool, bool, float]
+
+
+def test_profile(gdc_head_and_mouth):
+    cases = [
+        {"case_id": "1", "diagnoses": [{"age": 10, "site": None}], "tags": ["a"]},
+        {"case_id": "2", "diagnoses": [{"age": 30}, {"age": 20, "site": "Larynx"}]},
+    ]
+    report = field_profile.Profiler().add_all(cases).report()
+    assert report["records"] == 2
+    assert list(report["fields"]) == [
+        "case_id",
+        "diagnoses",
+        "diagnoses[]",
+        "diagnoses[].age",
+        "diagnoses[].site",
+        "tags",
+        "tags[]",
+    ]
+    age = report["fields"]["diagnoses[].age"]
+    assert (age["count"], age["nulls"], age["min"], age["max"]) == (3, 0, 10, 30)
+    site = report["fields"]["diagnoses[].site"]
+    assert site["types"] == {"null": 1, "string": 1}
+    assert site["top"] == [["Larynx", 1]]
+    assert report["fields"]["diagnoses[]"]["types"] == {"object": 3}
+
+    # Every field of the head and mouth export is counted.
+    report = field_profile.Profiler().add_all(gdc_head_and_mouth).report()
+    gender = report["fields"]["demographic.gender"]
+    assert gender["count"] == report["records"] == len(gdc_head_and_mouth)
+    genders = {case["demographic"]["gender"] for case in gdc_head_and_mouth}
+    assert gender["distinct"] == len(genders)
+
+
+def test_main(tmp_path):
+    input_file = tmp_path / "cases.json"
+    input_file.write_text(json.dumps([{"case_id": "1"}, {"case_id": None}]))
+    output_file = tmp_path / "profile.json"
+    assert field_profile.main([str(input_file), "--out", str(output_file)]) == 0
+    report = json.loads(output_file.read_text())
+    assert report["fields"]["case_id"]["nulls"] == 1
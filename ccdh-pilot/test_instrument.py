@@ -0,0 +1,61 @@
+#
+# test_instrument.py - Tests for the pipeline timers and counters.
+#
+
+import json
+
+import pytest
+
+import instrument
+
+
+@pytest.fixture
+def enabled():
+    instrument.reset()
+    instrument.enable()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+
+def test_disabled_instrumentation_records_nothing():
+    instrument.reset()
+    assert not instrument.is_enabled()
+
+    with instrument.timer("stage"):
+        instrument.count("things")
+
+    assert instrument.metrics() == {"timers": {}, "counters": {}}
+
+
+def test_timers_and_counters(enabled, tmp_path):
+    @instrument.timed()
+    def helper():
+        instrument.count("helper_calls")
+
+    with instrument.timer("stage"):
+        helper()
+        helper()
+
+    metrics = instrument.metrics()
+    assert metrics["timers"]["stage"]["calls"] == 1
+    assert metrics["timers"]["helper"]["calls"] == 2
+    assert metrics["counters"] == {"helper_calls": 2}
+
+    instrument.write_metrics(tmp_path / "metrics.json")
+    with open(tmp_path / "metrics.json") as f:
+        assert json.load(f) == metrics
+
+    instrument.write_folded(tmp_path / "stacks.folded")
+    stacks = [
+        line.split(" ")[0]
+        for line in (tmp_path / "stacks.folded").read_text().split("\n")
+        if line
+    ]
+    assert stacks == ["stage", "stage;helper"]
+
+
+def test_profile(tmp_path):
+    with instrument.profile(tmp_path / "run.prof"):
+        sum(range(1000))
+    assert (tmp_path / "run.prof").stat().st_size > 0
@@ -0,0 +1,125 @@
+#
+# test_normalize.py - Tests for writing normalized output and reading it back.
+#
+
+import copy
+import logging
+
+import yaml
+
+import normalize
+import serialize
+import snapshot
+import transform_pdc
+
+
+def read_pdc_cases(count):
+    return snapshot.load(snapshot.PDC_HEAD_AND_MOUTH)[:count]
+
+
+def nested_yaml(cases):
+    return "---\n".join(
+        serialize.yaml_document(document)
+        for (case_index, case) in enumerate(cases)
+        for document in transform_pdc.transform_case(case, case_index)
+    )
+
+
+def normalized_yaml(cases, normalizer=None):
+    normalizer = normalizer or normalize.Normalizer()
+    return "---\n".join(
+        serialize.yaml_document(document)
+        for (case_index, case) in enumerate(cases)
+        for document in normalizer.normalize(
+            transform_pdc.transform_case(case, case_index)
+        )
+    )
+
+
+def examples(text):
+    return [
+        document["Example"]
+        for entry in yaml.safe_load_all(text)
+        for document in entry.values()
+    ]
+
+
+def three_diagnosis_cases():
+    # Give the first case three diagnoses, all of which refer to the same subject and
+    # specimens.
+    cases = read_pdc_cases(3)
+    diagnosis = cases[0]["diagnoses"][0]
+    for index in range(1, 3):
+        cases[0]["diagnoses"].append(
+            dict(copy.deepcopy(diagnosis), diagnosis_id=f"diagnosis-{index}")
+        )
+    return cases
+
+
+def test_entities_written_once():
+    cases = three_diagnosis_cases()
+    normalizer = normalize.Normalizer()
+    diagnoses = examples(normalized_yaml(cases, normalizer))
+    assert len(diagnoses) == 5
+    assert normalizer.conflicts == []
+
+    # The first diagnosis of the first case has its subject and specimens in full, and
+    # the others refer to them.
+    (first, *others) = diagnoses[:3]
+    assert len(first["subject"]) > 1
+    assert all(len(specimen) > 1 for specimen in first["related_specimen"])
+    for diagnosis in others:
+        assert diagnosis["subject"] == {"id": first["subject"]["id"]}
+        assert diagnosis["related_specimen"] == [
+            {"id": specimen["id"]} for specimen in first["related_specimen"]
+        ]
+
+    # Normalized output is smaller than nested output, however often entities repeat.
+    assert len(normalized_yaml(cases)) < len(nested_yaml(cases))
+    cases = read_pdc_cases(10)
+    assert len(normalized_yaml(cases)) <= len(nested_yaml(cases))
+
+
+def test_entities_with_different_ids_are_kept_apart():
+    # The per-sample subjects of the specimens share the PDC case_id of the subject of
+    # the diagnosis, but they are different entities, so nothing is merged.
+    cases = read_pdc_cases(1)
+    (diagnosis,) = examples(normalized_yaml(cases))
+    case_id = diagnosis["subject"]["identifier"][0]
+    for specimen in diagnosis["related_specimen"]:
+        source_subject = specimen["source_subject"]
+        assert source_subject["id"] != diagnosis["subject"]["id"]
+        assert case_id in source_subject["identifier"]
+    assert normalized_yaml(cases) == nested_yaml(cases)
+
+
+def test_conflicting_definitions(caplog):
+    # Converting a changed case at the same position gives its subject the same ID,
+    # with different contents.
+    (case,) = read_pdc_cases(1)
+    changed_case = dict(copy.deepcopy(case), case_id="changed-case-id")
+    normalizer = normalize.Normalizer()
+    with caplog.at_level(logging.WARNING):
+        text = (
+            normalized_yaml([case], normalizer)
+            + "---\n"
+            + normalized_yaml([changed_case], normalizer)
+        )
+
+    # Both definitions are written in full, and the conflict is reported.
+    (first, second) = examples(text)
+    subject_id = first["subject"]["id"]
+    assert second["subject"]["id"] == subject_id
+    assert first["subject"] != second["subject"]
+    assert "changed-case-id" in str(second["subject"]["identifier"])
+    assert subject_id in normalizer.conflicts
+    assert subject_id in caplog.text
+
+
+def test_denormalize():
+    for cases in [read_pdc_cases(5), three_diagnosis_cases()]:
+        nested = list(yaml.safe_load_all(nested_yaml(cases)))
+        denormalized = list(
+            normalize.denormalize(yaml.safe_load_all(normalized_yaml(cases)))
+        )
+        assert denormalized == nested
@@ -0,0 +1,94 @@
+#
+# test_pipeline.py - Tests for running conversion stages concurrently.
+#
+
+import concurrent.futures
+import threading
+
+import pytest
+
+import instrument
+import pipeline
+
+
+def square(n):
+    return n * n
+
+
+def test_run_in_order():
+    results = []
+    pipeline.run(((n,) for n in range(100)), square, results.append, queue_size=2)
+    assert results == [n * n for n in range(100)]
+
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        pipeline.run(((n,) for n in range(100)), square, results.append, executor, 3)
+    assert results == [n * n for n in range(100)]
+
+
+def test_backpressure():
+    # Block the write stage, and check that reading stops a few queues ahead of it.
+    read = []
+    release = threading.Event()
+
+    def items():
+        for n in range(1000):
+            read.append(n)
+            yield (n,)
+
+    def write(result):
+        release.wait()
+
+    thread = threading.Thread(
+        target=pipeline.run, args=(items(), square, write), kwargs={"queue_size": 5}
+    )
+    thread.start()
+    try:
+        threading.Event().wait(0.5)
+        # One item in each queue slot, one in each stage, and one being put on a queue.
+        assert len(read) <= 5 * 2 + 3 + 2
+    finally:
+        release.set()
+        thread.join()
+    assert len(read) == 1000
+
+
+@pytest.mark.parametrize("failing_stage", pipeline.STAGES)
+def test_failure(failing_stage):
+    def fail(stage):
+        if stage == failing_stage:
+            raise ValueError(stage)
+
+    def items():
+        for n in range(100):
+            if n == 50:
+                fail("read")
+            yield (n,)
+
+    def convert(n):
+        if n == 50:
+            fail("convert")
+        return n
+
+    def write(n):
+        if n == 50:
+            fail("write")
+
+    with pytest.raises(ValueError, match=failing_stage):
+        pipeline.run(items(), convert, write, queue_size=2)
+
+
+def test_throughput():
+    instrument.reset()
+    instrument.enable()
+    try:
+        pipeline.run(((n,) for n in range(10)), square, lambda result: None)
+        stages = pipeline.throughput(instrument.metrics())
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+    assert list(stages) == pipeline.STAGES
+    for stage in stages.values():
+        assert stage["items"] == 10
+        assert stage["items_per_second"] > 0
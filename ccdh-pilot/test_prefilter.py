@@ -0,0 +1,115 @@
+#
+# test_prefilter.py - Tests for checking enumerated values before full validation.
+#
+
+import instrument
+import prefilter
+import validate
+
+# A tiny schema in which a Subject has a species code and a list of codings, each of
+# which refers to a value set, and may refer back to another Subject.
+SCHEMA = {
+    "$defs": {
+        "EnumSpecies": {"enum": ["Homo sapiens", "Mus musculus"]},
+        "Coding": {
+            "properties": {
+                "code": {"$ref": "#/$defs/EnumSpecies"},
+                "system": {"const": "NCBITaxon"},
+                "display": {"anyOf": [{"enum": ["Human"]}, {"type": "string"}]},
+            }
+        },
+        "Subject": {
+            "properties": {
+                "species": {"$ref": "#/$defs/EnumSpecies"},
+                "codings": {"type": "array", "items": {"$ref": "#/$defs/Coding"}},
+                "parent": {"$ref": "#/$defs/Subject"},
+            }
+        },
+    }
+}
+
+
+def subject(key, species, codings=()):
+    return {key: {"Example": {"species": species, "codings": list(codings)}}}
+
+
+def test_compile_enum_paths():
+    paths = {
+        enum_path.path: enum_path.enum
+        for enum_path in prefilter.compile_enum_paths(SCHEMA, "Subject")
+    }
+    assert paths == {
+        ("species",): ["Homo sapiens", "Mus musculus"],
+        ("codings", "*", "code"): ["Homo sapiens", "Mus musculus"],
+        ("codings", "*", "system"): ["NCBITaxon"],
+    }
+
+
+def test_partition():
+    valid = subject(
+        "a_subject", "Homo sapiens", [{"code": "Mus musculus", "display": "Mouse"}]
+    )
+    invalid_species = subject("b_subject", "Human")
+    invalid_coding = subject(
+        "c_subject",
+        "Homo sapiens",
+        [{"code": "Homo sapiens", "system": "NCBITaxon"}, {"system": "ncbitaxon"}],
+    )
+    unknown = {"unknown": {"Example": {"species": "Human"}}}
+
+    instrument.reset()
+    instrument.enable()
+    try:
+        (passed, failed) = prefilter.Prefilter(SCHEMA).partition(
+            [valid, invalid_species, unknown, invalid_coding]
+        )
+        counters = instrument.metrics()["counters"]
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+    assert passed == [valid, unknown]
+    assert [
+        (entry, [(key, error.path, error.message) for (key, error) in errors])
+        for (entry, errors) in failed
+    ] == [
+        (
+            invalid_species,
+            [
+                (
+                    "b_subject",
+                    ["species"],
+                    "'Human' is not one of ['Homo sapiens', 'Mus musculus']",
+                )
+            ],
+        ),
+        (
+            invalid_coding,
+            [
+                (
+                    "c_subject",
+                    ["codings", 1, "system"],
+                    "'ncbitaxon' is not one of ['NCBITaxon']",
+                )
+            ],
+        ),
+    ]
+    assert counters["prefiltered_documents"] == 4
+    assert counters["prefilter_failures"] == 2
+
+
+def test_validator_skips_prefiltered_documents():
+    instrument.reset()
+    instrument.enable()
+    try:
+        validator = validate.Validator(SCHEMA, prefilter=True)
+        errors = list(validator.iter_errors(subject("example_subject", "Human")))
+        counters = instrument.metrics()["counters"]
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+    assert [(key, error.path) for (key, error) in errors] == [
+        ("example_subject", ["species"])
+    ]
+    assert "validated_documents" not in counters
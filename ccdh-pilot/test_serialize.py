@@ -0,0 +1,29 @@
+#
+# test_serialize.py - Tests for writing CRDC-H instance data one document at a time.
+#
+
+import io
+
+import serialize
+
+
+def test_turtle_stream_writer():
+    f = io.StringIO()
+    writer = serialize.TurtleStreamWriter(f)
+    writer.write(
+        '@prefix crdch: <https://example.org/crdch/> .\n\n[] crdch:id "1" .\n\n'
+    )
+    writer.write(
+        "@prefix crdch: <https://example.org/crdch/> .\n"
+        "@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .\n\n"
+        '[] crdch:id "2" .\n\n'
+    )
+    writer.close()
+
+    # Each prefix is only declared once, before it is first used.
+    assert f.getvalue() == (
+        "@prefix crdch: <https://example.org/crdch/> .\n\n"
+        '[] crdch:id "1" .\n\n'
+        "@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .\n\n"
+        '[] crdch:id "2" .\n\n'
+    )
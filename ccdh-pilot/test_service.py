@@ -0,0 +1,81 @@
+#
+# test_service.py - Tests for converting case exports as they land in a directory.
+#
+
+import json
+import os
+
+import yaml
+
+import service
+import transform_pdc
+
+
+def test_source_for():
+    assert service.source_for("incoming/gdc-delta-0001.json.gz") == "gdc"
+    assert service.source_for("PDC_cases.tsv") == "pdc"
+    assert service.source_for("cda.json") == "cda"
+    assert service.source_for("gdcx.json") is None
+    assert service.source_for("cases.json", default="pdc") == "pdc"
+
+
+def test_output_name():
+    assert service.output_name("in/gdc-1.json.gz", "yaml") == "gdc-1.json.gz.yaml"
+    assert service.output_name("in/pdc.tsv", "ttl") == "pdc.tsv.ttl"
+
+    # Exports that only differ in their extensions are written to different files.
+    names = ["gdc-1.json", "gdc-1.json.gz", "gdc-1.tsv", "gdc-1.tsv.gz"]
+    assert len({service.output_name(name, "yaml") for name in names}) == len(names)
+
+
+def test_directory_watcher(tmp_path):
+    watcher = service.DirectoryWatcher(str(tmp_path))
+    path = tmp_path / "gdc-1.json"
+    path.write_text("[")
+    (tmp_path / ".partial.tmp").write_text("")
+    (tmp_path / "subdirectory").mkdir()
+
+    # A file is only reported once it hasn't changed between two polls...
+    assert watcher.poll() == []
+    with open(path, "a") as f:
+        f.write("]")
+    assert watcher.poll() == []
+    assert watcher.poll() == [str(path)]
+
+    # ... and only once.
+    assert watcher.poll() == []
+    os.utime(path, ns=(0, 0))
+    assert watcher.poll() == []
+
+
+def test_convert_file(tmp_path, pdc_head_and_mouth):
+    pdc_cases = pdc_head_and_mouth[:3]
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    converted = tmp_path / "converted"
+    converted.mkdir()
+
+    conversion_service = service.ConversionService(str(converted))
+    conversion_service.warm_up(["pdc"])
+    job = conversion_service.jobs["pdc"]
+    for i in range(2):
+        input_file = incoming / f"pdc-{i}.json"
+        with open(input_file, "w") as f:
+            json.dump(pdc_cases, f)
+        (output_path, error_count) = conversion_service.convert_file(input_file, "pdc")
+        assert error_count == 0
+
+        # The same job converts every export, and its output is the same as the
+        # demonstrator's.
+        assert conversion_service.jobs["pdc"] is job
+        assert output_path == str(converted / f"pdc-{i}.json.yaml")
+        expected = yaml.dump_all(
+            list(transform_pdc.transform_cases(pdc_cases)),
+            Dumper=yaml.SafeDumper,
+            sort_keys=False,
+        )
+        with open(output_path) as f:
+            assert f.read() == expected
+
+    # No temporary files are left behind.
+    assert sorted(os.listdir(converted)) == ["pdc-0.json.yaml", "pdc-1.json.yaml"]
@@ -0,0 +1,103 @@
+#
+# test_sharding.py - Tests for writing converted data into size-bounded shards.
+#
+
+import json
+
+import yaml
+
+import convert
+import serialize
+import sharding
+import snapshot
+import transform_pdc
+
+
+def read_pdc_cases(count):
+    return snapshot.load(snapshot.PDC_HEAD_AND_MOUTH)[:count]
+
+
+def test_sharded_writer(tmp_path):
+    documents = [{f"example_{i}_diagnosis": {"Example": {"id": i}}} for i in range(10)]
+    path = str(tmp_path / "examples.yaml.gz")
+
+    with sharding.ShardedWriter(path, max_documents=4) as writer:
+        for document in documents:
+            writer.write(serialize.yaml_document(document))
+
+    manifest_path = sharding.manifest_path(path)
+    assert manifest_path == str(tmp_path / "examples.manifest.json")
+    manifest = sharding.read_manifest(manifest_path)
+    assert manifest["complete"]
+    assert manifest["documents"] == 10
+    assert [shard["path"] for shard in manifest["shards"]] == [
+        "examples-00000.yaml.gz",
+        "examples-00001.yaml.gz",
+        "examples-00002.yaml.gz",
+    ]
+    assert [shard["documents"] for shard in manifest["shards"]] == [4, 4, 2]
+    assert manifest["shards"][1]["first_key"] == "example_4_diagnosis"
+    assert manifest["shards"][1]["last_key"] == "example_7_diagnosis"
+    assert list(sharding.iter_documents(manifest_path)) == documents
+
+    # Writing the output again replaces all of the old shards.
+    with sharding.ShardedWriter(path, max_bytes=1 << 20) as writer:
+        writer.write(serialize.yaml_document(documents[0]))
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "examples-00000.yaml.gz",
+        "examples.manifest.json",
+    ]
+
+
+def test_shard_bytes(tmp_path):
+    pdc_cases = read_pdc_cases(10)
+    input_file = tmp_path / "pdc.json"
+    with open(input_file, "w") as f:
+        json.dump(pdc_cases, f)
+
+    output_file = tmp_path / "pdc.yaml"
+    convert.main(
+        ["pdc", "--in", str(input_file), "--out", str(output_file)]
+        + ["--no-validate", "--shard-bytes", "10000"]
+    )
+
+    manifest = sharding.read_manifest(tmp_path / "pdc.manifest.json")
+    assert len(manifest["shards"]) > 1
+    for shard in manifest["shards"]:
+        assert shard["bytes"] <= 10000
+        with open(shard["full_path"], "rb") as f:
+            assert len(f.read()) == shard["bytes"]
+
+    # Concatenating the shards gives the same documents as the unsharded output.
+    expected = list(transform_pdc.transform_cases(pdc_cases))
+    expected = yaml.safe_load_all(
+        yaml.dump_all(expected, Dumper=yaml.SafeDumper, sort_keys=False)
+    )
+    assert list(sharding.iter_documents(tmp_path / "pdc.manifest.json")) == list(
+        expected
+    )
+
+
+def test_dump_all(tmp_path, monkeypatch):
+    documents = [{f"example_{i}_diagnosis": {"Example": {"id": i}}} for i in range(10)]
+
+    # Without sharding, the output is the same as yaml.dump_all()'s.
+    monkeypatch.delenv("CRDCH_SHARD_DOCUMENTS", raising=False)
+    monkeypatch.delenv("CRDCH_SHARD_BYTES", raising=False)
+    monkeypatch.delenv("CRDCH_COMPRESSION", raising=False)
+    sharding.dump_all(documents, str(tmp_path / "examples.yaml"))
+    assert (tmp_path / "examples.yaml").read_text() == yaml.dump_all(
+        documents, Dumper=yaml.SafeDumper, sort_keys=False
+    )
+
+    monkeypatch.setenv("CRDCH_SHARD_DOCUMENTS", "4")
+    sharding.dump_all(documents, str(tmp_path / "examples.yaml"))
+    manifest_path = tmp_path / "examples.manifest.json"
+    assert len(sharding.read_manifest(manifest_path)["shards"]) == 3
+    assert list(sharding.iter_documents(manifest_path)) == documents
+
+    # Switching layouts removes the files of the other one.
+    assert not (tmp_path / "examples.yaml").exists()
+    monkeypatch.delenv("CRDCH_SHARD_DOCUMENTS")
+    sharding.dump_all(documents, str(tmp_path / "examples.yaml"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["examples.yaml"]
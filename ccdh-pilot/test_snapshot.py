@@ -0,0 +1,60 @@
+#
+# test_snapshot.py - Tests for snapshots of parsed JSON case exports.
+#
+
+import gzip
+import json
+import os
+
+import instrument
+import snapshot
+
+CASES = [{"case_id": "a", "samples": [{"sample_id": "b"}]}, {"case_id": "c"}]
+
+
+def load_counting(path):
+    """Load `path`, and return the data and the snapshot counters."""
+    instrument.reset()
+    instrument.enable()
+    try:
+        data = snapshot.load(path)
+        counters = instrument.metrics()["counters"]
+    finally:
+        instrument.disable()
+        instrument.reset()
+    return (data, counters)
+
+
+def test_load(tmp_path):
+    path = tmp_path / "cases.json"
+    path.write_text(json.dumps(CASES))
+
+    assert load_counting(path) == (CASES, {"snapshot_misses": 1})
+    assert os.path.exists(f"{path}{snapshot.SNAPSHOT_SUFFIX}")
+    assert load_counting(path) == (CASES, {"snapshot_hits": 1})
+
+    # Touching the export doesn't make the snapshot out of date...
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_counting(path) == (CASES, {"snapshot_hits": 1})
+
+    # ... but changing it does.
+    path.write_text(json.dumps(CASES[:1]))
+    assert load_counting(path) == (CASES[:1], {"snapshot_misses": 1})
+    assert load_counting(path) == (CASES[:1], {"snapshot_hits": 1})
+
+
+def test_load_compressed(tmp_path):
+    path = tmp_path / "cases.json.gz"
+    with gzip.open(path, "wt") as f:
+        json.dump(CASES, f)
+    assert snapshot.load(path) == CASES
+    assert snapshot.load(path) == CASES
+
+
+def test_disabled(tmp_path, monkeypatch):
+    monkeypatch.setenv("CRDCH_SNAPSHOTS", "off")
+    path = tmp_path / "cases.json"
+    path.write_text(json.dumps(CASES))
+    assert snapshot.load(path) == CASES
+    assert not os.path.exists(f"{path}{snapshot.SNAPSHOT_SUFFIX}")
@@ -0,0 +1,122 @@
+#
+# test_sources.py - Tests for reading source data exports one case at a time.
+#
+
+import csv
+import io
+import json
+import re
+import xml.dom.minidom
+
+import pytest
+
+import sources
+import staging
+
+
+def test_iter_json_array():
+    with open("head-and-mouth/pdc-head-and-mouth.json") as f:
+        pdc_head_and_mouth = json.load(f)
+
+    # Use a tiny chunk size so that most cases span several chunks.
+    with open("head-and-mouth/pdc-head-and-mouth.json") as f:
+        assert list(sources.iter_json_array(f, chunk_size=100)) == pdc_head_and_mouth
+
+
+def test_iter_json_array_edge_cases():
+    assert list(sources.iter_json_array(io.StringIO(" [ ] "))) == []
+    assert list(sources.iter_json_array(io.StringIO('[1, "a", {"b": [2]}]'), 2)) == [
+        1,
+        "a",
+        {"b": [2]},
+    ]
+
+    with pytest.raises(ValueError):
+        list(sources.iter_json_array(io.StringIO('{"a": 1}')))
+
+    with pytest.raises(ValueError):
+        list(sources.iter_json_array(io.StringIO('[{"a": 1}, {"b":')))
+
+
+def flatten(value, path, row):
+    # Flatten a case into a row of a GDC TSV export, as a dictionary from column names.
+    if isinstance(value, dict):
+        for (key, item) in value.items():
+            flatten(item, f"{path}.{key}" if path else key, row)
+    elif isinstance(value, list):
+        for (index, item) in enumerate(value):
+            flatten(item, f"{path}.{index}", row)
+    elif value is not None:
+        row[path] = str(value)
+
+
+def test_iter_tsv_cases():
+    with open("cptac2-subject-09CO022/gdc_subject_09CO022.json") as f:
+        gdc_case = json.load(f)
+    assert list(
+        sources.read_cases("cptac2-subject-09CO022/gdc_subject_09CO022.tsv")
+    ) == [gdc_case]
+
+
+def test_tsv_round_trip(tmp_path):
+    with open("head-and-mouth/gdc-head-and-mouth.json") as f:
+        gdc_cases = json.load(f)[:50]
+
+    rows = []
+    for case in gdc_cases:
+        rows.append({})
+        flatten(case, "", rows[-1])
+    columns = sorted(set(column for row in rows for column in row))
+
+    tsv_path = tmp_path / "cases.tsv"
+    with open(tsv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns, delimiter="\t")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    # Everything the transforms use is read back exactly as it was in JSON.
+    tsv_cases = list(sources.read_cases(str(tsv_path)))
+    assert list(staging.stage_cases(tsv_cases)) == list(staging.stage_cases(gdc_cases))
+    assert [len(chunk) for chunk in sources.chunked(tsv_cases, 20)] == [20, 20, 10]
+
+
+def test_tsv_header_conflicts():
+    with pytest.raises(ValueError):
+        sources.compile_tsv_header(["samples", "samples.0.sample_id"])
+
+
+def test_iter_xml_cases():
+    with open("cptac2-subject-09CO022/gdc_subject_09CO022.json") as f:
+        gdc_case = json.load(f)
+    assert list(
+        sources.read_cases("cptac2-subject-09CO022/gdc_subject_09CO022.xml")
+    ) == [gdc_case]
+
+
+def test_write_pretty_xml():
+    with open("cptac2-subject-09CO022/gdc_subject_09CO022.xml") as f:
+        pretty = f.read()
+
+    # The XML in the repository was pretty-printed from the compact XML returned by the
+    # GDC API, using xml.dom.minidom.
+    compact = re.sub(r">\s+<", "><", pretty)
+    out = io.StringIO()
+    sources.write_pretty_xml(io.BytesIO(compact.encode("utf-8")), out, chunk_size=100)
+    assert out.getvalue() == pretty
+
+    document = '<a b="&quot;"><c>1 &lt; 2 &amp; 3</c><d/><e></e></a>'
+    out = io.StringIO()
+    sources.write_pretty_xml(io.StringIO(document), out)
+    assert out.getvalue() == xml.dom.minidom.parseString(document).toprettyxml()
+
+
+def test_iter_json_array_spans():
+    text = ' [ {"a": "é"},\n 2, "three" ]'
+    for chunk_size in [1, 3, 100]:
+        spans = list(sources.iter_json_array_spans(io.StringIO(text), chunk_size))
+        assert [element for (element, _, _) in spans] == [{"a": "é"}, 2, "three"]
+        assert [text[start:end] for (_, start, end) in spans] == [
+            '{"a": "é"}',
+            "2",
+            '"three"',
+        ]
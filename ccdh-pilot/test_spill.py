@@ -0,0 +1,89 @@
+#
+# test_spill.py - Tests for collecting output within a memory budget.
+#
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import spill
+
+
+def test_parse_size():
+    assert spill.parse_size("512") == 512
+    assert spill.parse_size("64k") == 64 * 1024
+    assert spill.parse_size("2M") == 2 * 1024 * 1024
+    with pytest.raises(ValueError):
+        spill.parse_size("lots")
+
+
+def test_peak_rss_bytes():
+    peak = spill.peak_rss_bytes()
+    assert peak is None or peak > 1024 * 1024
+
+
+@pytest.mark.skipif(spill.peak_rss_bytes() is None, reason="peak RSS is not known")
+def test_check_peak_rss():
+    peak = spill.peak_rss_bytes()
+    assert spill.check_peak_rss("test", 2 * peak) >= peak
+    with pytest.raises(MemoryError):
+        spill.check_peak_rss("test", 1024)
+
+
+# Converts an export the way the GDC demonstrator does, and checks that the peak RSS
+# grew by no more than BUDGET_MARGIN while doing so. The first case is converted
+# beforehand, so that the modules the transforms import are already loaded.
+CONVERT_WITHIN_BUDGET = """
+import itertools
+import sys
+
+import sharding
+import sources
+import spill
+import transform_gdc
+
+(input_path, output_path, margin) = sys.argv[1:]
+first_case = itertools.islice(sources.read_cases(input_path), 1)
+list(transform_gdc.transform_cases(first_case))
+budget = spill.peak_rss_bytes() + int(margin)
+cases = sources.read_cases(input_path)
+sharding.dump_all(transform_gdc.transform_cases(cases), output_path)
+spill.check_peak_rss(output_path, budget)
+"""
+
+# How much the peak RSS may grow while converting an export in test_bounded_memory().
+BUDGET_MARGIN = 32 * 1024 * 1024
+
+
+@pytest.mark.skipif(spill.peak_rss_bytes() is None, reason="peak RSS is not known")
+def test_bounded_memory(tmp_path, gdc_head_and_mouth):
+    # An export of twice the budget, most of which is in cases without diagnoses,
+    # which would take several times the budget to hold in memory.
+    padding = "x" * (256 * 1024)
+    cases = list(gdc_head_and_mouth[:20])
+    cases.extend(
+        {"case_id": f"padding-{n}", "diagnoses": [], "notes": padding}
+        for n in range(2 * BUDGET_MARGIN // len(padding))
+    )
+    input_path = tmp_path / "gdc.json"
+    with open(input_path, "w") as f:
+        json.dump(cases, f)
+    output_path = tmp_path / "gdc.yaml"
+
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            CONVERT_WITHIN_BUDGET,
+            str(input_path),
+            str(output_path),
+            str(BUDGET_MARGIN),
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "CRDCH_SHARD_DOCUMENTS": "", "CRDCH_SHARD_BYTES": ""},
+        check=True,
+    )
+    assert output_path.read_text().count("\n---\n") > 0
@@ -0,0 +1,49 @@
+#
+# test_staging.py - Tests for the compact staging records for source cases.
+#
+
+import pickle
+
+import serialize
+import snapshot
+import staging
+import transform_gdc
+
+
+def read_gdc_cases(count):
+    return snapshot.load(snapshot.GDC_HEAD_AND_MOUTH)[:count]
+
+
+def test_from_json():
+    (gdc_case,) = read_gdc_cases(1)
+    case = staging.Case.from_json(gdc_case)
+
+    assert case.case_id == gdc_case["case_id"]
+    assert case.submitter_id == gdc_case["submitter_id"]
+    assert len(case.samples) == len(gdc_case["samples"])
+    assert len(case.diagnoses) == len(gdc_case["diagnoses"])
+
+    # Only the fields the transforms use are kept, and fields missing from the source
+    # are None.
+    diagnosis = case.diagnoses[0]
+    assert diagnosis.primary_diagnosis == gdc_case["diagnoses"][0]["primary_diagnosis"]
+    assert not hasattr(diagnosis, "__dict__")
+    assert not hasattr(diagnosis, "ajcc_clinical_m")
+    assert staging.Sample.from_json({}).sample_id is None
+    assert staging.Case.from_json({"case_id": "case"}).diagnoses == []
+
+    assert staging.stage_case(case) is case
+    assert pickle.loads(pickle.dumps(case)) == case
+
+
+def test_transform_staged_cases():
+    gdc_cases = read_gdc_cases(5)
+
+    def dump(cases):
+        return "---\n".join(
+            serialize.yaml_document(document)
+            for (case_index, case) in enumerate(cases)
+            for document in transform_gdc.transform_case(case, case_index)
+        )
+
+    assert dump(staging.stage_cases(gdc_cases)) == dump(gdc_cases)
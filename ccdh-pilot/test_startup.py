@@ -0,0 +1,68 @@
+#
+# test_startup.py - Make sure the conversion and validation entry points start quickly,
+# by only importing heavy dependencies once they are actually needed.
+#
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Dependencies that should only be imported when they are first used.
+HEAVY_MODULES = [
+    "crdch_model",
+    "jsonschema",
+    "linkml",
+    "linkml_runtime",
+    "rdflib",
+    "requests",
+]
+
+# The modules that conversion and validation runs start from.
+ENTRY_POINTS = ["convert", "validate", "serialize", "transform_gdc", "transform_pdc"]
+
+# The maximum time importing an entry point may take, in seconds. This is generous:
+# entry points currently import in a few tens of milliseconds, while importing the
+# heavy dependencies takes over a second.
+IMPORT_TIME_BUDGET = 0.25
+
+
+def run_python(*args):
+    """Run a fresh Python interpreter in this directory and return its result."""
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+@pytest.mark.parametrize("entry_point", ENTRY_POINTS)
+def test_heavy_modules_are_imported_lazily(entry_point):
+    result = run_python(
+        "-c",
+        f"import json, sys, {entry_point}; "
+        + "print(json.dumps(sorted(set(m.split('.')[0] for m in sys.modules))))",
+    )
+    imported = set(json.loads(result.stdout))
+    assert imported.intersection(HEAVY_MODULES) == set()
+
+
+@pytest.mark.parametrize("entry_point", ENTRY_POINTS)
+def test_import_time_budget(entry_point):
+    result = run_python("-X", "importtime", "-c", f"import {entry_point}")
+
+    # Lines look like "import time:  self [us] | cumulative | imported package".
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if fields[2].strip() == entry_point:
+            cumulative_us = int(fields[1])
+
+    assert cumulative_us is not None
+    assert cumulative_us / 1_000_000 < IMPORT_TIME_BUDGET
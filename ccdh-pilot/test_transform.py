@@ -0,0 +1,48 @@
+#
+# test_transform.py - Tests for the shared transform helpers.
+#
+
+import pytest
+
+import serialize
+import transform
+import transform_gdc
+
+
+def test_id_part():
+    assert transform.id_part(3, "0b2d1c3e-1a2b-4c5d-8e9f-0a1b2c3d4e5f") == "3"
+    with transform.id_scheme("stable"):
+        assert (
+            transform.id_part(3, "0b2d1c3e-1a2b-4c5d-8e9f-0a1b2c3d4e5f")
+            == "0b2d1c3e-1a2b-4c5d-8e9f-0a1b2c3d4e5f"
+        )
+        # Identifiers that can't be used as they are are hashed, and records without
+        # identifiers are identified by their position.
+        hashed = transform.id_part(3, "TCGA:CV 5443")
+        assert len(hashed) == 16 and hashed == transform.id_part(4, "TCGA:CV 5443")
+        assert transform.id_part(3, None) == "3"
+    assert transform.id_part(3, "0b2d1c3e") == "3"
+
+    with pytest.raises(ValueError):
+        with transform.id_scheme("random"):
+            pass
+
+
+def test_stable_ids_do_not_depend_on_order(gdc_head_and_mouth):
+    gdc_cases = gdc_head_and_mouth[:5]
+
+    def convert(cases):
+        return {
+            key: serialize.yaml_document(document)
+            for (case_index, case) in cases
+            for document in transform_gdc.transform_case(case, case_index)
+            for key in document
+        }
+
+    with transform.id_scheme("stable"):
+        in_order = convert(enumerate(gdc_cases))
+        reversed_shard = convert(enumerate(reversed(gdc_cases[2:])))
+        shard = convert(enumerate(gdc_cases[:2]))
+
+    assert {**shard, **reversed_shard} == in_order
+    assert any(gdc_cases[0]["case_id"] in key for key in in_order)
@@ -4,339 +4,33 @@
 # test_transform_gdc.py - Import GDC data via public APIs and transform them into CRDC-H Instance data.
 #
 
-import json
-import yaml
-
-import crdch_model
+import instrument
+import sharding
+import snapshot
+import sources
+import spill
 import transform
-
-# Some general constants
-EXAMPLE_PREFIX = "gdc_head_and_mouth_example:"
-NCIT_URL = "http://ncithesaurus.nci.nih.gov"
-CCDH_URL = "http://crdc.nci.nih.gov/ccdh"
-GDC_URL = "http://crdc.nci.nih.gov/gdc"
-ICD10_URL = "http://hl7.org/fhir/ValueSet/icd-10"
-
-
-# Some codeable concepts we use repeatedly.
-DAY = transform.codeable_concept(NCIT_URL, "C25301", "Day", tags=["harmonized"])
-MILLIGRAM = transform.codeable_concept(
-    NCIT_URL, "C28253", "Milligram", tags=["harmonized"]
-)
-
-
-# Convert a single GDC sample into a CRDC-H specimen.
-def create_specimen(
-    gdc_sample, sample_index, gdc_diagnosis, diagnosis_index, gdc_case, case_index
-):
-    specimen = crdch_model.Specimen(
-        id=f"{EXAMPLE_PREFIX}case_{case_index}_sample_{sample_index}",
-    )
-
-    if gdc_sample.get("sample_id"):
-        specimen.identifier = [
-            crdch_model.Identifier(value=gdc_sample.get("sample_id"), system=GDC_URL)
-        ]
-
-    if gdc_sample.get("submitter_id"):
-        submitter_identifier = crdch_model.Identifier(
-            value=gdc_sample.get("submitter_id"), system=GDC_URL
-        )
-        if specimen.identifier:
-            specimen.identifier.append(submitter_identifier)
-        else:
-            specimen.identifier = [submitter_identifier]
-
-    # TODO: figure out what to do about associated_project.
-
-    # Make sure this is right.
-    if gdc_sample.get("submitter_id"):
-        specimen.source_subject = crdch_model.Subject(
-            id=f"{EXAMPLE_PREFIX}case_{case_index}_sample_{sample_index}_subject"
-        )
-        specimen.source_subject.identifier = [
-            crdch_model.Identifier(
-                value=gdc_sample.get("submitter_id"), system=f"{GDC_URL}#submitter_id"
-            )
-        ]
-
-    if gdc_case.get("case_id"):
-        case_id = crdch_model.Identifier(
-            value=gdc_case.get("case_id"), system=f"{GDC_URL}#case_id"
-        )
-        if specimen.source_subject:
-            specimen.source_subject.identifier.append(case_id)
-        else:
-            specimen.source_subject = [case_id]
-
-    # TODO: How do we calculate the Sample.type?
-
-    if gdc_sample.get("sample_type"):
-        specimen.source_material_type = transform.codeable_concept(
-            GDC_URL, gdc_sample.get("sample_type")
-        )
-
-    # TODO: get the project_id somehow.
-
-    if gdc_sample.get("tissue_type"):
-        specimen.general_tissue_pathology = transform.codeable_concept(
-            GDC_URL, gdc_sample.get("tissue_type")
-        )
-
-    if gdc_sample.get("tumor_code"):
-        specimen.specific_tissue_pathology = transform.codeable_concept(
-            GDC_URL, gdc_sample.get("tumor_code")
-        )
-
-    if gdc_sample.get("tumor_descriptor"):
-        specimen.tumor_status_at_collection = transform.codeable_concept(
-            GDC_URL, gdc_sample.get("tumor_descriptor")
-        )
-
-    if gdc_sample.get("current_weight"):
-        specimen.quantity_measure = crdch_model.SpecimenQuantityObservation(
-            observation_type=transform.codeable_concept(
-                NCIT_URL, "C25208", "Weight", tags=["harmonized"]
-            ),
-            value_quantity=transform.quantity_decimal(
-                gdc_sample.get("current_weight"), unit=MILLIGRAM
-            ),
-        )
-
-    # The following fields relate to the Specimen.creation_activity.
-
-    if gdc_sample.get("days_to_collection"):
-        date_ended = crdch_model.TimePoint(
-            offset_from_index=transform.quantity_decimal(
-                gdc_sample.get("days_to_collection"), DAY
-            ),
-            index_time_point=crdch_model.TimePoint(
-                event_type=transform.codeable_concept(
-                    NCIT_URL, "C142714", "Study Start", tags=["harmonized"]
-                )
-            ),
-        )
-        specimen.creation_activity = crdch_model.SpecimenCreationActivity(
-            date_ended=date_ended
-        )
-
-    if gdc_sample.get("initial_weight"):
-        initial_weight = transform.quantity_decimal(
-            gdc_sample.get("initial_weight"), MILLIGRAM
-        )
-        if specimen.creation_activity:
-            specimen.creation_activity.quantity_collected = initial_weight
-        else:
-            specimen.creation_activity = crdch_model.SpecimenCreationActivity(
-                quantity_collected=initial_weight
-            )
-
-    if gdc_sample.get("biospecimen_anatomic_site"):
-        biospecimen_anatomic_site = transform.codeable_concept(
-            GDC_URL,
-            gdc_sample.get("biospecimen_anatomic_site"),
-            label=gdc_sample.get("biospecimen_anatomic_site"),
-        )
-        if specimen.creation_activity:
-            specimen.creation_activity.collection_site = crdch_model.BodySite(
-                site=biospecimen_anatomic_site
-            )
-        else:
-            specimen.creation_activity = crdch_model.SpecimenCreationActivity(
-                collection_site=crdch_model.BodySite(site=biospecimen_anatomic_site)
-            )
-
-    # if gdc_sample.get('time_between_excision_and_freezing'):
-    #     time_obs = crdch_model.ExecutionTimeObservation(
-    #         observation_type=transform.codeable_concept(CCDH_URL, 'time_between_excision_and_freezing', label='time_between_excision_and_freezing'),
-    #         value_quantity=quantity(gdc_sample.get('time_between_excision_and_freezing'), DAY)
-    #     )
-    #     if not specimen.creation_activity:
-    #         specimen.creation_activity = crdch_model.SpecimenCreationActivity()
-    #     if specimen.creation_activity.execution_time_observation:
-    #         specimen.creation_activity.execution_time_observation.append(time_obs)
-    #     else:
-    #         specimen.creation_activity.execution_time_observation = [time_obs]
-
-    # The following fields relate to the Specimen.processing_activity.
-    if gdc_sample.get("preservation_method"):
-        specimen.processing_activity = [
-            crdch_model.SpecimenProcessingActivity(
-                activity_type=transform.codeable_concept(
-                    GDC_URL, gdc_sample.get("preservation_method")
-                )
-            )
-        ]
-
-    if gdc_sample.get("freezing_method"):
-        method_type = transform.codeable_concept(
-            GDC_URL, gdc_sample.get("freezing_method")
-        )
-        if len(specimen.processing_activity) > 0:
-            specimen.processing_activity[0].method_type = method_type
-        else:
-            specimen.processing_activity = [
-                crdch_model.SpecimenProcessingActivity(method_type=method_type)
-            ]
-
-    return specimen
+import transform_gdc
 
 
 # Demonstrators
 def test_transform_gdc_head_and_mouth():
-    with open("head-and-mouth/gdc-head-and-mouth.json") as file:
-        gdc_head_and_mouth = json.load(file)
-
-    # Each entry is a GDC case. To transform this into CRDC-H instance data, we need to
-    # transform it as a series of diagnoses.
-    diagnoses = []
-    for (case_index, gdc_case) in enumerate(gdc_head_and_mouth):
-        for (diag_index, gdc_diagnosis) in enumerate(gdc_case["diagnoses"]):
-            diagnosis = crdch_model.Diagnosis(
-                id=f"{EXAMPLE_PREFIX}case_{case_index}_diagnosis_{diag_index}",
-            )
-
-            if gdc_diagnosis.get("diagnosis_id"):
-                diagnosis.identifier = [
-                    crdch_model.Identifier(
-                        value=gdc_diagnosis["diagnosis_id"],
-                        system=f"{GDC_URL}#diagnosis_id",
-                    )
-                ]
-
-            diagnosis.subject = crdch_model.Subject(
-                id=f"{EXAMPLE_PREFIX}case_{case_index}"
-            )
-
-            if gdc_case.get("case_id"):
-                diagnosis.subject.identifier = [
-                    crdch_model.Identifier(
-                        value=gdc_case.get("case_id"), system=f"{GDC_URL}#case_id"
-                    )
-                ]
-
-                if gdc_case.get("submitter_id"):
-                    diagnosis.subject.identifier.append(
-                        crdch_model.Identifier(
-                            value=gdc_case.get("submitter_id"),
-                            system=f"{GDC_URL}#submitter_id",
-                        )
-                    )
-
-            if gdc_diagnosis.get("age_at_diagnosis"):
-                diagnosis.age_at_diagnosis = transform.quantity_decimal(
-                    gdc_diagnosis["age_at_diagnosis"], unit=DAY
-                )
-
-            if gdc_diagnosis.get("morphology"):
-                diagnosis.morphology = transform.codeable_concept(
-                    GDC_URL, gdc_diagnosis.get("morphology")
-                )
-
-            condition_codings = []
-            if gdc_diagnosis.get("primary_diagnosis"):
-                condition_codings.append(
-                    crdch_model.Coding(
-                        system=GDC_URL,
-                        code=gdc_diagnosis.get("primary_diagnosis"),
-                        tag=["original"],
-                    )
-                )
-
-            # TODO: double-check with DMH if this makes sense
-            if gdc_diagnosis.get("icd_10_code"):
-                condition_codings.append(
-                    crdch_model.Coding(
-                        system=ICD10_URL,
-                        code=gdc_diagnosis.get("icd_10_code"),
-                        tag=["original"],
-                    )
-                )
-
-            diagnosis.condition = crdch_model.CodeableConcept(coding=condition_codings)
-
-            # TODO: PDC validation bug (in LinkML?)
-            # if gdc_diagnosis.get('tissue_or_organ_of_origin'):
-            #    diagnosis.primary_site = crdch_model.BodySite(
-            #        site=transform.codeable_concept(GDC_URL, gdc_diagnosis.get('tissue_or_organ_of_origin'), tags=['original'])
-            #    )
-
-            if gdc_diagnosis.get("ajcc_staging_system_edition"):
-                observations = []
-
-                def add_observation(type_code, type_label, stage_code):
-                    if stage_code:
-                        observations.append(
-                            crdch_model.CancerStageObservation(
-                                observation_type=transform.codeable_concept(
-                                    GDC_URL, type_code, type_label, tags=["harmonized"]
-                                ),
-                                value_codeable_concept=transform.codeable_concept(
-                                    GDC_URL, stage_code, stage_code, tags=["original"]
-                                ),
-                            )
-                        )
-
-                # TODO: I couldn't find AJCC v7 in NCIt, so these codes reference the 8th edition. Need to be fixed.
-                # TODO: This is the first piece we should uncomment, because it triggers exactly the same error as when
-                # we try loading these observations from YAML.
-                # add_observation('C177555', 'AJCC v8 Clinical Stage', gdc_diagnosis.get('ajcc_clinical_stage'))
-                # add_observation('C177606', 'AJCC v8 Clinical M Category', gdc_diagnosis.get('ajcc_clinical_m'))
-                # add_observation('C177611', 'AJCC v8 Clinical N Category', gdc_diagnosis.get('ajcc_clinical_n'))
-                # add_observation('C177635', 'AJCC v8 Clinical T Category', gdc_diagnosis.get('ajcc_clinical_t'))
-                # add_observation('C177556', 'AJCC v8 Pathologic Stage', gdc_diagnosis.get('ajcc_pathologic_stage'))
-                # add_observation('C177607', 'AJCC v8 Pathologic M Category', gdc_diagnosis.get('ajcc_pathologic_m'))
-                # add_observation('C177612', 'AJCC v8 Pathologic N Category', gdc_diagnosis.get('ajcc_pathologic_n'))
-                # add_observation('C177636', 'AJCC v8 Pathologic T Category', gdc_diagnosis.get('ajcc_pathologic_t'))
-
-                diagnosis.stage = [
-                    crdch_model.CancerStageObservationSet(
-                        method_type=transform.codeable_concept(
-                            GDC_URL,
-                            gdc_diagnosis.get("ajcc_staging_system_edition"),
-                            tags=["original"],
-                        ),
-                        observations=observations,
-                    )
-                ]
-
-            # elif gdc_diagnosis.get('figo_stage'):
-
-            # Year of diagnosis
-            if gdc_diagnosis.get("year_of_diagnosis"):
-                # TODO: We need to add support for approximate dates (https://github.com/cancerDHC/ccdhmodel/issues/130)
-                diagnosis.diagnosis_date = crdch_model.TimePoint()
-                diagnosis.diagnosis_date.date_time = (
-                    f"{gdc_diagnosis.get('year_of_diagnosis')}-01-01"
-                )
-
-            # Convert the specimen.
-            specimens = [
-                create_specimen(
-                    sample, sample_index, diagnosis, diag_index, gdc_case, case_index
-                )
-                for (sample_index, sample) in enumerate(gdc_case.get("samples") or [])
-            ]
-            if len(specimens) > 0:
-                diagnosis.related_specimen = specimens
-
-            # Write out the diagnosis.
-            diagnoses.append(
-                {
-                    f"gdc_head_and_mouth_case_{case_index}_diagnosis_{diag_index}_diagnosis": {
-                        "Provenance": "Downloaded from the GDC Public API (see "
-                        + "https://github.com/cancerDHC/example-data/blob/main/head-and-mouth/Head%20and%20Mouth%20Cancer%20Datasets.ipynb "
-                        + 'for instructions)."',
-                        "Type": "Diagnosis",
-                        "Documentation": "https://cancerdhc.github.io/ccdhmodel/v1.1/Diagnosis/",
-                        "Example": diagnosis,
-                    }
-                }
-            )
-
-    # Write out all diagnoses into a single YAML file in the imported-node-data directory.
-    with open("ccdh-pilot/imported-node-data/gdc-head-and-mouth.yaml", "w") as f:
-        yaml.dump_all(diagnoses, f, Dumper=yaml.SafeDumper, sort_keys=False)
+    # Objects are identified by their positions in the export, or by their GDC
+    # identifiers if CRDCH_IDS is set to "stable".
+    # The export is read one case at a time, and each diagnosis is written out as soon
+    # as it has been transformed, so memory use doesn't grow with the size of the
+    # export. If CRDCH_MEMORY_BUDGET is set, the peak RSS must stay within it (see
+    # spill.py).
+    # Write out all diagnoses into a single YAML file in the imported-node-data directory
+    # (or into shards of it, if CRDCH_SHARD_DOCUMENTS or CRDCH_SHARD_BYTES are set).
+    with instrument.timer("transform"):
+        with transform.id_scheme(transform.id_scheme_from_environment()):
+            cases = sources.read_cases(snapshot.GDC_HEAD_AND_MOUTH)
+            sharding.dump_all(
+                transform_gdc.transform_cases(cases),
+                "ccdh-pilot/imported-node-data/gdc-head-and-mouth.yaml",
+            )
+    spill.check_peak_rss("gdc-head-and-mouth.yaml")
 
     # yaml.dump(linkml_runtime.utils.formatutils.remove_empty_items(element, hide_protected_keys=True),
     #          Dumper=yaml.SafeDumper, sort_keys=False,
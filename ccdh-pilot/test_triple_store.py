@@ -0,0 +1,70 @@
+#
+# test_triple_store.py - Tests for the persistent, indexed RDF store.
+#
+
+import json
+
+import rdflib
+
+import convert
+import triple_store
+from triple_store import crdch, literal
+
+
+def test_triple_store(tmp_path, gdc_head_and_mouth):
+    gdc_cases = gdc_head_and_mouth[:20]
+    input_file = tmp_path / "gdc.json"
+    with open(input_file, "w") as f:
+        json.dump(gdc_cases, f)
+    ttl_file = str(tmp_path / "gdc.ttl")
+    convert.main(
+        ["gdc", "--in", str(input_file), "--out", ttl_file, "--format", "ttl"]
+        + ["--no-validate"]
+    )
+
+    graph = rdflib.Graph()
+    graph.parse(ttl_file, format="turtle")
+    with triple_store.TripleStore.open_for(ttl_file) as store:
+        assert len(store) == len(graph)
+        codings = list(store.triples(p=crdch("code"), o=literal("8070/3")))
+        crdch_code = rdflib.URIRef(triple_store.CRDCH_NAMESPACE + "code")
+        assert len(codings) == len(
+            list(graph.triples((None, crdch_code, rdflib.Literal("8070/3"))))
+        )
+
+        diagnoses = store.diagnoses_by_condition(
+            "Squamous cell carcinoma, NOS", "http://crdc.nci.nih.gov/gdc"
+        )
+        assert diagnoses == sorted(
+            f"gdc_head_and_mouth_example:case_{i}_diagnosis_0"
+            for (i, case) in enumerate(gdc_cases)
+            if case["diagnoses"][0]["primary_diagnosis"]
+            == "Squamous cell carcinoma, NOS"
+        )
+        assert store.diagnoses_by_condition("No such condition") == []
+
+        case_id = gdc_cases[3]["case_id"]
+        specimens = [
+            f"gdc_head_and_mouth_example:case_3_sample_{i}"
+            for i in range(len(gdc_cases[3]["samples"]))
+        ]
+        assert store.specimens_by_subject(case_id) == specimens
+        assert (
+            store.specimens_by_subject(
+                "gdc_head_and_mouth_example:case_3_sample_0_subject"
+            )
+            == specimens[:1]
+        )
+
+    # The store is only loaded again if the file has changed.
+    with triple_store.TripleStore.open_for(ttl_file) as store:
+        source = store.metadata("source")
+        store.connection.execute("DELETE FROM triples")
+        store.connection.commit()
+    with triple_store.TripleStore.open_for(ttl_file) as store:
+        assert len(store) == 0
+    with open(ttl_file, "a") as f:
+        f.write("<https://example.org/a> <https://example.org/b> 1 .\n")
+    with triple_store.TripleStore.open_for(ttl_file) as store:
+        assert store.metadata("source") != source
+        assert len(store) == len(graph) + 1
@@ -0,0 +1,132 @@
+#
+# test_validation_cache.py - Tests for the persistent validation result cache.
+#
+
+import os
+
+import instrument
+import validate
+import validation_cache
+
+# A tiny schema that only accepts Subjects whose IDs start with "example:a".
+SCHEMA = {"$defs": {"Subject": {"properties": {"id": {"pattern": "^example:a"}}}}}
+
+
+def test_canonical_hash():
+    assert validation_cache.canonical_hash(
+        {"a": 1, "b": [1, 2]}
+    ) == validation_cache.canonical_hash({"b": [1, 2], "a": 1})
+    assert validation_cache.canonical_hash({"a": 1}) != validation_cache.canonical_hash(
+        {"a": 2}
+    )
+
+
+def test_results_persist(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    error = validation_cache.CachedError(["identifier", 0], "Not valid")
+
+    with validation_cache.ValidationCache(path) as cache:
+        assert cache.get("schema", "document") is None
+        cache.put("schema", "document", [("example_subject", error)])
+        cache.put("schema", "valid_document", [])
+
+    with validation_cache.ValidationCache(path) as cache:
+        assert cache.get("schema", "document") == [("example_subject", error)]
+        assert cache.get("schema", "valid_document") == []
+        assert cache.get("another_schema", "document") is None
+
+
+def test_validator_uses_cache(tmp_path):
+    entry = {"example_subject": {"Example": {"id": "example:subject"}}}
+
+    instrument.reset()
+    instrument.enable()
+    try:
+        with validation_cache.ValidationCache(str(tmp_path / "cache.sqlite")) as cache:
+            validator = validate.Validator(SCHEMA, cache)
+            first = [error.message for (key, error) in validator.iter_errors(entry)]
+            second = [error.message for (key, error) in validator.iter_errors(entry)]
+
+        counters = instrument.metrics()["counters"]
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+    assert first == ["'example:subject' does not match '^example:a'"]
+    assert second == first
+    assert counters["validated_documents"] == 1
+    assert counters["validation_cache_hits"] == 1
+
+
+def test_validator_skips_unchanged_files(tmp_path):
+    input_file = tmp_path / "subjects.yaml"
+    input_file.write_text(
+        "example_subject:\n  Example:\n    id: example:subject\n"
+        + "---\n"
+        + "another_subject:\n  Example:\n    id: example:another\n"
+    )
+
+    instrument.reset()
+    instrument.enable()
+    try:
+        with validation_cache.ValidationCache(str(tmp_path / "cache.sqlite")) as cache:
+            validator = validate.Validator(SCHEMA, cache)
+            first = [key for (key, error) in validator.iter_file_errors(input_file)]
+            second = [key for (key, error) in validator.iter_file_errors(input_file)]
+
+        counters = instrument.metrics()["counters"]
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+    assert first == ["example_subject"]
+    assert second == first
+    assert counters["validated_documents"] == 2
+    assert counters["validation_cache_file_hits"] == 1
+
+
+def test_validator_changes_invalidate_cache(tmp_path, monkeypatch):
+    entry = {"example_subject": {"Example": {"id": "example:subject"}}}
+    hashes = [validation_cache.schema_hash(SCHEMA)]
+
+    instrument.reset()
+    instrument.enable()
+    try:
+        with validation_cache.ValidationCache(str(tmp_path / "cache.sqlite")) as cache:
+            list(validate.Validator(SCHEMA, cache).iter_errors(entry))
+
+            # Upgrading jsonschema (or crdch_model) gives the schema another hash, so
+            # documents are validated again.
+            original_version = validation_cache.distribution_version
+            monkeypatch.setattr(
+                validation_cache,
+                "distribution_version",
+                lambda name: "99.0" if name == "jsonschema" else original_version(name),
+            )
+            hashes.append(validation_cache.schema_hash(SCHEMA))
+            list(validate.Validator(SCHEMA, cache).iter_errors(entry))
+
+            # So does changing the source of the validator.
+            source_directory = tmp_path / "source"
+            source_directory.mkdir()
+            for module in validation_cache.VALIDATOR_MODULES:
+                source = open(
+                    os.path.join(validation_cache.SOURCE_DIRECTORY, module + ".py")
+                ).read()
+                if module == "validate":
+                    source += "# A change.\n"
+                (source_directory / (module + ".py")).write_text(source)
+            monkeypatch.setattr(
+                validation_cache, "SOURCE_DIRECTORY", str(source_directory)
+            )
+            hashes.append(validation_cache.schema_hash(SCHEMA))
+            list(validate.Validator(SCHEMA, cache).iter_errors(entry))
+
+        counters = instrument.metrics()["counters"]
+    finally:
+        instrument.disable()
+        instrument.reset()
+
+    assert len(set(hashes)) == 3
+    assert counters["validated_documents"] == 3
+    assert "validation_cache_hits" not in counters
@@ -3,25 +3,84 @@
 # as a part of the crdch_model repository, implementing what is effectively a
 # domain-specific language for doing transforms into the CRDC-H instance format.
 
-import crdch_model
+import contextlib
+import hashlib
+import os
+import re
 
+import construct
+import instrument
 
+# Objects are built through construct.model, so that they can be built without
+# LinkML's checks when the output is going to be validated anyway.
+model = construct.model
+
+# How the objects we create are identified. With "positional" IDs, every part of an ID
+# (such as `case_3_sample_1`) is the position of a record in its export or in the record
+# that contains it, so inserting a case into an export renumbers every case after it.
+# With "stable" IDs, each part is the identifier the source gives that record (such as
+# its GDC case_id or sample_id), so a record gets the same ID however the export it is
+# in is ordered, split up or extended. Records without a source identifier are still
+# identified by their position.
+ID_SCHEMES = ["positional", "stable"]
+
+# The ID scheme currently in use (see id_scheme()).
+_id_scheme = "positional"
+
+# Source identifiers that can be used in IDs as they are. Others are hashed.
+_SAFE_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9.-]*")
+
+
+@contextlib.contextmanager
+def id_scheme(scheme):
+    """Identify the objects created within this context with the given ID scheme."""
+    global _id_scheme
+    if scheme not in ID_SCHEMES:
+        raise ValueError(f"ID scheme must be one of {ID_SCHEMES}, not {scheme!r}")
+    previous = _id_scheme
+    _id_scheme = scheme
+    try:
+        yield
+    finally:
+        _id_scheme = previous
+
+
+def id_scheme_from_environment():
+    """Return the ID scheme configured by the CRDCH_IDS environment variable."""
+    return os.environ.get("CRDCH_IDS") or "positional"
+
+
+def id_part(index, source_id):
+    """
+    Return the part of an ID that identifies a record among the records it is listed
+    with: its position `index`, or with stable IDs, its (possibly hashed) `source_id`.
+    """
+    if _id_scheme == "positional" or not source_id:
+        return str(index)
+    source_id = str(source_id)
+    if _SAFE_ID.fullmatch(source_id):
+        return source_id
+    return hashlib.sha256(source_id.encode("utf-8")).hexdigest()[:16]
+
+
+@instrument.timed()
 def codeable_concept(system, code, label=None, text=None, tags=[]):
     """Create a crdch_model.CodeableConcept for a given [single] system and code."""
-    coding = crdch_model.Coding(system=system, code=code)
+    coding = model.Coding(system=system, code=code)
     if label is not None:
         coding.label = label
     if len(tags) > 0:
         coding.tag = tags
-    cc = crdch_model.CodeableConcept(coding)
+    cc = model.CodeableConcept(coding=[coding])
     if text is not None:
         cc.text = text
     return cc
 
 
+@instrument.timed()
 def quantity_decimal(value_decimal, unit):
     """Create a crdch_model.Quantity for a given decimal value and a unit (expressed as a CodeableConcept)."""
-    q = crdch_model.Quantity(unit=unit)
+    q = model.Quantity(unit=unit)
     # TODO: this should be converted to a Decimal, but that doesn't work/pass validation
     # So instead we truncate it to an integer for now.
     # Filed as issue https://github.com/cancerDHC/ccdhmodel/issues/131
@@ -0,0 +1,221 @@
+#
+# transform_cda.py - Transform Cancer Data Aggregator (CDA) subjects into CRDC-H Instance data.
+#
+# A CDA record is a Subject with a ResearchSubject for every node (GDC, PDC, ...) the
+# subject is found in, each of which has its own Diagnoses and Specimens (see
+# cptac2-subject-09CO022/cda_case_*.json). Every Diagnosis of every ResearchSubject is
+# converted into a CRDC-H Diagnosis, whose Subject is identified by the IDs of all the
+# subject's ResearchSubjects, and whose related Specimens are the Specimens from the same
+# ResearchSubject. The conversion command line tool (convert.py) uses these functions;
+# cda.py fetches CDA records page by page.
+#
+
+import functools
+
+import construct
+import instrument
+import staging
+import transform
+
+# Objects are built through construct.model, so that they can be built without
+# LinkML's checks when the output is going to be validated anyway.
+model = construct.model
+
+# Some general constants
+EXAMPLE_PREFIX = "cda_example:"
+CDA_URL = "http://crdc.nci.nih.gov/cda"
+GDC_URL = "http://crdc.nci.nih.gov/gdc"
+PDC_URL = "http://crdc.nci.nih.gov/pdc"
+NCIT_URL = "http://ncithesaurus.nci.nih.gov"
+
+# The code systems of the nodes CDA identifiers and values come from, by the names CDA
+# uses for them.
+NODE_URLS = {"GDC": GDC_URL, "PDC": PDC_URL}
+
+# CDA records are staged into staging.CDASubject records before they are transformed.
+stage_case = staging.stage_cda_subject
+
+
+@functools.lru_cache(maxsize=None)
+def day():
+    return transform.codeable_concept(NCIT_URL, "C25301", "Day", tags=["harmonized"])
+
+
+def node_url(system):
+    return NODE_URLS.get(system, f"{CDA_URL}#{system}")
+
+
+def node_of(research_subject):
+    """Return the code system of the node a ResearchSubject comes from."""
+    for (system, value) in research_subject.identifier:
+        return node_url(system)
+    return CDA_URL
+
+
+def identifiers(identifier, suffix=""):
+    return [
+        model.Identifier(value=value, system=node_url(system) + suffix)
+        for (system, value) in identifier
+    ]
+
+
+# Convert a single CDA Specimen (a staging.CDASpecimen) into a CRDC-H specimen.
+# `specimen_ids` maps the CDA IDs of the Specimens from the same ResearchSubject to
+# their CRDC-H IDs, so that parent specimens can be referred to.
+@instrument.timed()
+def create_specimen(cda_specimen, specimen_id, node, subject, specimen_ids):
+    specimen = model.Specimen(id=specimen_id)
+
+    if cda_specimen.identifier:
+        specimen.identifier = identifiers(cda_specimen.identifier)
+
+    if cda_specimen.specimen_type:
+        specimen.specimen_type = transform.codeable_concept(
+            node, cda_specimen.specimen_type
+        )
+
+    if cda_specimen.source_material_type:
+        specimen.source_material_type = transform.codeable_concept(
+            node, cda_specimen.source_material_type
+        )
+
+    if cda_specimen.anatomical_site:
+        specimen.creation_activity = model.SpecimenCreationActivity(
+            collection_site=model.BodySite(
+                site=transform.codeable_concept(node, cda_specimen.anatomical_site)
+            )
+        )
+
+    # Specimens that aren't derived from another specimen are "derived from" something
+    # like "Initial sample" instead.
+    parent_id = specimen_ids.get(cda_specimen.derived_from_specimen)
+    if parent_id is not None:
+        specimen.parent_specimen = [model.Specimen(id=parent_id)]
+
+    specimen.source_subject = model.Subject(id=subject.id)
+    return specimen
+
+
+# Convert a single CDA Diagnosis from a ResearchSubject into a CRDC-H diagnosis.
+def transform_diagnosis(cda_diagnosis, diagnosis_id, node, subject, specimens):
+    diagnosis = model.Diagnosis(id=diagnosis_id, subject=subject)
+
+    if cda_diagnosis.id:
+        diagnosis.identifier = [
+            model.Identifier(value=cda_diagnosis.id, system=f"{node}#diagnosis_id")
+        ]
+
+    if cda_diagnosis.age_at_diagnosis:
+        diagnosis.age_at_diagnosis = transform.quantity_decimal(
+            cda_diagnosis.age_at_diagnosis, day()
+        )
+
+    if cda_diagnosis.morphology:
+        diagnosis.morphology = transform.codeable_concept(
+            node, cda_diagnosis.morphology
+        )
+
+    if cda_diagnosis.primary_diagnosis:
+        diagnosis.condition = transform.codeable_concept(
+            node, cda_diagnosis.primary_diagnosis, tags=["original"]
+        )
+
+    # TODO: tumor_stage and tumor_grade should become CancerStageObservations and
+    # CancerGradeObservations, but observations can't be loaded back from YAML yet (see
+    # the TODOs in transform_gdc.transform_diagnosis()).
+
+    if len(specimens) > 0:
+        diagnosis.related_specimen = specimens
+
+    instrument.count("diagnoses")
+    return diagnosis
+
+
+# Convert the CDA Subject itself into a CRDC-H subject, identified by the IDs of all
+# of its ResearchSubjects.
+def create_subject(cda_subject, subject_index):
+    subject = model.Subject(
+        id=f"{EXAMPLE_PREFIX}subject_{transform.id_part(subject_index, cda_subject.id)}"
+    )
+
+    subject.identifier = [
+        identifier
+        for research_subject in cda_subject.research_subjects
+        for identifier in identifiers(research_subject.identifier, "#case_id")
+    ]
+
+    if cda_subject.sex:
+        subject.sex = transform.codeable_concept(CDA_URL, cda_subject.sex)
+
+    if cda_subject.race:
+        subject.race = [transform.codeable_concept(CDA_URL, cda_subject.race)]
+
+    if cda_subject.ethnicity:
+        subject.ethnicity = transform.codeable_concept(CDA_URL, cda_subject.ethnicity)
+
+    return subject
+
+
+# Convert a single CDA record into a list of documents, one for each diagnosis of each
+# of its ResearchSubjects, in the format we write out as YAML. The record can be a
+# staging.CDASubject, or a record as read from JSON, which is staged first.
+def transform_case(cda_subject, subject_index):
+    cda_subject = staging.stage_cda_subject(cda_subject)
+
+    # The parts of IDs that identify each record (see transform.id_part()).
+    subject_part = transform.id_part(subject_index, cda_subject.id)
+
+    documents = []
+    for (rs_index, research_subject) in enumerate(cda_subject.research_subjects):
+        node = node_of(research_subject)
+        rs_part = transform.id_part(rs_index, research_subject.id)
+        prefix = f"{EXAMPLE_PREFIX}subject_{subject_part}_research_subject_{rs_part}"
+        specimen_ids = {
+            cda_specimen.id: f"{prefix}_specimen_"
+            + transform.id_part(specimen_index, cda_specimen.id)
+            for (specimen_index, cda_specimen) in enumerate(research_subject.specimens)
+        }
+
+        for (diag_index, cda_diagnosis) in enumerate(research_subject.diagnoses):
+            diag_part = transform.id_part(diag_index, cda_diagnosis.id)
+            # Every document gets its own copies of the subject and specimens, as it
+            # does for GDC and PDC cases.
+            subject = create_subject(cda_subject, subject_index)
+            specimens = [
+                create_specimen(
+                    cda_specimen,
+                    specimen_ids[cda_specimen.id],
+                    node,
+                    subject,
+                    specimen_ids,
+                )
+                for cda_specimen in research_subject.specimens
+            ]
+            instrument.count("specimens", len(specimens))
+            diagnosis = transform_diagnosis(
+                cda_diagnosis,
+                f"{prefix}_diagnosis_{diag_part}",
+                node,
+                subject,
+                specimens,
+            )
+            documents.append(
+                {
+                    f"cda_subject_{subject_part}_research_subject_{rs_part}_diagnosis_{diag_part}_diagnosis": {
+                        "Provenance": "Downloaded from the Cancer Data Aggregator (see "
+                        + "https://github.com/cancerDHC/example-data/blob/main/cptac2-subject-09CO022/CDA%20example%20for%20subject%2009CO022.ipynb "
+                        + "for instructions).",
+                        "Type": "Diagnosis",
+                        "Documentation": "https://cancerdhc.github.io/ccdhmodel/v1.1/Diagnosis/",
+                        "Example": diagnosis,
+                    }
+                }
+            )
+    return documents
+
+
+# Each CDA record is a CDA Subject. To transform this into CRDC-H instance data, we need
+# to transform it as a series of diagnoses.
+def transform_cases(cda_subjects):
+    for (subject_index, cda_subject) in enumerate(cda_subjects):
+        yield from transform_case(cda_subject, subject_index)
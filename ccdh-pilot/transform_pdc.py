@@ -0,0 +1,368 @@
+#
+# transform_pdc.py - Transform PDC cases into CRDC-H Instance data.
+#
+# The PDC head and mouth demonstrator (test_transform_pdc.py) and the conversion
+# command line tool (convert.py) both use these functions.
+#
+
+import functools
+
+import construct
+import instrument
+import staging
+import transform
+
+# Objects are built through construct.model, so that they can be built without
+# LinkML's checks when the output is going to be validated anyway.
+model = construct.model
+
+# Some general constants
+EXAMPLE_PREFIX = "pdc_head_and_mouth_example:"
+NCIT_URL = "http://ncithesaurus.nci.nih.gov"
+CCDH_URL = "http://crdc.nci.nih.gov/ccdh"
+GDC_URL = "http://crdc.nci.nih.gov/gdc"
+ICD10_URL = "http://hl7.org/fhir/ValueSet/icd-10"
+
+# Cases are staged into staging.Case records before they are transformed.
+stage_case = staging.stage_case
+
+
+# Some codeable concepts we use repeatedly. These are only created when first used, so
+# that importing this module doesn't import crdch_model.
+@functools.lru_cache(maxsize=None)
+def day():
+    return transform.codeable_concept(NCIT_URL, "C25301", "Day", tags=["harmonized"])
+
+
+@functools.lru_cache(maxsize=None)
+def milligram():
+    return transform.codeable_concept(
+        NCIT_URL, "C28253", "Milligram", tags=["harmonized"]
+    )
+
+
+# Convert a single PDC sample (a staging.Sample) into a CRDC-H specimen.
+@instrument.timed()
+def create_specimen(
+    gdc_sample, sample_index, gdc_diagnosis, diagnosis_index, gdc_case, case_index
+):
+    # This specimen's ID, such as `case_3_sample_1` (see transform.id_part()).
+    specimen_id = (
+        f"{EXAMPLE_PREFIX}case_{transform.id_part(case_index, gdc_case.case_id)}"
+        f"_sample_{transform.id_part(sample_index, gdc_sample.sample_id)}"
+    )
+    specimen = model.Specimen(id=specimen_id)
+
+    if gdc_sample.sample_id:
+        specimen.identifier = [
+            model.Identifier(value=gdc_sample.sample_id, system=GDC_URL)
+        ]
+
+    if gdc_sample.submitter_id:
+        submitter_identifier = model.Identifier(
+            value=gdc_sample.submitter_id, system=GDC_URL
+        )
+        if specimen.identifier:
+            specimen.identifier.append(submitter_identifier)
+        else:
+            specimen.identifier = [submitter_identifier]
+
+    # TODO: figure out what to do about associated_project.
+
+    # Make sure this is right.
+    if gdc_sample.submitter_id:
+        specimen.source_subject = model.Subject(id=f"{specimen_id}_subject")
+        specimen.source_subject.identifier = [
+            model.Identifier(
+                value=gdc_sample.submitter_id, system=f"{GDC_URL}#submitter_id"
+            )
+        ]
+
+    if gdc_case.case_id:
+        case_id = model.Identifier(value=gdc_case.case_id, system=f"{GDC_URL}#case_id")
+        if not specimen.source_subject:
+            specimen.source_subject = model.Subject(id=f"{specimen_id}_subject")
+
+        if specimen.source_subject.identifier:
+            specimen.source_subject.identifier.append(case_id)
+        else:
+            specimen.source_subject.identifier = [case_id]
+
+    # TODO: How do we calculate the Sample.type?
+
+    if gdc_sample.sample_type:
+        specimen.source_material_type = transform.codeable_concept(
+            GDC_URL, gdc_sample.sample_type
+        )
+
+    # TODO: get the project_id somehow.
+
+    if gdc_sample.tissue_type:
+        specimen.general_tissue_pathology = transform.codeable_concept(
+            GDC_URL, gdc_sample.tissue_type
+        )
+
+    if gdc_sample.tumor_code:
+        specimen.specific_tissue_pathology = transform.codeable_concept(
+            GDC_URL, gdc_sample.tumor_code
+        )
+
+    if gdc_sample.tumor_descriptor:
+        specimen.tumor_status_at_collection = transform.codeable_concept(
+            GDC_URL, gdc_sample.tumor_descriptor
+        )
+
+    if gdc_sample.current_weight:
+        specimen.quantity_measure = model.SpecimenQuantityObservation(
+            observation_type=transform.codeable_concept(
+                NCIT_URL, "C25208", "Weight", tags=["harmonized"]
+            ),
+            value_quantity=transform.quantity_decimal(
+                gdc_sample.current_weight, unit=milligram()
+            ),
+        )
+
+    # The following fields relate to the Specimen.creation_activity.
+
+    if gdc_sample.days_to_collection:
+        date_ended = model.TimePoint(
+            offset_from_index=transform.quantity_decimal(
+                gdc_sample.days_to_collection, day()
+            ),
+            index_time_point=model.TimePoint(
+                event_type=[
+                    transform.codeable_concept(
+                        NCIT_URL, "C142714", "Study Start", tags=["harmonized"]
+                    )
+                ]
+            ),
+        )
+        specimen.creation_activity = model.SpecimenCreationActivity(
+            date_ended=date_ended
+        )
+
+    if gdc_sample.initial_weight:
+        initial_weight = transform.quantity_decimal(
+            gdc_sample.initial_weight, milligram()
+        )
+        if specimen.creation_activity:
+            specimen.creation_activity.quantity_collected = initial_weight
+        else:
+            specimen.creation_activity = model.SpecimenCreationActivity(
+                quantity_collected=initial_weight
+            )
+
+    if gdc_sample.biospecimen_anatomic_site:
+        biospecimen_anatomic_site = transform.codeable_concept(
+            GDC_URL,
+            gdc_sample.biospecimen_anatomic_site,
+            label=gdc_sample.biospecimen_anatomic_site,
+        )
+        if specimen.creation_activity:
+            specimen.creation_activity.collection_site = model.BodySite(
+                site=biospecimen_anatomic_site
+            )
+        else:
+            specimen.creation_activity = model.SpecimenCreationActivity(
+                collection_site=model.BodySite(site=biospecimen_anatomic_site)
+            )
+
+    # if gdc_sample.get('time_between_excision_and_freezing'):
+    #     time_obs = model.ExecutionTimeObservation(
+    #         observation_type=transform.codeable_concept(CCDH_URL, 'time_between_excision_and_freezing', label='time_between_excision_and_freezing'),
+    #         value_quantity=quantity(gdc_sample.get('time_between_excision_and_freezing'), day())
+    #     )
+    #     if not specimen.creation_activity:
+    #         specimen.creation_activity = model.SpecimenCreationActivity()
+    #     if specimen.creation_activity.execution_time_observation:
+    #         specimen.creation_activity.execution_time_observation.append(time_obs)
+    #     else:
+    #         specimen.creation_activity.execution_time_observation = [time_obs]
+
+    # The following fields relate to the Specimen.processing_activity.
+    if gdc_sample.preservation_method:
+        specimen.processing_activity = [
+            model.SpecimenProcessingActivity(
+                activity_type=transform.codeable_concept(
+                    GDC_URL, gdc_sample.preservation_method
+                )
+            )
+        ]
+
+    if gdc_sample.freezing_method:
+        method_type = transform.codeable_concept(GDC_URL, gdc_sample.freezing_method)
+        if len(specimen.processing_activity) > 0:
+            specimen.processing_activity[0].method_type = method_type
+        else:
+            specimen.processing_activity = [
+                model.SpecimenProcessingActivity(method_type=method_type)
+            ]
+
+    return specimen
+
+
+# Convert a single PDC diagnosis (together with the samples from its case) into a
+# CRDC-H diagnosis. Both are staging records (see staging.py).
+def transform_diagnosis(gdc_diagnosis, diag_index, gdc_case, case_index):
+    case_part = transform.id_part(case_index, gdc_case.case_id)
+    diagnosis = model.Diagnosis(
+        id=f"{EXAMPLE_PREFIX}case_{case_part}"
+        f"_diagnosis_{transform.id_part(diag_index, gdc_diagnosis.diagnosis_id)}",
+    )
+
+    if gdc_diagnosis.diagnosis_id:
+        diagnosis.identifier = [
+            model.Identifier(
+                value=gdc_diagnosis.diagnosis_id,
+                system=f"{GDC_URL}#diagnosis_id",
+            )
+        ]
+
+    diagnosis.subject = model.Subject(id=f"{EXAMPLE_PREFIX}case_{case_part}")
+
+    if gdc_case.case_id:
+        diagnosis.subject.identifier = [
+            model.Identifier(value=gdc_case.case_id, system=f"{GDC_URL}#case_id")
+        ]
+
+        if gdc_case.submitter_id:
+            diagnosis.subject.identifier.append(
+                model.Identifier(
+                    value=gdc_case.submitter_id,
+                    system=f"{GDC_URL}#submitter_id",
+                )
+            )
+
+    if gdc_diagnosis.age_at_diagnosis:
+        diagnosis.age_at_diagnosis = transform.quantity_decimal(
+            gdc_diagnosis.age_at_diagnosis, day()
+        )
+
+    if gdc_diagnosis.morphology:
+        diagnosis.morphology = transform.codeable_concept(
+            GDC_URL, gdc_diagnosis.morphology
+        )
+
+    condition_codings = []
+    if gdc_diagnosis.primary_diagnosis:
+        condition_codings.append(
+            model.Coding(
+                system=GDC_URL,
+                code=gdc_diagnosis.primary_diagnosis,
+                tag=["original"],
+            )
+        )
+
+    # TODO: double-check with DMH if this makes sense
+    if gdc_diagnosis.icd_10_code:
+        condition_codings.append(
+            model.Coding(
+                system=ICD10_URL,
+                code=gdc_diagnosis.icd_10_code,
+                tag=["original"],
+            )
+        )
+
+    diagnosis.condition = model.CodeableConcept(coding=condition_codings)
+
+    # TODO: PDC validation bug (in LinkML?)
+    # if gdc_diagnosis.get('tissue_or_organ_of_origin'):
+    #    diagnosis.primary_site = model.BodySite(
+    #        site=codeable_concept(GDC_URL, gdc_diagnosis.get('tissue_or_organ_of_origin'), tags=['original'])
+    #    )
+
+    if gdc_diagnosis.ajcc_staging_system_edition:
+        observations = []
+
+        def add_observation(type_code, type_label, stage_code):
+            if stage_code:
+                observations.append(
+                    model.CancerStageObservation(
+                        observation_type=transform.codeable_concept(
+                            GDC_URL, type_code, type_label, tags=["harmonized"]
+                        ),
+                        value_codeable_concept=transform.codeable_concept(
+                            GDC_URL, stage_code, stage_code, tags=["original"]
+                        ),
+                    )
+                )
+
+        # TODO: I couldn't find AJCC v7 in NCIt, so these codes reference the 8th edition. Need to be fixed.
+        # TODO: This is the first piece we should uncomment, because it triggers exactly the same error as when
+        # we try loading these observations from YAML.
+        # add_observation('C177555', 'AJCC v8 Clinical Stage', gdc_diagnosis.get('ajcc_clinical_stage'))
+        # add_observation('C177606', 'AJCC v8 Clinical M Category', gdc_diagnosis.get('ajcc_clinical_m'))
+        # add_observation('C177611', 'AJCC v8 Clinical N Category', gdc_diagnosis.get('ajcc_clinical_n'))
+        # add_observation('C177635', 'AJCC v8 Clinical T Category', gdc_diagnosis.get('ajcc_clinical_t'))
+        # add_observation('C177556', 'AJCC v8 Pathologic Stage', gdc_diagnosis.get('ajcc_pathologic_stage'))
+        # add_observation('C177607', 'AJCC v8 Pathologic M Category', gdc_diagnosis.get('ajcc_pathologic_m'))
+        # add_observation('C177612', 'AJCC v8 Pathologic N Category', gdc_diagnosis.get('ajcc_pathologic_n'))
+        # add_observation('C177636', 'AJCC v8 Pathologic T Category', gdc_diagnosis.get('ajcc_pathologic_t'))
+
+        diagnosis.stage = [
+            model.CancerStageObservationSet(
+                method_type=[
+                    transform.codeable_concept(
+                        GDC_URL,
+                        gdc_diagnosis.ajcc_staging_system_edition,
+                        tags=["original"],
+                    )
+                ],
+                observations=observations,
+            )
+        ]
+
+    # elif gdc_diagnosis.get('figo_stage'):
+
+    # Year of diagnosis
+    if gdc_diagnosis.year_of_diagnosis:
+        # TODO: We need to add support for approximate dates (https://github.com/cancerDHC/ccdhmodel/issues/130)
+        diagnosis.diagnosis_date = model.TimePoint()
+        diagnosis.diagnosis_date.date_time = f"{gdc_diagnosis.year_of_diagnosis}-01-01"
+
+    # Convert the specimen.
+    specimens = [
+        create_specimen(
+            sample, sample_index, diagnosis, diag_index, gdc_case, case_index
+        )
+        for (sample_index, sample) in enumerate(gdc_case.samples)
+    ]
+    if len(specimens) > 0:
+        diagnosis.related_specimen = specimens
+
+    instrument.count("diagnoses")
+    instrument.count("specimens", len(specimens))
+
+    return diagnosis
+
+
+# Convert a single PDC case into a list of documents, one for each of its diagnoses,
+# in the format we write out as YAML. The case can be a staging.Case, or a case as read
+# from JSON, which is staged first.
+def transform_case(gdc_case, case_index):
+    gdc_case = staging.stage_case(gdc_case)
+    case_part = transform.id_part(case_index, gdc_case.case_id)
+    documents = []
+    for (diag_index, gdc_diagnosis) in enumerate(gdc_case.diagnoses):
+        diagnosis = transform_diagnosis(gdc_diagnosis, diag_index, gdc_case, case_index)
+        diag_part = transform.id_part(diag_index, gdc_diagnosis.diagnosis_id)
+        documents.append(
+            {
+                f"pdc_head_and_mouth_example_{case_part}_diagnosis_{diag_part}_diagnosis": {
+                    "Provenance": "Downloaded from the GDC Public API (see "
+                    + "https://github.com/cancerDHC/example-data/blob/main/head-and-mouth/Head%20and%20Mouth%20Cancer%20Datasets.ipynb "
+                    + 'for instructions)."',
+                    "Type": "Diagnosis",
+                    "Documentation": "https://cancerdhc.github.io/ccdhmodel/v1.1/Diagnosis/",
+                    "Example": diagnosis,
+                }
+            }
+        )
+    return documents
+
+
+# Each entry in a PDC export is a PDC case. To transform this into CRDC-H instance
+# data, we need to transform it as a series of diagnoses.
+def transform_cases(gdc_cases):
+    for (case_index, gdc_case) in enumerate(gdc_cases):
+        yield from transform_case(gdc_case, case_index)
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+
+#
+# triple_store.py - A persistent, indexed store for converted RDF data.
+#
+# Querying head-and-mouth/diagnoses.ttl (or the Turtle or JSON-LD written by convert.py)
+# with rdflib means parsing the whole file into an in-memory Graph every time. Instead,
+# TripleStore.open_for() bulk-loads the file once into an SQLite database next to it
+# (e.g. diagnoses.ttl.store.sqlite), with SPO, POS and OSP indexes over its triples, and
+# later opens that database directly, unless the file has changed since it was loaded.
+# rdflib is only imported to parse the file.
+#
+# Terms are represented as Term tuples of (kind, value, datatype, language), e.g.
+# uri("https://example.org/crdch/id") or literal("8070/3"). match() finds the solutions
+# to a basic graph pattern (a list of triple patterns, in which strings starting with "?"
+# are variables), like the WHERE clause of a SPARQL query, and there are shortcuts for
+# common questions:
+#
+#   python ccdh-pilot/triple_store.py head-and-mouth/diagnoses.ttl \
+#       --condition "Squamous cell carcinoma, NOS"
+#
+
+import argparse
+import collections
+import os
+import sqlite3
+import sys
+
+import compression
+import lazy
+
+rdflib = lazy.lazy_import("rdflib")
+
+# The suffix added to the name of an RDF file to name its store.
+STORE_SUFFIX = ".store.sqlite"
+
+# Increment this if the format of the store changes.
+STORE_FORMAT_VERSION = 1
+
+# The namespace of CRDC-H properties and classes in our RDF output.
+CRDCH_NAMESPACE = "https://example.org/crdch/"
+
+# rdflib parser formats for the RDF files we write, by extension.
+RDF_FORMATS = {".ttl": "turtle", ".jsonld": "json-ld"}
+
+# How many triples to insert into the database at a time.
+BATCH_SIZE = 10000
+
+URI = "uri"
+BNODE = "bnode"
+LITERAL = "literal"
+
+# An RDF term. `datatype` and `language` are empty unless the term is a literal with one.
+Term = collections.namedtuple(
+    "Term", ["kind", "value", "datatype", "language"], defaults=("", "")
+)
+
+
+def uri(value):
+    return Term(URI, value)
+
+
+def literal(value, datatype="", language=""):
+    return Term(LITERAL, str(value), datatype, language)
+
+
+def crdch(name):
+    """Return the URI of a CRDC-H property or class (e.g. crdch("id"))."""
+    return uri(CRDCH_NAMESPACE + name)
+
+
+def _term(node):
+    """Convert an rdflib term into a Term."""
+    if isinstance(node, rdflib.Literal):
+        return Term(
+            LITERAL, str(node), str(node.datatype or ""), str(node.language or "")
+        )
+    if isinstance(node, rdflib.BNode):
+        return Term(BNODE, str(node))
+    return Term(URI, str(node))
+
+
+def _is_variable(item):
+    return isinstance(item, str) and item.startswith("?")
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class TripleStore:
+    """A set of RDF triples stored in an SQLite database with SPO, POS and OSP indexes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                datatype TEXT NOT NULL,
+                language TEXT NOT NULL,
+                UNIQUE (value, kind, datatype, language));
+            CREATE TABLE IF NOT EXISTS triples (
+                s INTEGER NOT NULL,
+                p INTEGER NOT NULL,
+                o INTEGER NOT NULL,
+                PRIMARY KEY (s, p, o)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+            CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+            """
+        )
+        # Terms by ID and IDs by term, as they are looked up.
+        self.terms = {}
+        self.term_ids = {}
+
+    @classmethod
+    def open_for(cls, rdf_path, store_path=None):
+        """
+        Open the store for a Turtle or JSON-LD file (by default, the file's name plus
+        STORE_SUFFIX), loading the file into it if it hasn't been loaded since it last
+        changed.
+        """
+        store = cls(store_path or str(rdf_path) + STORE_SUFFIX)
+        source = f"{STORE_FORMAT_VERSION}:{os.path.abspath(rdf_path)}:{_stat(rdf_path)}"
+        if store.metadata("source") != source:
+            store.load(rdf_path)
+            store.set_metadata("source", source)
+        return store
+
+    def metadata(self, name):
+        row = self.connection.execute(
+            "SELECT value FROM metadata WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_metadata(self, name, value):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?)", (name, value)
+            )
+
+    def load(self, rdf_path, rdf_format=None):
+        """Replace the contents of the store with the triples in a Turtle or JSON-LD file."""
+        if rdf_format is None:
+            extension = os.path.splitext(compression.strip_extension(rdf_path))[1]
+            rdf_format = RDF_FORMATS.get(extension.lower(), "turtle")
+        graph = rdflib.Graph()
+        with compression.open_file(rdf_path, "rb") as f:
+            graph.parse(f, format=rdf_format)
+        self.clear()
+        self.add(graph)
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM triples")
+            self.connection.execute("DELETE FROM terms")
+            self.connection.execute("DELETE FROM metadata")
+        self.terms.clear()
+        self.term_ids.clear()
+
+    def add(self, triples):
+        """Add an iterable of rdflib triples (such as an rdflib Graph) to the store."""
+        cursor = self.connection.cursor()
+        ids = {}
+
+        def term_id(node):
+            term_id = ids.get(node)
+            if term_id is None:
+                term = _term(node)
+                cursor.execute(
+                    "INSERT OR IGNORE INTO terms (kind, value, datatype, language) "
+                    + "VALUES (?, ?, ?, ?)",
+                    term,
+                )
+                term_id = self._lookup(cursor, term)
+                ids[node] = term_id
+            return term_id
+
+        with self.connection:
+            batch = []
+            for (s, p, o) in triples:
+                batch.append((term_id(s), term_id(p), term_id(o)))
+                if len(batch) >= BATCH_SIZE:
+                    cursor.executemany(
+                        "INSERT OR IGNORE INTO triples VALUES (?, ?, ?)", batch
+                    )
+                    batch = []
+            cursor.executemany("INSERT OR IGNORE INTO triples VALUES (?, ?, ?)", batch)
+        self.connection.execute("ANALYZE")
+
+    def _lookup(self, cursor, term):
+        row = cursor.execute(
+            "SELECT id FROM terms WHERE value = ? AND kind = ? AND datatype = ? "
+            + "AND language = ?",
+            (term.value, term.kind, term.datatype, term.language),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _id(self, term):
+        """Return the ID of a term, or None if it isn't in the store."""
+        if term not in self.term_ids:
+            self.term_ids[term] = self._lookup(self.connection, Term(*term))
+        return self.term_ids[term]
+
+    def _terms(self, ids):
+        """Return the Terms with the given IDs."""
+        missing = [term_id for term_id in set(ids) if term_id not in self.terms]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start : start + 500]
+            rows = self.connection.execute(
+                "SELECT id, kind, value, datatype, language FROM terms WHERE id IN "
+                + f"({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for (term_id, *term) in rows:
+                self.terms[term_id] = Term(*term)
+        return [self.terms[term_id] for term_id in ids]
+
+    def _triple_ids(self, s=None, p=None, o=None):
+        """Return the (s, p, o) ID triples that match the given IDs (None matches anything)."""
+        conditions = []
+        values = []
+        for (column, value) in zip("spo", (s, p, o)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.connection.execute(
+            "SELECT s, p, o FROM triples" + where, values
+        ).fetchall()
+
+    def triples(self, s=None, p=None, o=None):
+        """Yield the (s, p, o) Term triples that match the given Terms (None matches anything)."""
+        ids = [None if term is None else self._id(term) for term in (s, p, o)]
+        if any(term is not None and i is None for (term, i) in zip((s, p, o), ids)):
+            return
+        for triple in self._triple_ids(*ids):
+            yield tuple(self._terms(triple))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+    def match(self, patterns):
+        """
+        Yield a dictionary of variable bindings for every solution to a basic graph
+        pattern: a list of (s, p, o) patterns, each of whose items is a Term or a variable
+        name starting with "?".
+        """
+        id_patterns = []
+        for pattern in patterns:
+            id_pattern = []
+            for item in pattern:
+                if _is_variable(item):
+                    id_pattern.append(item)
+                else:
+                    term_id = self._id(item)
+                    if term_id is None:
+                        return
+                    id_pattern.append(term_id)
+            id_patterns.append(tuple(id_pattern))
+
+        for bindings in self._match(id_patterns, {}):
+            names = list(bindings)
+            yield dict(zip(names, self._terms([bindings[name] for name in names])))
+
+    def _match(self, patterns, bindings):
+        if not patterns:
+            yield bindings
+            return
+
+        # Match the pattern with the most bound items first, so that we use the most
+        # selective index.
+        def bound(pattern):
+            return sum(not _is_variable(item) or item in bindings for item in pattern)
+
+        pattern = max(patterns, key=bound)
+        rest = [other for other in patterns if other is not pattern]
+        ids = [bindings.get(item) if _is_variable(item) else item for item in pattern]
+        for triple in self._triple_ids(*ids):
+            solution = dict(bindings)
+            for (item, term_id) in zip(pattern, triple):
+                if _is_variable(item) and solution.setdefault(item, term_id) != term_id:
+                    break
+            else:
+                yield from self._match(rest, solution)
+
+    def _ids_of(self, patterns, variable):
+        """Return the sorted, distinct CRDC-H IDs of the nodes bound to a variable."""
+        patterns = patterns + [(variable, crdch("id"), "?_id")]
+        return sorted({solution["?_id"].value for solution in self.match(patterns)})
+
+    def diagnoses_by_condition(self, code, system=None):
+        """Return the IDs of the Diagnoses whose condition has the given code."""
+        patterns = [
+            ("?diagnosis", crdch("condition"), "?condition"),
+            ("?condition", crdch("coding"), "?coding"),
+            ("?coding", crdch("code"), literal(code)),
+        ]
+        if system is not None:
+            patterns.append(("?coding", crdch("system"), literal(system)))
+        return self._ids_of(patterns, "?diagnosis")
+
+    def specimens_by_subject(self, subject):
+        """
+        Return the IDs of the Specimens taken from a Subject, given the Subject's ID or
+        the value of one of its identifiers (such as a GDC case_id).
+        """
+        specimens = set()
+        for subject_pattern in [
+            [("?subject", crdch("id"), literal(subject))],
+            [
+                ("?subject", crdch("identifier"), "?identifier"),
+                ("?identifier", crdch("value"), literal(subject)),
+            ],
+        ]:
+            patterns = subject_pattern + [
+                ("?specimen", crdch("source_subject"), "?subject")
+            ]
+            specimens.update(self._ids_of(patterns, "?specimen"))
+        return sorted(specimens)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load converted RDF data into an indexed store, and query it."
+    )
+    parser.add_argument("input", help="Turtle or JSON-LD file, optionally compressed")
+    parser.add_argument(
+        "--condition", help="print the IDs of Diagnoses with this condition code"
+    )
+    parser.add_argument(
+        "--specimens-of",
+        help="print the IDs of Specimens from the Subject with this ID or identifier",
+    )
+    args = parser.parse_args(argv)
+
+    with TripleStore.open_for(args.input) as store:
+        ids = []
+        if args.condition is not None:
+            ids = store.diagnoses_by_condition(args.condition)
+        elif args.specimens_of is not None:
+            ids = store.specimens_by_subject(args.specimens_of)
+        else:
+            print(f"{len(store)} triples in {store.path}")
+        for node_id in ids:
+            print(node_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
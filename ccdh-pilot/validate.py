@@ -0,0 +1,208 @@
+#
+# validate.py - Validate CRDC-H instance data using the LinkML Python data classes
+# as well as JSON Schema.
+#
+# Instance data files are YAML streams in which every document is a dictionary with a
+# single key (such as `gdc_head_and_mouth_case_0_diagnosis_0_diagnosis`), whose suffix
+# tells us which CRDC-H class the "Example" in that document should be validated as.
+#
+
+import json
+
+import yaml
+
+import compression
+import construct
+import instrument
+import lazy
+import prefilter as prefilter_module
+import validation_cache
+
+crdch_model = lazy.lazy_import("crdch_model")
+jsonschema = lazy.lazy_import("jsonschema")
+requests = lazy.lazy_import("requests")
+
+# Where the CRDC-H JSON Schema of each version (a branch or tag, such as "v1.1") is.
+JSON_SCHEMA_URL_TEMPLATE = "https://raw.githubusercontent.com/cancerDHC/ccdhmodel/{version}/crdch_model/json_schema/crdch_model.schema.json"
+
+
+def json_schema_url(version):
+    """Return the URL of the CRDC-H JSON Schema for a version of the model."""
+    return JSON_SCHEMA_URL_TEMPLATE.format(version=version)
+
+
+# The JSON Schema we validate against by default.
+JSON_SCHEMA_URL = json_schema_url("main")
+
+# Key suffixes and the CRDC-H classes they indicate, in the order they are checked.
+CLASS_NAMES_BY_SUFFIX = [
+    ("_specimen", "Specimen"),
+    ("_subject", "Subject"),
+    ("_research_project", "ResearchProject"),
+    ("_research_subject", "ResearchSubject"),
+    ("_diagnosis", "Diagnosis"),
+]
+
+# How many documents of a file to check with the prefilter at a time.
+PREFILTER_BATCH_SIZE = 1000
+
+
+def load_json_schema(url=JSON_SCHEMA_URL):
+    """Load the CRDC-H JSON Schema from a URL or a local file."""
+    if url.startswith("http://") or url.startswith("https://"):
+        req = requests.get(url)
+        return req.json()
+
+    with compression.open_file(url) as f:
+        return json.load(f)
+
+
+def class_name_for_key(key):
+    """Return the name of the CRDC-H class indicated by a document key, or None if the key isn't recognized."""
+    for (suffix, class_name) in CLASS_NAMES_BY_SUFFIX:
+        if key.endswith(suffix):
+            return class_name
+    return None
+
+
+class Validator:
+    """
+    Validates documents against a CRDC-H JSON Schema, compiling each class validator
+    only once. If a validation_cache.ValidationCache is provided, documents that have
+    already been validated against the same schema are not validated again; instead,
+    their previous errors are reported.
+
+    With `prefilter`, the enumerated values in each document are checked first (see
+    prefilter.py), and documents with out-of-enum values are reported with just those
+    errors, without being validated in full (or cached).
+
+    Without `load`, examples aren't loaded into crdch_model objects before they are
+    validated, for callers that have already done so (see compatibility.py).
+    """
+
+    def __init__(self, json_schema, cache=None, prefilter=False, load=True):
+        self.json_schema = json_schema
+        self.cache = cache
+        self.load = load
+        self.prefilter = prefilter_module.Prefilter(json_schema) if prefilter else None
+        if cache is not None:
+            self.schema_hash = validation_cache.schema_hash(json_schema)
+
+        # We need a RefResolver for the entire schema.
+        self.ref_resolver = jsonschema.RefResolver.from_schema(json_schema)
+        self.json_validators = {}
+
+    def json_validator(self, class_name):
+        """Return the JSON Schema validator for a CRDC-H class."""
+        validator = self.json_validators.get(class_name)
+        if validator is None:
+            validator = jsonschema.Draft7Validator(
+                self.json_schema["$defs"][class_name], self.ref_resolver
+            )
+            self.json_validators[class_name] = validator
+        return validator
+
+    def warm_up(self):
+        """
+        Compile the validator, the prefilter and the construct.load() plans for every
+        CRDC-H class we validate, instead of when each is first needed.
+        """
+        for (_, class_name) in CLASS_NAMES_BY_SUFFIX:
+            self.json_validator(class_name)
+            if self.prefilter is not None:
+                self.prefilter.enum_paths(class_name)
+            construct.compile_plans(getattr(crdch_model, class_name))
+
+    def iter_errors(self, entry):
+        """
+        Yield a (key, error) pair for every JSON Schema validation error in a single
+        document. Errors raised by the Python data classes while loading the example
+        (such as type errors) are not caught.
+        """
+        if self.prefilter is not None:
+            errors = list(self.prefilter.iter_errors(entry))
+            if errors:
+                yield from errors
+                return
+        yield from self._iter_full_errors(entry)
+
+    def _iter_full_errors(self, entry):
+        first_key = list(entry)[0]
+        example = entry[first_key]["Example"]
+        class_name = class_name_for_key(first_key)
+        if class_name is None:
+            raise RuntimeError(f"Could not load entry: {entry}")
+
+        if self.cache is not None:
+            document_hash = validation_cache.canonical_hash(entry)
+            errors = self.cache.get(self.schema_hash, document_hash)
+            if errors is not None:
+                instrument.count("validation_cache_hits")
+                yield from errors
+                return
+
+        instrument.count("validated_documents")
+        # This raises the same errors as loading the example with LinkML's YAMLLoader,
+        # without running every object's __post_init__.
+        if self.load:
+            construct.load(example, getattr(crdch_model, class_name))
+        errors = [
+            (first_key, error)
+            for error in self.json_validator(class_name).iter_errors(example)
+        ]
+        if self.cache is not None:
+            self.cache.put(self.schema_hash, document_hash, errors)
+
+        yield from errors
+
+    def iter_entries_errors(self, entries):
+        """Yield a (key, error) pair for every validation error in an iterable of documents."""
+        if self.prefilter is None:
+            for entry in entries:
+                yield from self.iter_errors(entry)
+            return
+
+        # Check the enumerated values of a batch of documents at once, and only
+        # validate the documents that pass in full.
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= PREFILTER_BATCH_SIZE:
+                yield from self._iter_batch_errors(batch)
+                batch = []
+        yield from self._iter_batch_errors(batch)
+
+    def _iter_batch_errors(self, batch):
+        (passed, failed) = self.prefilter.partition(batch)
+        for (_, errors) in failed:
+            yield from errors
+        for entry in passed:
+            yield from self._iter_full_errors(entry)
+
+    def iter_file_errors(self, input_file):
+        """Yield a (key, error) pair for every validation error in a (possibly compressed) YAML stream."""
+        if self.cache is None:
+            with compression.open_file(input_file) as f:
+                yield from self.iter_entries_errors(
+                    yaml.load_all(f, Loader=yaml.FullLoader)
+                )
+            return
+
+        # If the file hasn't changed since it was last validated, we don't need to parse it.
+        file_hash = validation_cache.file_hash(input_file)
+        errors = self.cache.get(self.schema_hash, file_hash)
+        if errors is not None:
+            instrument.count("validation_cache_file_hits")
+            yield from errors
+            return
+
+        errors = []
+        with compression.open_file(input_file) as f:
+            errors.extend(
+                self.iter_entries_errors(yaml.load_all(f, Loader=yaml.FullLoader))
+            )
+        # Files with documents that failed the prefilter are only partly validated.
+        if not any(isinstance(e, prefilter_module.EnumError) for (_, e) in errors):
+            self.cache.put(self.schema_hash, file_hash, errors)
+        self.cache.flush()
+        yield from errors
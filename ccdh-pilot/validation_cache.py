@@ -0,0 +1,185 @@
+#
+# validation_cache.py - A persistent cache of validation results.
+#
+# Validation results are stored in an SQLite database, keyed on a hash of the JSON
+# Schema and a hash of the canonical JSON form of the document, so that re-validating
+# an unchanged document against an unchanged schema just reports the previous result.
+# The schema hash also covers everything else that validation results depend on: the
+# installed versions of crdch_model and jsonschema, and the source of the modules that
+# load and validate documents (see VALIDATOR_MODULES), so that upgrading any of them
+# doesn't report stale results.
+# Results for entire files are also stored under a hash of the file's contents, so that
+# unchanged files don't even need to be parsed again. The cache is used by
+# validate.Validator when one is provided.
+#
+# test_validate_all.py uses the cache at DEFAULT_PATH unless the CRDCH_VALIDATION_CACHE
+# environment variable is set to another path, or to "off" to disable the cache.
+#
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+
+# The directory of this module, and of VALIDATOR_MODULES.
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Where the cache is stored by default.
+DEFAULT_PATH = os.path.join(SOURCE_DIRECTORY, ".validation-cache.sqlite")
+
+# Increment this if the format of cached results changes.
+CACHE_FORMAT_VERSION = 1
+
+# The distributions whose versions validation results depend on.
+VALIDATOR_DISTRIBUTIONS = ["crdch-model", "jsonschema"]
+
+# The modules in this directory whose source validation results depend on.
+VALIDATOR_MODULES = ["construct", "prefilter", "validate"]
+
+# How many results to buffer before writing them to the database.
+FLUSH_EVERY = 1000
+
+# A validation error read from the cache. It has the same `path` and `message`
+# attributes as a jsonschema.ValidationError.
+CachedError = collections.namedtuple("CachedError", ["path", "message"])
+
+
+def canonical_hash(value):
+    """Return a SHA-256 hash of the canonical JSON form of `value`, which doesn't depend on key order."""
+    canonical = json.dumps(
+        value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    """Return the hash used to identify the contents of a file in the cache."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return "file:" + sha256.hexdigest()
+
+
+def distribution_version(name):
+    """Return the installed version of a distribution, or None if it isn't installed."""
+    try:
+        from importlib import metadata
+    except ImportError:  # Python 3.7
+        import importlib_metadata as metadata
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def validator_fingerprint():
+    """
+    Return a dictionary identifying everything other than the schema that validation
+    results depend on: the versions of VALIDATOR_DISTRIBUTIONS, and hashes of the
+    source of VALIDATOR_MODULES.
+    """
+    sources = {}
+    for module in VALIDATOR_MODULES:
+        with open(os.path.join(SOURCE_DIRECTORY, module + ".py"), "rb") as f:
+            sources[module] = hashlib.sha256(f.read()).hexdigest()
+    return {
+        "versions": {
+            name: distribution_version(name) for name in VALIDATOR_DISTRIBUTIONS
+        },
+        "sources": sources,
+    }
+
+
+def schema_hash(json_schema):
+    """Return the hash used to identify a JSON Schema, and the validator it is used with, in the cache."""
+    return canonical_hash(
+        {
+            "format": CACHE_FORMAT_VERSION,
+            "schema": json_schema,
+            "validator": validator_fingerprint(),
+        }
+    )
+
+
+class ValidationCache:
+    """
+    A persistent cache of validation errors, keyed on (schema hash, document hash).
+    Errors are stored as (key, error) pairs, where the key is the key of the document
+    the error was found in.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            + "schema_hash TEXT NOT NULL, "
+            + "document_hash TEXT NOT NULL, "
+            + "errors TEXT NOT NULL, "
+            + "PRIMARY KEY (schema_hash, document_hash))"
+        )
+        self.connection.commit()
+        self.pending = {}
+
+    def get(self, schema_hash, document_hash):
+        """
+        Return the list of (key, error) pairs previously recorded for a document or
+        file, with errors as CachedErrors, or None if it hasn't been validated against
+        this schema before.
+        """
+        errors = self.pending.get((schema_hash, document_hash))
+        if errors is None:
+            row = self.connection.execute(
+                "SELECT errors FROM results WHERE schema_hash = ? AND document_hash = ?",
+                (schema_hash, document_hash),
+            ).fetchone()
+            if row is None:
+                return None
+            errors = row[0]
+        return [
+            (key, CachedError(path, message))
+            for (key, path, message) in json.loads(errors)
+        ]
+
+    def put(self, schema_hash, document_hash, errors):
+        """
+        Record the errors found in a document or file, as (key, error) pairs where the
+        errors are any objects with `path` and `message` attributes.
+        """
+        self.pending[(schema_hash, document_hash)] = json.dumps(
+            [[key, list(error.path), error.message] for (key, error) in errors],
+            default=str,
+        )
+        if len(self.pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """Write any buffered results to the database."""
+        if self.pending:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                [(s, d, errors) for ((s, d), errors) in self.pending.items()],
+            )
+            self.connection.commit()
+            self.pending = {}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def from_environment():
+    """Open the cache configured by the CRDCH_VALIDATION_CACHE environment variable, or None if it is disabled."""
+    path = os.environ.get("CRDCH_VALIDATION_CACHE", DEFAULT_PATH)
+    if path in ("", "off"):
+        return None
+    return ValidationCache(path)
@@ -3,16 +3,53 @@ import os
 import json
 import pytest
 import logging
-import rdflib
+import textwrap
 
 from linkml.generators.jsonldcontextgen import ContextGenerator
 from linkml_runtime.dumpers import json_dumper
 
 import crdch_model as ccdh
 
+# Files are read and written through ccdh-pilot/compression.py, so that they can be
+# compressed (see CRDCH_COMPRESSION), and exports are read one case at a time (see
+# ccdh-pilot/sources.py).
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ccdh-pilot"))
+import compression
+import serialize
+import sources
+import spill
+
 # The URI where the CRDCH YAML file is located.
 CRDCH_YAML_URI = "https://raw.githubusercontent.com/cancerDHC/ccdhmodel/v1.1/model/schema/crdch_model.yaml"
 
+# How many diagnoses to convert into Turtle at a time.
+TURTLE_BATCH_SIZE = 100
+
+
+class JSONLDGraphWriter:
+    """
+    Writes @graph elements (as produced by json_dumper.dumps() with inject_type=False)
+    to a file one at a time, as the JSON-LD document that
+    json_dumper.dumps({"@graph": ..., "@context": context}) would produce.
+    """
+
+    def __init__(self, f, context):
+        self.f = f
+        self.context = context
+        self.first = True
+        self.f.write('{\n  "@graph": [\n')
+
+    def write(self, element):
+        if not self.first:
+            self.f.write(",\n")
+        self.f.write(textwrap.indent(element, "    "))
+        self.first = False
+
+    def close(self):
+        self.f.write('\n  ],\n  "@context": ')
+        self.f.write(json.dumps(self.context, indent=2).replace("\n", "\n  "))
+        self.f.write(',\n  "@type": "dict"\n}')
+
 
 def codeable_concept(text, system, code):
     if code is None:
@@ -430,42 +467,50 @@ def test_transform_gdc_data():
     """
     Transform the GDC JSON data into JSON-LD.
     """
-    with open("head-and-mouth/gdc-head-and-mouth.json") as file:
-        gdc_head_and_mouth = json.load(file)
-
-    assert len(gdc_head_and_mouth) > 0, "At least one GDC Head and Mouth case loaded."
-
     # For now we download this from the web, but the YAML file might eventually be
     # added to the project file itself: https://github.com/linkml/linkml/issues/475
     jsonldContext = ContextGenerator(CRDCH_YAML_URI).serialize()
     jsonldContextAsDict = json.loads(jsonldContext)
     assert type(jsonldContextAsDict) is dict
 
-    diagnoses = []
-    for case in gdc_head_and_mouth:
-        for diagnosis in case["diagnoses"]:
-            diagnosis_as_obj = transform_diagnosis(diagnosis, case)
-            diagnoses.append(diagnosis_as_obj)
-            as_json_str = json_dumper.dumps(diagnosis_as_obj, jsonldContextAsDict)
-            assert type(as_json_str) is str
-            as_json = json.loads(as_json_str)
-            assert type(as_json) is dict
-
-            # logging.warning(f'Diagnosis {diagnosis} from case {case} transformed into {diagnosis_as_obj}')
-
-    as_json_str = json_dumper.dumps(
-        {"@graph": diagnoses, "@context": jsonldContextAsDict}
-    )
-    assert type(as_json_str) is str
-    as_json = json.loads(as_json_str)
-    assert type(as_json) is dict
-
-    with open("./head-and-mouth/diagnoses.jsonld", "w") as f:
-        f.write(as_json_str)
-
-    # Convert JSON-LD into Turtle.
-    g = rdflib.Graph()
-    g.parse(data=as_json_str, format="json-ld")
-    rdf_as_turtle = g.serialize(format="turtle").decode()
-    with open("head-and-mouth/diagnoses.ttl", "w") as file:
-        file.write(rdf_as_turtle)
+    # The export is read one case at a time, and each diagnosis is written to the
+    # JSON-LD file as soon as it has been transformed, and to the Turtle file a batch at
+    # a time, so memory use doesn't grow with the size of the export. If
+    # CRDCH_MEMORY_BUDGET is set, the peak RSS must stay within it (see
+    # ccdh-pilot/spill.py).
+    diagnosis_count = 0
+    jsonld_file = compression.open_output("./head-and-mouth/diagnoses.jsonld")
+    ttl_file = compression.open_output("head-and-mouth/diagnoses.ttl")
+    with jsonld_file, ttl_file:
+        jsonld_writer = JSONLDGraphWriter(jsonld_file, jsonldContextAsDict)
+        turtle_writer = serialize.TurtleStreamWriter(ttl_file)
+        batch = []
+        for case in sources.read_cases("head-and-mouth/gdc-head-and-mouth.json"):
+            for diagnosis in case["diagnoses"]:
+                diagnosis_as_obj = transform_diagnosis(diagnosis, case)
+                # As in a dictionary dumped by json_dumper, @graph elements don't have
+                # an @type.
+                as_json_str = json_dumper.dumps(diagnosis_as_obj, inject_type=False)
+                assert type(as_json_str) is str
+                as_json = json.loads(as_json_str)
+                assert type(as_json) is dict
+                diagnosis_count += 1
+
+                # logging.warning(f'Diagnosis {diagnosis} from case {case} transformed into {diagnosis_as_obj}')
+
+                jsonld_writer.write(as_json_str)
+                batch.append(as_json_str)
+                if len(batch) == TURTLE_BATCH_SIZE:
+                    turtle_writer.write(
+                        serialize.turtle_from_elements(batch, jsonldContextAsDict)
+                    )
+                    batch = []
+
+        # The JSON-LD document itself has the @type "dict", which the Turtle records too.
+        batch.append(json.dumps({"@type": "dict"}))
+        turtle_writer.write(serialize.turtle_from_elements(batch, jsonldContextAsDict))
+        jsonld_writer.close()
+        turtle_writer.close()
+
+    assert diagnosis_count > 0, "At least one GDC Head and Mouth diagnosis loaded."
+    spill.check_peak_rss("diagnoses.jsonld")